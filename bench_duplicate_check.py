@@ -0,0 +1,102 @@
+"""
+Benchmark: NearDuplicateIndex vs the original difflib linear scan
+Measures per-check latency and agreement on planted near-duplicates and fresh outputs
+
+Usage: python bench_duplicate_check.py [--sizes 50,500,5000,20000] [--queries 30] [--baseline-max 500]
+"""
+
+import argparse
+import difflib
+import random
+import statistics
+from time import perf_counter
+from typing import List, Tuple
+
+from kai_neardup import NearDuplicateIndex
+
+WORDS = (
+    "the a and to of in is you that it for your with on this be are as can we will not have or by from an "
+    "scroll energy healing code python function automation data model system flow growth money content "
+    "freedom blog post audience strategy launch build deploy error request response memory router kai "
+    "sovereign vision gentle powerful focus clarity abundance digital entrepreneur step next today simple"
+).split()
+
+def make_output(rng: random.Random, min_words: int = 120, max_words: int = 260) -> str:
+    sentences = []
+    remaining = rng.randint(min_words, max_words)
+    while remaining > 0:
+        length = min(remaining, rng.randint(8, 20))
+        words = [rng.choice(WORDS) for _ in range(length)]
+        sentences.append(" ".join(words).capitalize() + ".")
+        remaining -= length
+    return " ".join(sentences)
+
+def perturb(rng: random.Random, text: str, edit_rate: float) -> str:
+    chars = list(text)
+    for _ in range(max(1, int(len(chars) * edit_rate))):
+        chars[rng.randrange(len(chars))] = rng.choice("abcdefghijklmnopqrstuvwxyz ")
+    return "".join(chars)
+
+def difflib_check(outputs: List[str], new_output: str, threshold: float = 0.92) -> bool:
+    """The pre-index ThreadSafeMemory.check_duplicate loop, verbatim"""
+    for old_output in outputs:
+        if difflib.SequenceMatcher(None, new_output, old_output).ratio() > threshold:
+            return True
+    return False
+
+def build_queries(rng: random.Random, outputs: List[str], count: int) -> List[Tuple[str, str]]:
+    queries = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            queries.append(("near-dup (1%)", perturb(rng, rng.choice(outputs), 0.01)))
+        elif kind == 1:
+            queries.append(("edited (6%)", perturb(rng, rng.choice(outputs), 0.06)))
+        else:
+            queries.append(("fresh", make_output(rng)))
+    return queries
+
+def time_calls(fn, queries: List[Tuple[str, str]]) -> Tuple[List[bool], List[float]]:
+    results, timings = [], []
+    for _, text in queries:
+        started = perf_counter()
+        results.append(fn(text))
+        timings.append((perf_counter() - started) * 1000)
+    return results, timings
+
+def run(size: int, query_count: int, baseline_max: int, seed: int) -> None:
+    rng = random.Random(seed)
+    outputs = [make_output(rng) for _ in range(size)]
+    index = NearDuplicateIndex(max_items=size)
+    started = perf_counter()
+    for text in outputs:
+        index.add(text)
+    add_ms = (perf_counter() - started) * 1000 / size
+    queries = build_queries(rng, outputs, query_count)
+
+    index_results, index_times = time_calls(index.check, queries)
+    line = (f"window={size:>6}  add={add_ms:6.3f} ms  index check p50={statistics.median(index_times):8.3f} ms "
+            f"max={max(index_times):8.3f} ms  candidates/check={index.get_stats()['avg_candidates_per_check']}")
+    if size <= baseline_max:
+        base_results, base_times = time_calls(lambda text: difflib_check(outputs, text), queries)
+        agree = sum(a == b for a, b in zip(index_results, base_results)) / len(queries)
+        missed = sum(b and not a for a, b in zip(index_results, base_results))
+        line += (f"  | difflib p50={statistics.median(base_times):9.3f} ms  "
+                 f"speedup={statistics.median(base_times) / max(statistics.median(index_times), 1e-6):7.1f}x  "
+                 f"agreement={agree:.1%}  missed={missed}")
+    else:
+        line += "  | difflib skipped (too slow)"
+    print(line)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="50,500,5000,20000")
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--baseline-max", type=int, default=500, help="largest window to run the difflib scan on")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    for size in (int(s) for s in args.sizes.split(",")):
+        run(size, args.queries, args.baseline_max, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark: Flask (gunicorn gthread + kai_worker pool) vs ASGI (uvicorn + kai_omniseal_asgi) serving paths
+Starts each server against an offline mock provider and drives /api/message at fixed concurrency levels.
+Reports requests/sec, latency percentiles, thread count and resident memory per in-flight request.
+
+Usage: python bench_serving.py [--modes flask,asgi] [--concurrency 16,64,256] [--duration 10] [--latency 0.5]
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+from itertools import count
+from time import perf_counter, sleep
+from typing import Dict, Any, List
+
+import httpx
+import psutil
+
+def server_command(mode: str, port: int, concurrency: int) -> List[str]:
+    if mode == "flask":
+        # One thread per concurrent request, as production would need; each also parks a kai_worker thread.
+        # An empty config stops gunicorn picking up ./gunicorn.conf.py, which would auto-tune the baseline
+        return [sys.executable, "-m", "gunicorn", "kai_omniseal:app", "-c", os.devnull, "--bind", f"127.0.0.1:{port}",
+                "--worker-class", "gthread", "--workers", "1", "--threads", str(concurrency), "--timeout", "120",
+                "--log-level", "warning"]
+    return [sys.executable, "-m", "uvicorn", "kai_omniseal_asgi:app", "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning", "--no-access-log"]
+
+def server_env(latency: float, concurrency: int) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "KAI_PROVIDERS": "mock",
+        "KAI_MOCK_LATENCY": f"fixed:{latency}",
+        "KAI_MOCK_ERROR_RATE": "0",
+        "KAI_MOCK_MAX_CONCURRENT": str(concurrency * 2),
+        "KAI_HEDGING_ENABLED": "false",
+        # Mock replies share a small vocabulary, so every one is a near-duplicate candidate; that CPU cost is
+        # the router's, identical in both modes, and would hide the serving overhead being measured
+        "KAI_MEMORY_SIZE": "1",
+        "MAX_WORKERS": str(concurrency),
+        "ENVIRONMENT": "benchmark",  # production caps MAX_WORKERS from the CPU count
+        "LOG_LEVEL": "WARNING"
+    })
+    return env
+
+def tree_usage(process: psutil.Process) -> Dict[str, int]:
+    """RSS and thread count of the server and its worker processes"""
+    rss = threads = 0
+    for proc in [process] + process.children(recursive=True):
+        try:
+            rss += proc.memory_info().rss
+            threads += proc.num_threads()
+        except psutil.NoSuchProcess:
+            pass
+    return {"rss": rss, "threads": threads}
+
+def port_in_use(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+def wait_until_ready(base_url: str, timeout: float = 30.0) -> None:
+    started = perf_counter()
+    while perf_counter() - started < timeout:
+        try:
+            if httpx.get(f"{base_url}/", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready in {timeout}s")
+
+async def drive(base_url: str, concurrency: int, duration: float, process: psutil.Process) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    peak = tree_usage(process)
+    sequence = count()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        stop_at = perf_counter() + duration
+
+        async def user() -> None:
+            nonlocal errors
+            while perf_counter() < stop_at:
+                # Distinct prompts, so the response cache and single-flight never short-circuit the request
+                body = {"message": f"benchmark message {next(sequence)}", "tone": "neutral", "no_cache": True}
+                started = perf_counter()
+                try:
+                    response = await client.post("/api/message", json=body)
+                    if response.status_code == 200 and not response.json()["reply"].startswith("⚠️"):
+                        latencies.append(perf_counter() - started)
+                    else:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+
+        async def sample() -> None:
+            nonlocal peak
+            while perf_counter() < stop_at:
+                usage = tree_usage(process)
+                peak = {key: max(peak[key], usage[key]) for key in peak}
+                await asyncio.sleep(0.05)
+
+        started = perf_counter()
+        await asyncio.gather(sample(), *(user() for _ in range(concurrency)))
+        elapsed = perf_counter() - started
+    return {"latencies": latencies, "errors": errors, "elapsed": elapsed, "peak": peak}
+
+def run(mode: str, concurrency: int, duration: float, latency: float, port: int) -> None:
+    base_url = f"http://127.0.0.1:{port}"
+    if port_in_use(port):
+        raise RuntimeError(f"Port {port} is already in use; pick another with --port")
+    server = subprocess.Popen(server_command(mode, port, concurrency), env=server_env(latency, concurrency),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(base_url)
+        process = psutil.Process(server.pid)
+        # Warm up imports, pools and a few threads, then take the idle baseline
+        asyncio.run(drive(base_url, 2, 1.0, process))
+        idle = tree_usage(process)
+        result = asyncio.run(drive(base_url, concurrency, duration, process))
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    latencies = sorted(result["latencies"])
+    if not latencies:
+        print(f"{mode:>5}  c={concurrency:<4}  no successful requests ({result['errors']} errors)")
+        return
+    rss_growth = max(result["peak"]["rss"] - idle["rss"], 0)
+    print(f"{mode:>5}  c={concurrency:<4}  {len(latencies) / result['elapsed']:8.1f} req/s  "
+          f"p50={statistics.median(latencies) * 1000:7.1f} ms  "
+          f"p99={latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:7.1f} ms  "
+          f"errors={result['errors']:<4}  threads={result['peak']['threads']:<4}  "
+          f"rss idle={idle['rss'] / 2**20:6.1f} MiB  peak={result['peak']['rss'] / 2**20:6.1f} MiB  "
+          f"per in-flight={rss_growth / concurrency / 1024:7.1f} KiB")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="flask,asgi")
+    parser.add_argument("--concurrency", default="16,64,256")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per run")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock provider latency in seconds")
+    parser.add_argument("--port", type=int, default=8790)
+    args = parser.parse_args()
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        for mode in args.modes.split(","):
+            run(mode.strip(), concurrency, args.duration, args.latency, args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Kai Omniseal gunicorn configuration
+Picked up automatically by `gunicorn` from the working directory (Procfile, Dockerfile and start.sh run it).
+Sizes workers and threads from the container's CPU and memory, the way kai_omniseal sizes MAX_WORKERS,
+and serves kai_omniseal on gthread workers, or kai_omniseal_asgi on uvicorn workers with KAI_WORKER_CLASS=uvicorn.
+"""
+
+import os
+import sys
+import math
+import importlib.util
+
+import psutil
+
+# ================== Configuration ==================
+PORT = int(os.environ.get("PORT", 8080))
+RESPONSE_TIMEOUT = int(os.environ.get("RESPONSE_TIMEOUT", 30))
+STREAM_TIMEOUT = int(os.environ.get("STREAM_TIMEOUT", 120))
+BATCH_TIMEOUT = int(os.environ.get("BATCH_TIMEOUT", 600))
+# Idle seconds between requests on one connection; keep it above the upstream proxy's idle timeout (60s on
+# most load balancers) so the proxy always closes first and never reuses a connection the server just closed
+KEEPALIVE = int(os.environ.get("KAI_KEEPALIVE", 75))
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+WORKER_CLASS = os.environ.get("KAI_WORKER_CLASS", "gthread").lower()  # gthread | uvicorn
+WORKER_MEMORY_MB = int(os.environ.get("KAI_WORKER_MEMORY_MB", 256))  # memory set aside per worker process
+
+# ================== Resource Detection ==================
+def _read_cgroup(*paths: str) -> list:
+    for path in paths:
+        try:
+            with open(path) as f:
+                return f.read().split()
+        except OSError:
+            continue
+    return []
+
+def cpu_limit() -> int:
+    """CPUs this container may use: the cgroup quota if one is set, else the CPUs it is allowed to run on"""
+    quota = _read_cgroup("/sys/fs/cgroup/cpu.max")  # cgroup v2: "<quota> <period>" or "max <period>"
+    if not quota:
+        quota = _read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") + _read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    try:
+        if len(quota) == 2 and quota[0] not in ("max", "-1"):
+            return max(1, math.ceil(int(quota[0]) / int(quota[1])))
+    except ValueError:
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return psutil.cpu_count() or 1
+
+def memory_limit_gb() -> float:
+    """Container memory limit if there is one, else physical memory"""
+    total = psutil.virtual_memory().total
+    limit = _read_cgroup("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    if limit and limit[0].isdigit():
+        total = min(total, int(limit[0]))
+    return total / (1024**3)
+
+CPU_COUNT = cpu_limit()
+MEMORY_GB = memory_limit_gb()
+# kai_omniseal's MAX_WORKERS rule: two threads per CPU and per GB, never fewer than five
+THREAD_BUDGET = max(min(CPU_COUNT * 2, int(MEMORY_GB * 2)), 5)
+
+def choose_worker_class() -> str:
+    # The ASGI app is opt-in: a gthread request holds a gunicorn thread and a kai_worker thread, so
+    # THREAD_BUDGET caps concurrency, and hosts that need more than that set KAI_WORKER_CLASS=uvicorn
+    if WORKER_CLASS == "uvicorn":
+        if importlib.util.find_spec("uvicorn_worker") is None:
+            raise RuntimeError("KAI_WORKER_CLASS=uvicorn needs the uvicorn-worker package")
+        return "uvicorn"
+    if WORKER_CLASS != "gthread":
+        print(f"Unknown KAI_WORKER_CLASS={WORKER_CLASS!r}, using gthread", file=sys.stderr)
+    return "gthread"
+
+# ================== Server Settings ==================
+bind = f"0.0.0.0:{PORT}"
+
+if choose_worker_class() == "uvicorn":
+    worker_class = "uvicorn_worker.UvicornWorker"
+    wsgi_app = "kai_omniseal_asgi:app"
+else:
+    worker_class = "gthread"
+    wsgi_app = "kai_omniseal:app"
+    threads = THREAD_BUDGET
+    # The kai_worker pool is read at import (in the master, with preload); match it to the request threads
+    os.environ.setdefault("MAX_WORKERS", str(threads))
+
+# Every worker keeps its own response cache, breakers and conversation memory, so more processes than
+# cores would only split that state; WEB_CONCURRENCY overrides, as on Heroku-style platforms
+workers = int(os.environ.get("WEB_CONCURRENCY", 0)) or max(1, min(CPU_COUNT, int(MEMORY_GB * 1024 // WORKER_MEMORY_MB)))
+
+# Import the app once in the master and fork, so workers share its pages copy-on-write. Nothing the app
+# builds at import starts a thread or opens a socket: the router loop, the kai_worker threads and the
+# provider connections are all created lazily in each worker.
+preload_app = True
+
+# A worker is only killed after twice RESPONSE_TIMEOUT without a heartbeat. A shutdown or reload waits for
+# the longest message or stream to finish; a batch (up to BATCH_TIMEOUT) still running past that is cut off
+timeout = RESPONSE_TIMEOUT * 2
+graceful_timeout = max(RESPONSE_TIMEOUT, STREAM_TIMEOUT) + 5
+keepalive = KEEPALIVE
+
+# Heartbeat files on tmpfs; a disk-backed /tmp can stall workers long enough to look dead
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+loglevel = LOG_LEVEL.lower()
+errorlog = "-"
+
+# ================== Server Hooks ==================
+def when_ready(server):
+    server.log.info(f"Kai Omniseal: {workers} x {worker_class} serving {wsgi_app} "
+                    f"(cpus={CPU_COUNT}, memory={MEMORY_GB:.1f} GB"
+                    f"{f', threads={threads}' if worker_class == 'gthread' else ''})")
+    if BATCH_TIMEOUT > graceful_timeout:
+        server.log.warning(f"Batches may run {BATCH_TIMEOUT}s but shutdown only waits {graceful_timeout}s; "
+                           f"longer batches are cut off on deploy or reload")
+
+def post_fork(server, worker):
+    # Provider connections opened in the master (e.g. during preload) must not be shared across workers
+    router = sys.modules.get("kai_brain_router")
+    if router is not None:
+        router.close_provider_pools()
@@ -6,14 +6,34 @@ Fixed: tuple annotation syntax, error handling improvements
 
 import os
 import sys
-import requests
+import json
+import asyncio
+import concurrent.futures
+import hashlib
+import httpx
 import logging
+import math
+import random
 import traceback
-import difflib
 import threading
+import weakref
+from collections import deque
 from datetime import datetime
-from time import time
-from typing import Dict, List, Any, Tuple
+from time import time, monotonic
+from typing import Dict, List, Any, Tuple, Callable, Optional, AsyncIterator, Iterator
+
+from kai_cache import ResponseCache, SingleFlight
+from kai_cassette import Cassette, cassette_from_env
+from kai_conversations import SUMMARY_TOKEN_BUDGET, ConversationStore, Turn
+from kai_metrics import ProviderMetrics
+from kai_mock_provider import MockProvider
+from kai_neardup import NearDuplicateIndex
+from kai_persona import PERSONA_ENABLED, PersonaPromptBuilder, SystemPrompt
+from kai_resilience import (
+    BULKHEAD_MAX_CONCURRENT, RATE_LIMIT_BURST, RATE_LIMIT_RPS, Bulkhead, CancelToken, CircuitBreaker, Deadline,
+    DeadlineExceeded, RateLimiter, RetryPolicy, error_status_code, is_provider_fault
+)
+from kai_tokens import PROFILES, TokenBudgeter, TokenProfile, estimate_tokens
 
 # ===========================
 # PRODUCTION LOGGING SETUP
@@ -28,19 +48,67 @@ logger = logging.getLogger(__name__)
 # ===========================
 # CONFIGURATION & ENV SETUP
 # ===========================
-REQUEST_TIMEOUT = int(os.getenv("KAI_REQUEST_TIMEOUT", "30"))
+# Per attempt; kept well below the server's RESPONSE_TIMEOUT (30s) so a hung attempt leaves time to retry or fall back
+REQUEST_TIMEOUT = int(os.getenv("KAI_REQUEST_TIMEOUT", "15"))
 MAX_RETRIES = int(os.getenv("KAI_MAX_RETRIES", "3"))
-MEMORY_SIZE = 50
-MAX_PROMPT_LENGTH = 8000  # Prevent token limit issues
+MEMORY_SIZE = int(os.getenv("KAI_MEMORY_SIZE", "50"))  # near-duplicate window; LSH-indexed, safe to raise to 10k+
+MAX_PROMPT_LENGTH = int(os.getenv("KAI_MAX_PROMPT_LENGTH", "200000"))  # hard character cap, ahead of token estimation
+MAX_PROMPT_TOKENS = int(os.getenv("KAI_MAX_PROMPT_TOKENS", "32000"))  # per-provider overflow is trimmed, not rejected
 MAX_LOG_SIZE = 100
 
+# Connection pool sizing (per provider, overridable with KAI_<PROVIDER>_POOL_MAX_CONNECTIONS etc.)
+POOL_MAX_CONNECTIONS = int(os.getenv("KAI_POOL_MAX_CONNECTIONS", "20"))
+# Keep-alive below max connections makes the pool close and reopen sockets under saturation
+POOL_MAX_KEEPALIVE = int(os.getenv("KAI_POOL_MAX_KEEPALIVE", str(POOL_MAX_CONNECTIONS)))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("KAI_POOL_KEEPALIVE_EXPIRY", "60"))
+
+# Hedged requests (opt-in): fire the next provider when the current one is slower than its p95
+HEDGING_ENABLED = os.getenv("KAI_HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("KAI_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("KAI_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("KAI_HEDGE_DEFAULT_DELAY", "8.0"))  # used until enough samples exist
+HEDGE_MIN_DELAY = float(os.getenv("KAI_HEDGE_MIN_DELAY", "0.5"))
+LATENCY_SAMPLE_SIZE = 200
+
+# Adaptive provider ordering: per tone bucket, rank providers by live EWMA latency and success rate
+ADAPTIVE_ORDERING = os.getenv("KAI_ADAPTIVE_ORDERING", "true").lower() == "true"
+ORDER_EXPLORATION_RATE = float(os.getenv("KAI_ORDER_EXPLORATION_RATE", "0.05"))
+ORDER_EWMA_ALPHA = float(os.getenv("KAI_ORDER_EWMA_ALPHA", "0.2"))
+ORDER_MIN_SAMPLES = int(os.getenv("KAI_ORDER_MIN_SAMPLES", "5"))
+ORDER_TIE_TOLERANCE = float(os.getenv("KAI_ORDER_TIE_TOLERANCE", "0.1"))  # scores within 10% keep static order
+
+# Every provider but the last leaves this share of the remaining request budget (at most the cap, in seconds)
+# to the providers after it, so one slow provider cannot spend the whole deadline
+FALLBACK_RESERVE = float(os.getenv("KAI_FALLBACK_RESERVE", "0.33"))
+FALLBACK_RESERVE_MAX = float(os.getenv("KAI_FALLBACK_RESERVE_MAX", "10"))
+
+# Batch requests: how many items of one batch may be in the router at once
+BATCH_MAX_CONCURRENCY = int(os.getenv("KAI_BATCH_MAX_CONCURRENCY", "8"))
+ERROR_REPLY_PREFIX = "⚠️"  # every user-facing failure reply the router returns starts with this
+
+# Per-user conversation memory (see kai_conversations): older turns are summarized in the background
+CONVERSATION_COMPACT_TIMEOUT = float(os.getenv("KAI_CONVERSATION_COMPACT_TIMEOUT", "60"))
+
+# Provider-side prompt caching of the persona prefix; providers ignore cache markers on shorter prefixes
+PROMPT_CACHING = os.getenv("KAI_PROMPT_CACHING", "true").lower() == "true"
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("KAI_PROMPT_CACHE_MIN_TOKENS", "1024"))
+
 # API Keys validation
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 
-if not OPENAI_API_KEY or not OPENROUTER_API_KEY or not ANTHROPIC_API_KEY:
-    raise RuntimeError("❌ Missing critical API keys: OPENAI_API_KEY, OPENROUTER_API_KEY, ANTHROPIC_API_KEY")
+# Record/replay of provider traffic (KAI_CASSETTE_MODE=record|replay, see kai_cassette). Replays need no real
+# keys, so placeholders keep the providers enabled and their SDK clients constructible
+provider_cassette: Optional[Cassette] = cassette_from_env()
+if provider_cassette is not None and provider_cassette.mode == "replay":
+    OPENAI_API_KEY = OPENAI_API_KEY or "cassette-replay"
+    OPENROUTER_API_KEY = OPENROUTER_API_KEY or "cassette-replay"
+    ANTHROPIC_API_KEY = ANTHROPIC_API_KEY or "cassette-replay"
+
+# Providers to register, in order; a provider whose API key is missing is registered but disabled.
+# "mock" or "mock_<name>" adds an offline mock provider (see kai_mock_provider), e.g. KAI_PROVIDERS=mock_fast,mock_slow
+ENABLED_PROVIDERS = [name.strip().lower() for name in os.getenv("KAI_PROVIDERS", "openrouter,anthropic,openai").split(",") if name.strip()]
 
 # ===========================
 # THREAD-SAFE IN-MEMORY STORAGE
@@ -48,25 +116,18 @@ if not OPENAI_API_KEY or not OPENROUTER_API_KEY or not ANTHROPIC_API_KEY:
 class ThreadSafeMemory:
     """Thread-safe memory management for outputs and logs"""
     def __init__(self, max_outputs: int = MEMORY_SIZE, max_logs: int = MAX_LOG_SIZE):
-        self._outputs: List[str] = []
+        self._outputs = NearDuplicateIndex(max_outputs)
         self._logs: List[Dict[str, Any]] = []
         self._lock = threading.RLock()
         self.max_outputs = max_outputs
         self.max_logs = max_logs
 
+    # The output index has its own lock, so duplicate checks never hold up log writers
     def add_output(self, output: str) -> None:
-        with self._lock:
-            self._outputs.append(output)
-            if len(self._outputs) > self.max_outputs:
-                self._outputs.pop(0)
+        self._outputs.add(output)
 
     def check_duplicate(self, new_output: str, threshold: float = 0.92) -> bool:
-        with self._lock:
-            for old_output in self._outputs:
-                similarity = difflib.SequenceMatcher(None, new_output, old_output).ratio()
-                if similarity > threshold:
-                    return True
-            return False
+        return self._outputs.check(new_output, threshold)
 
     def add_log(self, log_entry: Dict[str, Any]) -> None:
         with self._lock:
@@ -79,6 +140,7 @@ class ThreadSafeMemory:
             return {
                 "outputs_count": len(self._outputs),
                 "outputs_limit": self.max_outputs,
+                "duplicate_index": self._outputs.get_stats(),
                 "logs_count": len(self._logs),
                 "logs_limit": self.max_logs
             }
@@ -89,11 +151,263 @@ class ThreadSafeMemory:
             self._logs.clear()
 
 memory = ThreadSafeMemory()
+response_cache = ResponseCache()
+single_flight = SingleFlight()
+provider_metrics = ProviderMetrics()
+
+# Prompts are fitted to each provider's context window right before the call; keyed by provider label
+token_budgeter = TokenBudgeter({})
+
+# Persona system prompt per tone, rendered once and passed to every provider call
+persona = PersonaPromptBuilder()
+
+# ===========================
+# PROVIDER CLIENT POOLS
+# ===========================
+class ProviderClientPool:
+    """Process-wide keep-alive connection pool and client for one provider, shared by all threads"""
+    def __init__(self, name: str, client_factory: Callable[[httpx.Client], Any] = None,
+                 async_client_factory: Callable[[httpx.AsyncClient], Any] = None):
+        self.name = name
+        prefix = f"KAI_{name.upper()}_POOL_"
+        self.max_connections = int(os.getenv(prefix + "MAX_CONNECTIONS", str(POOL_MAX_CONNECTIONS)))
+        self.max_keepalive = int(os.getenv(prefix + "MAX_KEEPALIVE", str(POOL_MAX_KEEPALIVE)))
+        self.keepalive_expiry = float(os.getenv(prefix + "KEEPALIVE_EXPIRY", str(POOL_KEEPALIVE_EXPIRY)))
+        self._client_factory = client_factory
+        self._async_client_factory = async_client_factory
+        self._http_client: Optional[httpx.Client] = None
+        self._client: Any = None
+        # httpx async pools are bound to the event loop that opened them, so keep one per loop
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, Any]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._seen_streams = weakref.WeakSet()
+        # Called with every response, e.g. so a rate limiter can read the provider's rate-limit headers
+        self.response_observers: List[Callable[[httpx.Response], None]] = []
+        self.requests_sent = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    def _on_response(self, response: httpx.Response) -> None:
+        # httpcore hands back the same network stream object for every request on a connection
+        stream = response.extensions.get("network_stream")
+        with self._lock:
+            self.requests_sent += 1
+            if stream is not None and stream in self._seen_streams:
+                self.connections_reused += 1
+            elif stream is not None:
+                self._seen_streams.add(stream)
+                self.connections_created += 1
+        for observer in self.response_observers:
+            try:
+                observer(response)
+            except Exception as e:
+                logger.error(f"{self.name} response observer failed: {e}")
+
+    async def _on_async_response(self, response: httpx.Response) -> None:
+        self._on_response(response)
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def _transport(self, asynchronous: bool) -> Any:
+        """None (httpx's default pooled transport) unless a cassette records or replays this traffic"""
+        if provider_cassette is None:
+            return None
+        if provider_cassette.mode == "replay":
+            return provider_cassette.transport()
+        inner = httpx.AsyncHTTPTransport(limits=self._limits()) if asynchronous else httpx.HTTPTransport(limits=self._limits())
+        return provider_cassette.transport(inner)
+
+    @property
+    def http_client(self) -> httpx.Client:
+        if self._http_client is None:
+            with self._lock:
+                if self._http_client is None:
+                    self._http_client = httpx.Client(
+                        limits=self._limits(),
+                        transport=self._transport(asynchronous=False),
+                        timeout=REQUEST_TIMEOUT,
+                        event_hooks={"response": [self._on_response]}
+                    )
+        return self._http_client
+
+    @property
+    def client(self) -> Any:
+        """Provider SDK client bound to the pooled transport (the raw httpx client if no factory)"""
+        if self._client is None:
+            http_client = self.http_client
+            with self._lock:
+                if self._client is None:
+                    self._client = self._client_factory(http_client) if self._client_factory else http_client
+        return self._client
+
+    @property
+    def async_client(self) -> Any:
+        """Async provider SDK client for the running event loop (the raw httpx.AsyncClient if no factory)"""
+        loop = asyncio.get_running_loop()
+        entry = self._async_clients.get(loop)
+        if entry is None:
+            with self._lock:
+                entry = self._async_clients.get(loop)
+                if entry is None:
+                    http_client = httpx.AsyncClient(
+                        limits=self._limits(),
+                        transport=self._transport(asynchronous=True),
+                        timeout=REQUEST_TIMEOUT,
+                        event_hooks={"response": [self._on_async_response]}
+                    )
+                    client = self._async_client_factory(http_client) if self._async_client_factory else http_client
+                    entry = (http_client, client)
+                    self._async_clients[loop] = entry
+        return entry[1]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "initialized": self._http_client is not None or len(self._async_clients) > 0,
+                "event_loops": len(self._async_clients),
+                # Streams seen by the response hook that are still alive: a connection the pool has closed and
+                # dropped takes its stream (and its weak entry) with it, so no httpx internals are read
+                "connections_open": len(self._seen_streams),
+                "connections_created": self.connections_created,
+                "connections_reused": self.connections_reused,
+                "requests_sent": self.requests_sent,
+                "max_connections": self.max_connections,
+                "max_keepalive": self.max_keepalive
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = None
+            self._client = None
+            # Async transports are closed by their own loop; dropping them lets it reconnect cleanly
+            self._async_clients.clear()
+
+    async def aclose(self) -> None:
+        """Close the running loop's async client; for servers that own the loop (kai_omniseal_asgi) at shutdown"""
+        with self._lock:
+            entry = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].aclose()
+
+def _make_anthropic_client(http_client: httpx.Client) -> Any:
+    import anthropic
+    return anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, http_client=http_client, timeout=REQUEST_TIMEOUT, max_retries=0)
+
+def _make_openai_client(http_client: httpx.Client) -> Any:
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY, http_client=http_client, timeout=REQUEST_TIMEOUT, max_retries=0)
+
+def _make_async_anthropic_client(http_client: httpx.AsyncClient) -> Any:
+    import anthropic
+    return anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, http_client=http_client, timeout=REQUEST_TIMEOUT, max_retries=0)
+
+def _make_async_openai_client(http_client: httpx.AsyncClient) -> Any:
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client, timeout=REQUEST_TIMEOUT, max_retries=0)
+
+provider_pools: Dict[str, ProviderClientPool] = {
+    "openrouter": ProviderClientPool("openrouter"),
+    "anthropic": ProviderClientPool("anthropic", _make_anthropic_client, _make_async_anthropic_client),
+    "openai": ProviderClientPool("openai", _make_openai_client, _make_async_openai_client)
+}
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: pool.get_stats() for name, pool in provider_pools.items()}
+
+def close_provider_pools() -> None:
+    for pool in provider_pools.values():
+        try:
+            pool.close()
+        except Exception as e:
+            logger.error(f"Failed to close {pool.name} pool: {e}")
+
+async def aclose_provider_pools() -> None:
+    for pool in provider_pools.values():
+        try:
+            await pool.aclose()
+        except Exception as e:
+            logger.error(f"Failed to close {pool.name} async pool: {e}")
+
+# ===========================
+# CIRCUIT BREAKERS
+# ===========================
+# Keyed by the model label each provider call reports to log_event; filled in by the provider registry
+circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+# Provider function name (sync and async) -> label
+PROVIDER_LABELS: Dict[str, str] = {}
+
+# SDK-level retries are disabled on the pooled clients; this policy is the only retry loop
+retry_policy = RetryPolicy(MAX_RETRIES, attempt_timeout=REQUEST_TIMEOUT)
+
+def get_breaker(model_func: Callable[..., Any]) -> Optional[CircuitBreaker]:
+    return circuit_breakers.get(PROVIDER_LABELS.get(model_func.__name__, model_func.__name__))
+
+def get_breaker_status() -> Dict[str, Dict[str, Any]]:
+    return {label: breaker.get_status() for label, breaker in circuit_breakers.items()}
+
+# ===========================
+# PROVIDER BULKHEADS
+# ===========================
+# One slow provider may only hold this many calls at once, so it cannot tie up every worker;
+# override per provider with KAI_<NAME>_MAX_CONCURRENT, e.g. KAI_ANTHROPIC_MAX_CONCURRENT (filled in by the registry)
+bulkheads: Dict[str, Bulkhead] = {}
+
+def get_bulkhead(model_func: Callable[..., Any]) -> Optional[Bulkhead]:
+    return bulkheads.get(PROVIDER_LABELS.get(model_func.__name__, model_func.__name__))
+
+def get_bulkhead_status() -> Dict[str, Dict[str, Any]]:
+    return {label: bulkhead.get_status() for label, bulkhead in bulkheads.items()}
+
+# ===========================
+# PROVIDER RATE LIMITS
+# ===========================
+# One token bucket per provider API key, shared by every label using that key and fed by the provider's
+# rate-limit headers; pace with KAI_RATE_LIMIT_RPS / KAI_<NAME>_RATE_LIMIT_RPS (0 = headers only)
+rate_limiters: Dict[str, RateLimiter] = {}
+_key_rate_limiters: Dict[str, RateLimiter] = {}
+
+def get_rate_limiter(model_func: Callable[..., Any]) -> Optional[RateLimiter]:
+    return rate_limiters.get(PROVIDER_LABELS.get(model_func.__name__, model_func.__name__))
+
+def get_rate_limit_status() -> Dict[str, Dict[str, Any]]:
+    return {label: limiter.get_status() for label, limiter in rate_limiters.items()}
+
+def _admit(model_func: Callable[..., Any]) -> Tuple[Optional[Bulkhead], Optional[str]]:
+    """Reserve a bulkhead slot and pass the breaker; returns (slot to release, None) or (None, skip reason)"""
+    limiter = get_rate_limiter(model_func)
+    blocked = limiter.route_around() if limiter is not None else None
+    if blocked is not None:
+        # Throttled well past what a caller would wait for, so go straight to the next provider
+        return None, f"rate limited for {blocked:.1f}s"
+    bulkhead = get_bulkhead(model_func)
+    if bulkhead is not None and not bulkhead.try_acquire():
+        # Checked before the breaker so a rejected call never consumes the half-open probe
+        return None, "saturated"
+    admitted = False
+    try:
+        breaker = get_breaker(model_func)
+        if breaker is not None and not breaker.allow_request():
+            return None, "circuit open"
+        admitted = True
+        return bulkhead, None
+    finally:
+        if not admitted and bulkhead is not None:
+            bulkhead.release()
 
 # ===========================
 # LOGGING UTILITIES
 # ===========================
-def log_event(event_type: str, model: str, prompt: str, output_or_error: str, usage: Dict[str, Any] = None) -> None:
+def log_event(event_type: str, model: str, prompt: str, output_or_error: str, usage: Dict[str, Any] = None,
+              fault: bool = True) -> None:
+    """fault=False records an ERROR that says nothing about the provider's health, so its breaker ignores it"""
     try:
         log_entry = {
             "timestamp": datetime.now().isoformat(),
@@ -104,6 +418,16 @@ def log_event(event_type: str, model: str, prompt: str, output_or_error: str, us
             "usage": usage or {}
         }
         memory.add_log(log_entry)
+        if usage:
+            provider_metrics.record_usage(model, usage)
+        breaker = circuit_breakers.get(model)
+        if breaker is not None:
+            if event_type == "ERROR" and fault:
+                breaker.record_failure(str(output_or_error))
+            elif event_type == "ERROR":
+                breaker.release_probe()
+            else:
+                breaker.record_success()
         if event_type == "ERROR":
             logger.error(f"{model} failed: {output_or_error}")
         else:
@@ -119,168 +443,1182 @@ def validate_prompt(prompt: str) -> Tuple[bool, str]:
         return False, "Empty prompt provided"
     if len(prompt) > MAX_PROMPT_LENGTH:
         return False, f"Prompt too long (max {MAX_PROMPT_LENGTH} characters)"
+    tokens = estimate_tokens(prompt)
+    if tokens > MAX_PROMPT_TOKENS:
+        return False, f"Prompt too long (~{tokens} tokens, max {MAX_PROMPT_TOKENS})"
     return True, ""
 
 # ===========================
 # MODEL CALLS WITH BETTER ERROR HANDLING
 # ===========================
-def call_claude_openrouter(prompt: str, system: str = None, retry_count: int = 0) -> str:
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+def _cacheable(system: Optional[str]) -> bool:
+    return (PROMPT_CACHING and isinstance(system, SystemPrompt)
+            and estimate_tokens(system.cacheable_prefix) >= PROMPT_CACHE_MIN_TOKENS)
+
+def _chat_messages(prompt: str, system: str = None, cache_system: bool = False) -> List[Dict[str, Any]]:
+    """OpenAI-style messages; cache_system marks the persona prefix for providers that take cache_control"""
+    messages = []
+    if system:
+        content = system.blocks() if cache_system and _cacheable(system) else str(system)
+        messages.append({"role": "system", "content": content})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+def _anthropic_system(system: Optional[str]) -> Any:
+    # Anthropic bills a cached prefix at a fraction of the input rate and skips reprocessing it
+    return system.blocks() if _cacheable(system) else str(system or "")
+
+def _openrouter_request(prompt: str, system: str, max_tokens: int) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://kai-omniseal.railway.app",
+        "X-Title": "Kai Omniseal"
+    }
+    payload = {
+        "model": "anthropic/claude-3-sonnet",
+        "messages": _chat_messages(prompt, system, cache_system=True),
+        "max_tokens": max_tokens,
+        "temperature": 0.7
+    }
+    return headers, payload
+
+def _parse_openrouter_response(data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    if "choices" not in data or not data["choices"]:
+        raise Exception("No choices in OpenRouter response")
+    return data["choices"][0]["message"]["content"].strip(), data.get("usage", {})
+
+def _anthropic_usage(message: Any) -> Dict[str, Any]:
+    return {
+        "prompt_tokens": message.usage.input_tokens,
+        "completion_tokens": message.usage.output_tokens,
+        "total_tokens": message.usage.input_tokens + message.usage.output_tokens,
+        # Older SDK versions do not model the prompt-caching fields
+        "cached_prompt_tokens": getattr(message.usage, "cache_read_input_tokens", None) or 0
+    }
+
+def _openai_usage(response: Any) -> Dict[str, Any]:
+    details = getattr(response.usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": response.usage.prompt_tokens,
+        "completion_tokens": response.usage.completion_tokens,
+        "total_tokens": response.usage.total_tokens,
+        "cached_prompt_tokens": getattr(details, "cached_tokens", None) or 0
+    }
+
+def _describe_openrouter_error(e: Exception) -> str:
+    if isinstance(e, httpx.TimeoutException):
+        return f"OpenRouter timeout after {REQUEST_TIMEOUT}s"
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"OpenRouter HTTP error: {e.response.status_code if e.response is not None else 'unknown'}"
+    return f"OpenRouter unexpected error: {str(e)}"
+
+def _describe_claude_error(e: Exception) -> str:
+    return f"Claude Direct error: {str(e)}"
+
+def _describe_openai_error(e: Exception) -> str:
+    return f"GPT-4 error: {str(e)}"
+
+def _retry_hooks(label: str, prompt: str, describe: Callable[[Exception], str],
+                 deadline: Optional[Deadline]) -> Dict[str, Any]:
+    limiter = rate_limiters.get(label)
+
+    def on_error(e: Exception) -> None:
+        # Client errors (4xx) and calls cut short by the caller's deadline must not open a healthy provider's breaker
+        log_event("ERROR", label, prompt, describe(e), fault=is_provider_fault(e, deadline))
+        # HTTP 429s were already seen by the pool's response hook; this covers ones raised without a response
+        if limiter is not None and error_status_code(e) == 429 and getattr(e, "response", None) is None:
+            limiter.observe(429)
+
+    def on_retry(attempt: int, delay: float) -> None:
+        provider_metrics.record_retry(label)
+        logger.warning(f"Retrying {label} (attempt {attempt}) in {delay:.2f}s")
+
+    return {"breaker": circuit_breakers.get(label), "on_error": on_error, "on_retry": on_retry, "rate_limiter": limiter}
+
+def _call_with_retries(label: str, prompt: str, describe: Callable[[Exception], str], attempt: Callable[[float], str],
+                       retry_count: int, deadline: Optional[Deadline]) -> str:
     try:
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://kai-omniseal.railway.app",
-            "X-Title": "Kai Omniseal"
-        }
-        messages = []
-        if system:
-            messages.append({"role": "system", "content": system})
-        messages.append({"role": "user", "content": prompt})
-        payload = {
-            "model": "anthropic/claude-3-sonnet",
-            "messages": messages,
-            "max_tokens": 2048,
-            "temperature": 0.7
-        }
-        response = requests.post(url, headers=headers, json=payload, timeout=REQUEST_TIMEOUT)
+        return retry_policy.run(attempt, deadline=deadline, retries_used=retry_count,
+                               **_retry_hooks(label, prompt, describe, deadline))
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise Exception(describe(e)) from e
+
+async def _call_with_retries_async(label: str, prompt: str, describe: Callable[[Exception], str],
+                                   attempt: Callable[[float], Any], retry_count: int, deadline: Optional[Deadline]) -> str:
+    try:
+        return await retry_policy.run_async(attempt, deadline=deadline, retries_used=retry_count,
+                                            **_retry_hooks(label, prompt, describe, deadline))
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise Exception(describe(e)) from e
+
+def call_claude_openrouter(prompt: str, system: str = None, retry_count: int = 0, deadline: Optional[Deadline] = None) -> str:
+    fitted, max_tokens = token_budgeter.fit("Claude-OpenRouter", prompt, system)
+    def attempt(timeout: float) -> str:
+        headers, payload = _openrouter_request(fitted, system, max_tokens)
+        response = provider_pools["openrouter"].client.post(OPENROUTER_URL, headers=headers, json=payload, timeout=timeout)
         response.raise_for_status()
-        data = response.json()
-        if "choices" not in data or not data["choices"]:
-            raise Exception("No choices in OpenRouter response")
-        output = data["choices"][0]["message"]["content"].strip()
-        usage = data.get("usage", {})
+        output, usage = _parse_openrouter_response(response.json())
         log_event("SUCCESS", "Claude-OpenRouter", prompt, output, usage)
         return output
-    except requests.exceptions.Timeout as e:
-        error_msg = f"OpenRouter timeout after {REQUEST_TIMEOUT}s"
-        log_event("ERROR", "Claude-OpenRouter", prompt, error_msg)
-        if retry_count < MAX_RETRIES:
-            logger.warning(f"Retrying Claude-OpenRouter (attempt {retry_count + 1})")
-            return call_claude_openrouter(prompt, system, retry_count + 1)
-        raise Exception(error_msg)
-    except requests.exceptions.HTTPError as e:
-        error_msg = f"OpenRouter HTTP error: {e.response.status_code if e.response else 'unknown'}"
-        log_event("ERROR", "Claude-OpenRouter", prompt, error_msg)
-        if retry_count < MAX_RETRIES and (not e.response or e.response.status_code >= 500):
-            logger.warning(f"Retrying Claude-OpenRouter (attempt {retry_count + 1})")
-            return call_claude_openrouter(prompt, system, retry_count + 1)
-        raise Exception(error_msg)
-    except Exception as e:
-        error_msg = f"OpenRouter unexpected error: {str(e)}"
-        log_event("ERROR", "Claude-OpenRouter", prompt, error_msg)
-        if retry_count < MAX_RETRIES:
-            logger.warning(f"Retrying Claude-OpenRouter (attempt {retry_count + 1})")
-            return call_claude_openrouter(prompt, system, retry_count + 1)
-        raise Exception(error_msg)
-
-def call_claude_direct(prompt: str, system: str = None, retry_count: int = 0) -> str:
-    try:
-        import anthropic
-        client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-        message = client.messages.create(
+    return _call_with_retries("Claude-OpenRouter", prompt, _describe_openrouter_error, attempt, retry_count, deadline)
+
+def call_claude_direct(prompt: str, system: str = None, retry_count: int = 0, deadline: Optional[Deadline] = None) -> str:
+    fitted, max_tokens = token_budgeter.fit("Claude-Direct", prompt, system)
+    def attempt(timeout: float) -> str:
+        message = provider_pools["anthropic"].client.messages.create(
             model="claude-3-sonnet-20240229",
-            max_tokens=2048,
+            max_tokens=max_tokens,
             temperature=0.7,
-            system=system or "",
-            messages=[{"role": "user", "content": prompt}]
+            system=_anthropic_system(system),
+            messages=[{"role": "user", "content": fitted}],
+            timeout=timeout
         )
         output = message.content[0].text.strip()
-        log_event("SUCCESS", "Claude-Direct", prompt, output)
+        log_event("SUCCESS", "Claude-Direct", prompt, output, _anthropic_usage(message))
         return output
-    except Exception as e:
-        error_msg = f"Claude Direct error: {str(e)}"
-        log_event("ERROR", "Claude-Direct", prompt, error_msg)
-        if retry_count < MAX_RETRIES:
-            logger.warning(f"Retrying Claude-Direct (attempt {retry_count + 1})")
-            return call_claude_direct(prompt, system, retry_count + 1)
-        raise Exception(error_msg)
-
-def call_openai_gpt(prompt: str, system: str = None, retry_count: int = 0) -> str:
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        messages = []
-        if system:
-            messages.append({"role": "system", "content": system})
-        messages.append({"role": "user", "content": prompt})
-        response = client.chat.completions.create(
+    return _call_with_retries("Claude-Direct", prompt, _describe_claude_error, attempt, retry_count, deadline)
+
+def call_openai_gpt(prompt: str, system: str = None, retry_count: int = 0, deadline: Optional[Deadline] = None) -> str:
+    fitted, max_tokens = token_budgeter.fit("GPT-4", prompt, system)
+    def attempt(timeout: float) -> str:
+        response = provider_pools["openai"].client.chat.completions.create(
             model="gpt-4",
-            messages=messages,
-            max_tokens=2048,
+            messages=_chat_messages(fitted, system),
+            max_tokens=max_tokens,
             temperature=0.7,
-            timeout=REQUEST_TIMEOUT
+            timeout=timeout
         )
         output = response.choices[0].message.content.strip()
-        usage = {
-            "prompt_tokens": response.usage.prompt_tokens,
-            "completion_tokens": response.usage.completion_tokens,
-            "total_tokens": response.usage.total_tokens
-        }
-        log_event("SUCCESS", "GPT-4", prompt, output, usage)
+        log_event("SUCCESS", "GPT-4", prompt, output, _openai_usage(response))
+        return output
+    return _call_with_retries("GPT-4", prompt, _describe_openai_error, attempt, retry_count, deadline)
+
+# ===========================
+# ASYNC MODEL CALLS
+# ===========================
+async def call_claude_openrouter_async(prompt: str, system: str = None, retry_count: int = 0,
+                                       deadline: Optional[Deadline] = None) -> str:
+    fitted, max_tokens = token_budgeter.fit("Claude-OpenRouter", prompt, system)
+    async def attempt(timeout: float) -> str:
+        headers, payload = _openrouter_request(fitted, system, max_tokens)
+        response = await provider_pools["openrouter"].async_client.post(OPENROUTER_URL, headers=headers, json=payload, timeout=timeout)
+        response.raise_for_status()
+        output, usage = _parse_openrouter_response(response.json())
+        log_event("SUCCESS", "Claude-OpenRouter", prompt, output, usage)
+        return output
+    return await _call_with_retries_async("Claude-OpenRouter", prompt, _describe_openrouter_error, attempt, retry_count, deadline)
+
+async def call_claude_direct_async(prompt: str, system: str = None, retry_count: int = 0,
+                                   deadline: Optional[Deadline] = None) -> str:
+    fitted, max_tokens = token_budgeter.fit("Claude-Direct", prompt, system)
+    async def attempt(timeout: float) -> str:
+        message = await provider_pools["anthropic"].async_client.messages.create(
+            model="claude-3-sonnet-20240229",
+            max_tokens=max_tokens,
+            temperature=0.7,
+            system=_anthropic_system(system),
+            messages=[{"role": "user", "content": fitted}],
+            timeout=timeout
+        )
+        output = message.content[0].text.strip()
+        log_event("SUCCESS", "Claude-Direct", prompt, output, _anthropic_usage(message))
         return output
+    return await _call_with_retries_async("Claude-Direct", prompt, _describe_claude_error, attempt, retry_count, deadline)
+
+async def call_openai_gpt_async(prompt: str, system: str = None, retry_count: int = 0,
+                                deadline: Optional[Deadline] = None) -> str:
+    fitted, max_tokens = token_budgeter.fit("GPT-4", prompt, system)
+    async def attempt(timeout: float) -> str:
+        response = await provider_pools["openai"].async_client.chat.completions.create(
+            model="gpt-4",
+            messages=_chat_messages(fitted, system),
+            max_tokens=max_tokens,
+            temperature=0.7,
+            timeout=timeout
+        )
+        output = response.choices[0].message.content.strip()
+        log_event("SUCCESS", "GPT-4", prompt, output, _openai_usage(response))
+        return output
+    return await _call_with_retries_async("GPT-4", prompt, _describe_openai_error, attempt, retry_count, deadline)
+
+# ===========================
+# STREAMING MODEL CALLS
+# ===========================
+async def _stream_with_retries(label: str, prompt: str, describe: Callable[[Exception], str],
+                               open_stream: Callable[[float, Dict[str, Any]], AsyncIterator[str]],
+                               deadline: Optional[Deadline]) -> AsyncIterator[str]:
+    """Retries only cover getting the first token; once text has been yielded a failure is final"""
+    usage: Dict[str, Any] = {}
+    parts: List[str] = []
+
+    async def first_chunk(timeout: float) -> Tuple[AsyncIterator[str], str]:
+        iterator = open_stream(timeout, usage).__aiter__()
+        try:
+            return iterator, await iterator.__anext__()
+        except StopAsyncIteration:
+            return iterator, ""
+        except BaseException:
+            await iterator.aclose()
+            raise
+
+    try:
+        iterator, first = await retry_policy.run_async(first_chunk, deadline=deadline,
+                                                       **_retry_hooks(label, prompt, describe, deadline))
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise Exception(describe(e)) from e
+    try:
+        if first:
+            parts.append(first)
+            yield first
+        async for chunk in iterator:
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceeded("Stream deadline exceeded")
+            parts.append(chunk)
+            yield chunk
+    except DeadlineExceeded:
+        raise
     except Exception as e:
-        error_msg = f"GPT-4 error: {str(e)}"
-        log_event("ERROR", "GPT-4", prompt, error_msg)
-        if retry_count < MAX_RETRIES:
-            logger.warning(f"Retrying GPT-4 (attempt {retry_count + 1})")
-            return call_openai_gpt(prompt, system, retry_count + 1)
-        raise Exception(error_msg)
+        log_event("ERROR", label, prompt, describe(e), fault=is_provider_fault(e, deadline))
+        raise Exception(describe(e)) from e
+    finally:
+        await iterator.aclose()
+    log_event("SUCCESS", label, prompt, "".join(parts), usage)
+
+async def _openrouter_stream(prompt: str, system: str, max_tokens: int, timeout: float,
+                             usage: Dict[str, Any]) -> AsyncIterator[str]:
+    headers, payload = _openrouter_request(prompt, system, max_tokens)
+    payload["stream"] = True
+    async with provider_pools["openrouter"].async_client.stream(
+        "POST", OPENROUTER_URL, headers=headers, json=payload, timeout=timeout
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            event = json.loads(data)
+            if event.get("usage"):
+                usage.update(event["usage"])
+            choices = event.get("choices") or []
+            text = choices[0].get("delta", {}).get("content") if choices else None
+            if text:
+                yield text
+
+async def _claude_stream(prompt: str, system: str, max_tokens: int, timeout: float,
+                         usage: Dict[str, Any]) -> AsyncIterator[str]:
+    stream = await provider_pools["anthropic"].async_client.messages.create(
+        model="claude-3-sonnet-20240229",
+        max_tokens=max_tokens,
+        temperature=0.7,
+        system=_anthropic_system(system),
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+        timeout=timeout
+    )
+    try:
+        async for event in stream:
+            if event.type == "message_start":
+                usage["prompt_tokens"] = event.message.usage.input_tokens
+                usage["cached_prompt_tokens"] = getattr(event.message.usage, "cache_read_input_tokens", None) or 0
+            elif event.type == "message_delta":
+                usage["completion_tokens"] = event.usage.output_tokens
+            elif event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                yield event.delta.text
+    finally:
+        await stream.response.aclose()
+
+async def _openai_stream(prompt: str, system: str, max_tokens: int, timeout: float,
+                         usage: Dict[str, Any]) -> AsyncIterator[str]:
+    stream = await provider_pools["openai"].async_client.chat.completions.create(
+        model="gpt-4",
+        messages=_chat_messages(prompt, system),
+        max_tokens=max_tokens,
+        temperature=0.7,
+        stream=True,
+        timeout=timeout
+    )
+    try:
+        async for chunk in stream:
+            chunk_usage = getattr(chunk, "usage", None)
+            if chunk_usage:
+                # Older SDKs don't model usage on chunks and leave it as a plain dict
+                usage.update(chunk_usage if isinstance(chunk_usage, dict) else chunk_usage.model_dump())
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.response.aclose()
+
+def stream_claude_openrouter_async(prompt: str, system: str = None, deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+    fitted, max_tokens = token_budgeter.fit("Claude-OpenRouter", prompt, system)
+    return _stream_with_retries("Claude-OpenRouter", prompt, _describe_openrouter_error,
+                                lambda timeout, usage: _openrouter_stream(fitted, system, max_tokens, timeout, usage), deadline)
+
+def stream_claude_direct_async(prompt: str, system: str = None, deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+    fitted, max_tokens = token_budgeter.fit("Claude-Direct", prompt, system)
+    return _stream_with_retries("Claude-Direct", prompt, _describe_claude_error,
+                                lambda timeout, usage: _claude_stream(fitted, system, max_tokens, timeout, usage), deadline)
+
+def stream_openai_gpt_async(prompt: str, system: str = None, deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+    fitted, max_tokens = token_budgeter.fit("GPT-4", prompt, system)
+    return _stream_with_retries("GPT-4", prompt, _describe_openai_error,
+                                lambda timeout, usage: _openai_stream(fitted, system, max_tokens, timeout, usage), deadline)
+
+# Streaming twin of each provider, keyed by the label log_event records; filled in by the registry
+PROVIDER_STREAMS: Dict[str, Callable[..., AsyncIterator[str]]] = {}
+
+# ===========================
+# PROVIDER REGISTRY
+# ===========================
+class ProviderPlugin:
+    """One LLM backend as the router sees it: label, async call, optional stream/sync twins and limits"""
+    def __init__(self, name: str, label: str, call: Callable[..., Any], stream: Callable[..., AsyncIterator[str]] = None,
+                 sync_call: Callable[..., str] = None, token_profile: TokenProfile = PROFILES["openai"],
+                 api_key: Optional[str] = None, api_key_env: str = None, info: Callable[[], Dict[str, Any]] = None):
+        self.name = name
+        self.label = label
+        self.call = call
+        self.stream = stream
+        self.sync_call = sync_call
+        self.token_profile = token_profile
+        self.api_key_env = api_key_env
+        # Plugins without an api_key_env (mocks) need no key
+        self.available = api_key_env is None or bool(api_key)
+        # Rate limits are per key, so labels sharing a key share a limiter; the key itself is not kept
+        fingerprint = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12] if api_key else label
+        self.rate_limit_key = f"{name}:{fingerprint}"
+        self.info = info
+
+    def get_status(self) -> Dict[str, Any]:
+        status = {
+            "name": self.name,
+            "available": self.available,
+            "streaming": self.stream is not None,
+            "context_window": self.token_profile.context_window
+        }
+        if not self.available:
+            status["disabled_reason"] = f"{self.api_key_env} not set"
+        if self.info:
+            status.update(self.info())
+        return status
+
+class ProviderRegistry:
+    """Registered providers by label; registering wires up the breaker, bulkhead, stream and token budget"""
+    def __init__(self):
+        self._plugins: Dict[str, ProviderPlugin] = {}
+        self._lock = threading.Lock()
+
+    def register(self, plugin: ProviderPlugin) -> ProviderPlugin:
+        with self._lock:
+            self._plugins[plugin.label] = plugin
+            circuit_breakers.setdefault(plugin.label, CircuitBreaker(plugin.label))
+            bulkheads.setdefault(plugin.label, Bulkhead(
+                plugin.label, int(os.getenv(f"KAI_{plugin.name.upper()}_MAX_CONCURRENT", str(BULKHEAD_MAX_CONCURRENT)))
+            ))
+            PROVIDER_LABELS[plugin.call.__name__] = plugin.label
+            if plugin.sync_call is not None:
+                PROVIDER_LABELS[plugin.sync_call.__name__] = plugin.label
+            if plugin.stream is not None:
+                PROVIDER_STREAMS[plugin.label] = plugin.stream
+            token_budgeter.profiles[plugin.label] = plugin.token_profile
+            limiter = _key_rate_limiters.get(plugin.rate_limit_key)
+            if limiter is None:
+                prefix = f"KAI_{plugin.name.upper()}_RATE_LIMIT_"
+                limiter = _key_rate_limiters[plugin.rate_limit_key] = RateLimiter(
+                    plugin.label,
+                    float(os.getenv(prefix + "RPS", str(RATE_LIMIT_RPS))),
+                    float(os.getenv(prefix + "BURST", str(RATE_LIMIT_BURST)))
+                )
+                pool = provider_pools.get(plugin.name)
+                if pool is not None:
+                    pool.response_observers.append(limiter.observe_response)
+            rate_limiters[plugin.label] = limiter
+        if plugin.available:
+            logger.info(f"Provider registered: {plugin.label}")
+        else:
+            logger.warning(f"Provider {plugin.label} disabled: {plugin.api_key_env} not set")
+        return plugin
+
+    def get(self, label: str) -> Optional[ProviderPlugin]:
+        return self._plugins.get(label)
+
+    def available(self) -> List[ProviderPlugin]:
+        return [plugin for plugin in list(self._plugins.values()) if plugin.available]
+
+    def chain(self, preferred: List[str]) -> List[Callable[..., Any]]:
+        """Available providers in the preferred label order, then any others in registration order"""
+        plugins = self.available()
+        ranked = sorted(plugins, key=lambda p: preferred.index(p.label) if p.label in preferred else len(preferred))
+        return [plugin.call for plugin in ranked]
+
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        return {label: plugin.get_status() for label, plugin in list(self._plugins.items())}
+
+provider_registry = ProviderRegistry()
+
+def _mock_plugin(name: str) -> ProviderPlugin:
+    """A MockProvider behind the same retry, breaker, bulkhead and logging path as the real providers"""
+    mock = MockProvider(name)
+    label = "-".join(part.capitalize() for part in name.split("_"))
+
+    def describe(e: Exception) -> str:
+        return f"{label} error: {str(e)}"
+
+    async def call(prompt: str, system: str = None, retry_count: int = 0, deadline: Optional[Deadline] = None) -> str:
+        fitted, max_tokens = token_budgeter.fit(label, prompt, system)
+
+        async def attempt(timeout: float) -> str:
+            output, usage = await mock.complete(fitted, max_tokens, timeout)
+            log_event("SUCCESS", label, prompt, output, usage)
+            return output
+        return await _call_with_retries_async(label, prompt, describe, attempt, retry_count, deadline)
+
+    def stream(prompt: str, system: str = None, deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+        fitted, max_tokens = token_budgeter.fit(label, prompt, system)
+        return _stream_with_retries(label, prompt, describe,
+                                    lambda timeout, usage: mock.stream(fitted, max_tokens, timeout, usage), deadline)
+
+    call.__name__ = f"call_{name}_async"
+    stream.__name__ = f"stream_{name}_async"
+    return ProviderPlugin(name, label, call, stream, token_profile=PROFILES["anthropic"], info=mock.get_stats)
+
+def register_providers(names: List[str]) -> None:
+    builtin = {
+        "openrouter": lambda: ProviderPlugin(
+            "openrouter", "Claude-OpenRouter", call_claude_openrouter_async, stream_claude_openrouter_async,
+            call_claude_openrouter, PROFILES["anthropic"], OPENROUTER_API_KEY, "OPENROUTER_API_KEY"
+        ),
+        "anthropic": lambda: ProviderPlugin(
+            "anthropic", "Claude-Direct", call_claude_direct_async, stream_claude_direct_async,
+            call_claude_direct, PROFILES["anthropic"], ANTHROPIC_API_KEY, "ANTHROPIC_API_KEY"
+        ),
+        "openai": lambda: ProviderPlugin(
+            "openai", "GPT-4", call_openai_gpt_async, stream_openai_gpt_async,
+            call_openai_gpt, PROFILES["openai"], OPENAI_API_KEY, "OPENAI_API_KEY"
+        )
+    }
+    for name in names:
+        if name in builtin:
+            provider_registry.register(builtin[name]())
+        elif name == "mock" or name.startswith("mock_"):
+            provider_registry.register(_mock_plugin(name))
+        else:
+            logger.warning(f"Unknown provider '{name}' in KAI_PROVIDERS, ignoring")
+    if not provider_registry.available():
+        logger.error("❌ No LLM providers available: set OPENAI_API_KEY, OPENROUTER_API_KEY, ANTHROPIC_API_KEY or KAI_PROVIDERS=mock")
+
+register_providers(ENABLED_PROVIDERS)
+
+# ===========================
+# BACKGROUND EVENT LOOP (sync callers)
+# ===========================
+class BackgroundEventLoop:
+    """Daemon-thread event loop that runs the async router on behalf of synchronous callers"""
+    def __init__(self, name: str = "kai_router_loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        # Started lazily and per process, so a pre-fork import never hands a dead thread to a worker
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name=self.name, daemon=True)
+                    thread.start()
+                    self._loop, self._pid = loop, os.getpid()
+        return self._loop
+
+    def run(self, coro: Any, timeout: float = None, cancel_token: Optional[CancelToken] = None) -> Any:
+        """Block until coro finishes; cancelling the token cancels the task, which closes its provider requests"""
+        loop = self.loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("Cannot block on the router event loop from inside itself; await the coroutine instead")
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        if cancel_token is None:
+            return future.result(timeout)
+        cancel_token.add_callback(future.cancel)
+        try:
+            return future.result(timeout)
+        finally:
+            cancel_token.remove_callback(future.cancel)
+
+router_loop = BackgroundEventLoop()
+
+# ===========================
+# ADAPTIVE MODEL ORDERING
+# ===========================
+TONE_BUCKETS: Dict[str, str] = {
+    "scroll": "creative", "emotional": "creative", "healing": "creative", "poetic": "creative",
+    "code": "technical", "technical": "technical", "automation": "technical"
+}
+
+# Static preference per bucket: the starting order, the tie-breaker, and the fallback when stats are thin.
+# Registered providers not listed here (e.g. mocks) follow in registration order.
+MODEL_ORDERS: Dict[str, List[str]] = {
+    "creative": ["Claude-OpenRouter", "Claude-Direct", "GPT-4"],
+    "technical": ["GPT-4", "Claude-OpenRouter", "Claude-Direct"],
+    "general": ["GPT-4", "Claude-OpenRouter", "Claude-Direct"]
+}
+
+def tone_bucket(norm_tone: str) -> str:
+    return TONE_BUCKETS.get(norm_tone, "general")
+
+class ProviderScoreboard:
+    """EWMA latency and success rate per (tone bucket, provider), used to reorder the fallback chain"""
+    def __init__(self, alpha: float = ORDER_EWMA_ALPHA, exploration_rate: float = ORDER_EXPLORATION_RATE,
+                 min_samples: int = ORDER_MIN_SAMPLES, tie_tolerance: float = ORDER_TIE_TOLERANCE,
+                 rng: Optional[random.Random] = None):
+        self.alpha = alpha
+        self.exploration_rate = exploration_rate
+        self.min_samples = min_samples
+        self.tie_tolerance = tie_tolerance
+        self.rng = rng or random.Random()  # exploration draws; seeded in tests for a repeatable order
+        # (bucket, provider) -> {"samples", "latency", "success_rate"}
+        self._stats: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._decisions: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, bucket: str, provider: str, success: bool, seconds: float) -> None:
+        with self._lock:
+            stats = self._stats.setdefault((bucket, provider), {"samples": 0, "latency": None, "success_rate": None})
+            stats["samples"] += 1
+            outcome = 1.0 if success else 0.0
+            if stats["success_rate"] is None:
+                stats["success_rate"] = outcome
+            else:
+                stats["success_rate"] += self.alpha * (outcome - stats["success_rate"])
+            # Latency only tracks answers; a fast failure must not make a provider look attractive
+            if success:
+                if stats["latency"] is None:
+                    stats["latency"] = seconds
+                else:
+                    stats["latency"] += self.alpha * (seconds - stats["latency"])
+
+    def _expected_cost(self, stats: Dict[str, Any]) -> float:
+        # Expected seconds spent per successful answer: latency / success rate
+        if stats["latency"] is None or stats["success_rate"] <= 0:
+            return float("inf")
+        return stats["latency"] / max(stats["success_rate"], 0.01)
+
+    def _score_key(self, cost: float) -> int:
+        # Costs are compared on a log scale in tie_tolerance-wide steps, so near-equal providers keep static order
+        if cost == float("inf"):
+            return sys.maxsize
+        return math.floor(math.log(max(cost, 1e-3)) / math.log(1 + self.tie_tolerance))
+
+    def order(self, bucket: str, static_order: List[Callable[..., Any]]) -> List[Callable[..., Any]]:
+        """Rank providers with enough samples by expected cost; the rest keep their static slot"""
+        labels = [PROVIDER_LABELS.get(f.__name__, f.__name__) for f in static_order]
+        with self._lock:
+            known = [
+                i for i, label in enumerate(labels)
+                if self._stats.get((bucket, label), {}).get("samples", 0) >= self.min_samples
+            ]
+            ranked = sorted(known, key=lambda i: (self._score_key(self._expected_cost(self._stats[(bucket, labels[i])])), i))
+            decisions = self._decisions.setdefault(bucket, {"requests": 0, "reordered": 0, "explored": 0})
+            decisions["requests"] += 1
+        ordered = list(static_order)
+        for slot, i in zip(known, ranked):
+            ordered[slot] = static_order[i]
+        if len(ordered) > 1 and self.rng.random() < self.exploration_rate:
+            # Exploration: promote a random non-leading provider so every provider keeps getting samples
+            ordered.insert(0, ordered.pop(self.rng.randrange(1, len(ordered))))
+            with self._lock:
+                decisions["explored"] += 1
+        elif ordered != static_order:
+            with self._lock:
+                decisions["reordered"] += 1
+        return ordered
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            buckets: Dict[str, Any] = {}
+            for (bucket, provider), stats in self._stats.items():
+                cost = self._expected_cost(stats)
+                buckets.setdefault(bucket, {"providers": {}})["providers"][provider] = {
+                    "samples": stats["samples"],
+                    "ewma_latency_ms": round(stats["latency"] * 1000, 1) if stats["latency"] is not None else None,
+                    "success_rate": round(stats["success_rate"], 4),
+                    "expected_cost_ms": round(cost * 1000, 1) if cost != float("inf") else None
+                }
+            for bucket, decisions in self._decisions.items():
+                buckets.setdefault(bucket, {"providers": {}}).update(decisions)
+        for bucket, info in buckets.items():
+            static_order = provider_registry.chain(MODEL_ORDERS.get(bucket, MODEL_ORDERS["general"]))
+            info["static_order"] = [PROVIDER_LABELS[f.__name__] for f in static_order]
+        return {
+            "enabled": ADAPTIVE_ORDERING,
+            "exploration_rate": self.exploration_rate,
+            "ewma_alpha": self.alpha,
+            "min_samples": self.min_samples,
+            "buckets": buckets
+        }
+
+provider_scoreboard = ProviderScoreboard()
+
+def get_provider_scoreboard() -> Dict[str, Any]:
+    return provider_scoreboard.get_status()
+
+# ===========================
+# HEDGED REQUESTS
+# ===========================
+class ProviderLatencyTracker:
+    """Recent successful-call latencies per provider, used to derive the hedge delay"""
+    def __init__(self, sample_size: int = LATENCY_SAMPLE_SIZE):
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self.sample_size = sample_size
+
+    def record(self, provider: str, seconds: float) -> None:
+        with self._lock:
+            if provider not in self._samples:
+                self._samples[provider] = deque(maxlen=self.sample_size)
+            self._samples[provider].append(seconds)
+
+    def percentile(self, provider: str, pct: float, min_samples: int = HEDGE_MIN_SAMPLES) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(provider, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def hedge_delay(self, provider: str) -> float:
+        threshold = self.percentile(provider, HEDGE_PERCENTILE)
+        if threshold is None:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, threshold)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            providers = list(self._samples)
+        return {
+            provider: {
+                "samples": len(self._samples[provider]),
+                "hedge_delay_seconds": round(self.hedge_delay(provider), 3)
+            }
+            for provider in providers
+        }
+
+class HedgeStats:
+    """Per-tone counters for how often a hedge fired and how often it beat the primary"""
+    def __init__(self):
+        self._tones: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, tone: str, hedged: bool, hedge_won: bool) -> None:
+        with self._lock:
+            counters = self._tones.setdefault(tone, {"requests": 0, "hedged": 0, "hedge_wins": 0})
+            counters["requests"] += 1
+            if hedged:
+                counters["hedged"] += 1
+            if hedge_won:
+                counters["hedge_wins"] += 1
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                tone: {
+                    **counters,
+                    "hedge_rate": round(counters["hedged"] / max(counters["requests"], 1), 4),
+                    "win_rate": round(counters["hedge_wins"] / max(counters["hedged"], 1), 4)
+                }
+                for tone, counters in self._tones.items()
+            }
+
+latency_tracker = ProviderLatencyTracker()
+hedge_stats = HedgeStats()
+
+async def _timed_call(model_func: Callable[..., Any], prompt: str, norm_tone: str,
+                      deadline: Optional[Deadline], system: Optional[str] = None, internal: bool = False) -> str:
+    label = PROVIDER_LABELS.get(model_func.__name__, model_func.__name__)
+    # Internal calls still count as provider load, but stay out of the per-tone and ordering statistics
+    tone = None if internal else norm_tone
+    started = monotonic()
+    try:
+        output = await model_func(prompt, system=system, deadline=deadline)
+    except DeadlineExceeded:
+        # The caller ran out of budget; that says nothing about the provider
+        raise
+    except Exception:
+        if not internal:
+            provider_scoreboard.record(tone_bucket(norm_tone), label, False, monotonic() - started)
+        provider_metrics.record_call(label, tone, monotonic() - started, False)
+        raise
+    elapsed = monotonic() - started
+    success = bool(output and output.strip())
+    if not internal:
+        provider_scoreboard.record(tone_bucket(norm_tone), label, success, elapsed)
+    provider_metrics.record_call(label, tone, elapsed, success)
+    if success and not internal:
+        latency_tracker.record(model_func.__name__, elapsed)
+    return output
+
+def _provider_deadline(deadline: Optional[Deadline], providers_left: int) -> Optional[Deadline]:
+    """The share of the request deadline one provider may spend; the rest is held back for the fallback chain"""
+    remaining = deadline.remaining() if deadline is not None else None
+    if remaining is None or providers_left <= 0:
+        return deadline
+    return deadline.reserve(min(remaining * FALLBACK_RESERVE, FALLBACK_RESERVE_MAX))
+
+async def _cancel_tasks(tasks: Dict["asyncio.Task", Any]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _run_model_chain(model_functions: List[Callable[..., Any]], prompt: str, norm_tone: str, hedge: bool,
+                           deadline: Optional[Deadline] = None, system: Optional[str] = None,
+                           internal: bool = False) -> Tuple[Optional[str], List[str]]:
+    """Walk the fallback chain; with hedging on, a single slow attempt is raced against the next provider"""
+    errors: List[str] = []
+    in_flight: Dict[asyncio.Task, Tuple[int, Callable[..., Any]]] = {}
+    next_index = 0
+    hedged = False
+    hedge_index = None
+
+    def launch() -> bool:
+        # Providers that are saturated or whose breaker is open are skipped without spending any time on them
+        nonlocal next_index
+        while next_index < len(model_functions):
+            if deadline is not None and deadline.expired:
+                errors.append("request deadline exceeded")
+                logger.warning(f"Deadline exceeded, not starting model {next_index+1}/{len(model_functions)}")
+                next_index = len(model_functions)
+                return False
+            model_func = model_functions[next_index]
+            next_index += 1
+            bulkhead, skip_reason = _admit(model_func)
+            if skip_reason:
+                errors.append(f"{model_func.__name__}: {skip_reason}")
+                logger.warning(f"Skipping model {next_index}/{len(model_functions)}: {model_func.__name__} {skip_reason}")
+                continue
+            task = None
+            try:
+                logger.info(f"Attempting model {next_index}/{len(model_functions)}: {model_func.__name__}")
+                provider_deadline = _provider_deadline(deadline, len(model_functions) - next_index)
+                task = asyncio.ensure_future(_timed_call(model_func, prompt, norm_tone, provider_deadline, system, internal))
+            finally:
+                # The slot is owned by the task, released on completion or cancellation (even before it starts),
+                # or released right here if the task was never created
+                if bulkhead is not None and task is None:
+                    bulkhead.release()
+                elif bulkhead is not None:
+                    task.add_done_callback(lambda _, slot=bulkhead: slot.release())
+            in_flight[task] = (next_index - 1, model_func)
+            return True
+        return False
+
+    launch()
+    try:
+        while in_flight:
+            can_hedge = hedge and not hedged and len(in_flight) == 1 and next_index < len(model_functions)
+            timeout = None
+            if can_hedge:
+                _, current = next(iter(in_flight.values()))
+                timeout = latency_tracker.hedge_delay(current.__name__)
+                if deadline is not None:
+                    timeout = deadline.cap(timeout)
+            done, _ = await asyncio.wait(in_flight, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if launch():
+                    hedged = True
+                    hedge_index = next_index - 1
+                    logger.info(f"No answer within {timeout:.2f}s, hedged with {model_functions[hedge_index].__name__}")
+                continue
+            for task in done:
+                index, model_func = in_flight.pop(task)
+                try:
+                    output = task.result()
+                except Exception as e:
+                    error_detail = f"{model_func.__name__}: {str(e)}"
+                    errors.append(error_detail)
+                    logger.warning(f"Model {index+1} failed: {error_detail}")
+                    continue
+                if output and output.strip():
+                    if not internal:
+                        hedge_stats.record(norm_tone, hedged, hedged and index == hedge_index)
+                        provider_metrics.record_fallback_depth(norm_tone, index)
+                    return output, errors
+            if not in_flight and next_index < len(model_functions):
+                launch()
+        if not internal:
+            hedge_stats.record(norm_tone, hedged, False)
+            provider_metrics.record_fallback_depth(norm_tone, None)
+        return None, errors
+    finally:
+        # Losers (and everything, if we were cancelled) are cancelled so their connections are released
+        await _cancel_tasks(in_flight)
 
 # ===========================
 # MAIN RESPONSE ROUTER
 # ===========================
-def get_kai_response(prompt: str, tone: str = "neutral") -> str:
+def get_model_order(norm_tone: str) -> List[Callable[..., Any]]:
+    static_order = provider_registry.chain(MODEL_ORDERS[tone_bucket(norm_tone)])
+    if not ADAPTIVE_ORDERING:
+        return list(static_order)
+    return provider_scoreboard.order(tone_bucket(norm_tone), static_order)
+
+def get_model_chain(norm_tone: str) -> List[str]:
+    """Stable chain identity for cache and single-flight keys; adaptive reordering must not split them"""
+    chain = [model_func.__name__ for model_func in provider_registry.chain(MODEL_ORDERS[tone_bucket(norm_tone)])]
+    # Replies written under an older persona are not served once the persona files change
+    return chain + [f"persona:{persona.version}"] if PERSONA_ENABLED else chain
+
+def get_system_prompt(norm_tone: str) -> Optional[str]:
+    return persona.get(norm_tone) if PERSONA_ENABLED else None
+
+# ===========================
+# CONVERSATION MEMORY
+# ===========================
+SUMMARY_PROMPT = (
+    "Summarize this conversation between a user and Kai so Kai can continue it later. Keep names, facts, "
+    "decisions, preferences and open questions; drop greetings and filler. Reply with the summary only, "
+    "in at most {words} words.\n\n{previous}{turns}"
+)
+
+async def _summarize_turns(summary: str, turns: List[Turn]) -> str:
+    """Compaction summarizer: one call down the general chain, bypassing the cache, duplicate memory and tone stats"""
+    previous = f"Summary so far:\n{summary}\n\nNewer messages:\n" if summary else ""
+    prompt = SUMMARY_PROMPT.format(
+        words=int(SUMMARY_TOKEN_BUDGET * 0.6), previous=previous, turns="\n".join(turn.render() for turn in turns)
+    )
+    output, errors = await _run_model_chain(get_model_order("summary"), prompt, "summary", False,
+                                            Deadline(CONVERSATION_COMPACT_TIMEOUT), internal=True)
+    if not output or not output.strip():
+        raise Exception("; ".join(errors) or "empty summary")
+    return output
+
+# Keyed by the caller-supplied user id; requests without one stay stateless
+conversations = ConversationStore(_summarize_turns)
+
+def get_kai_response(prompt: str, tone: str = "neutral", hedge: Optional[bool] = None,
+                     deadline: Optional[Deadline] = None, bypass_cache: bool = False, user: Optional[str] = None) -> str:
+    """Blocking entry point; runs get_kai_response_async on the shared router loop"""
+    try:
+        return router_loop.run(get_kai_response_async(prompt, tone, hedge, deadline, bypass_cache, user),
+                               cancel_token=deadline.cancel_token if deadline is not None else None)
+    except concurrent.futures.CancelledError:
+        # Also raised when the loop itself shuts down (e.g. post_fork), with no caller token to blame
+        token = deadline.cancel_token if deadline is not None else None
+        reason = token.reason if token is not None else "router loop shut down"
+        logger.warning(f"Request abandoned ({reason}), router work cancelled")
+        return "⚠️ This request was cancelled before a reply was ready."
+    except Exception as e:
+        logger.error(f"Critical error in get_kai_response: {str(e)}")
+        logger.error(traceback.format_exc())
+        return "⚠️ I encountered an unexpected error. Please try again."
+
+async def _generate_response(prompt: str, norm_tone: str, model_functions: List[Callable[..., Any]], chain: List[str],
+                             hedge: bool, deadline: Optional[Deadline], system: Optional[str] = None) -> str:
+    output, errors = await _run_model_chain(model_functions, prompt, norm_tone, hedge, deadline, system)
+
+    if not output or not output.strip():
+        logger.error(f"All models failed. Errors: {'; '.join(errors)}")
+        return "⚠️ I'm experiencing technical difficulties with all my AI systems. Please try again in a few minutes."
+
+    if memory.check_duplicate(output):
+        logger.info("Duplicate response detected, requesting rephrase")
+        return "⚠️ I notice I might be repeating myself. Could you rephrase your question or ask something different?"
+
+    memory.add_output(output)
+    response_cache.put(prompt, norm_tone, chain, output)
+    logger.info(f"Response generated successfully: {len(output)} characters")
+    return output
+
+async def get_kai_response_async(prompt: str, tone: str = "neutral", hedge: Optional[bool] = None,
+                                 deadline: Optional[Deadline] = None, bypass_cache: bool = False,
+                                 user: Optional[str] = None) -> str:
     try:
         valid, error_msg = validate_prompt(prompt)
         if not valid:
             logger.warning(f"Invalid prompt: {error_msg}")
             return f"⚠️ {error_msg}"
 
-        prompt = prompt.strip()
+        message = prompt.strip()
+        # History is folded into the prompt, so cache and single-flight keys already account for it
+        prompt = conversations.build_prompt(user, message) if user else message
         norm_tone = (tone or "neutral").strip().lower()
         logger.info(f"Processing request: tone={norm_tone}, length={len(prompt)}")
 
-        # Determine model order based on tone
-        if norm_tone in ["scroll", "emotional", "healing", "poetic"]:
-            model_functions = [call_claude_openrouter, call_claude_direct, call_openai_gpt]
-        elif norm_tone in ["code", "technical", "automation"]:
-            model_functions = [call_openai_gpt, call_claude_openrouter, call_claude_direct]
+        # Resolved first: it may reload the persona, and the chain key records the persona version
+        system = get_system_prompt(norm_tone)
+        model_functions = get_model_order(norm_tone)
+        chain = get_model_chain(norm_tone)
+        cached = None
+        if bypass_cache:
+            response_cache.record_bypass()
         else:
-            model_functions = [call_openai_gpt, call_claude_openrouter, call_claude_direct]
+            cached = response_cache.get(prompt, norm_tone, chain)
+            if cached is not None:
+                logger.info(f"Response served from cache: {len(cached)} characters")
+
+        # Identical prompts already in flight (from any thread or event loop) share that call's answer
+        reply = cached if cached is not None else await single_flight.do(
+            ResponseCache.make_key(prompt, norm_tone, chain),
+            lambda: _generate_response(prompt, norm_tone, model_functions, chain,
+                                       HEDGING_ENABLED if hedge is None else hedge, deadline, system),
+            timeout=deadline.remaining() if deadline is not None else None
+        )
+        if user and not reply.startswith(ERROR_REPLY_PREFIX):
+            conversations.record(user, message, reply)
+        return reply
+
+    except asyncio.TimeoutError:
+        logger.warning("Deadline exceeded while waiting on a coalesced request")
+        return "⚠️ I'm experiencing technical difficulties with all my AI systems. Please try again in a few minutes."
+    except Exception as e:
+        error_msg = f"Critical error in get_kai_response_async: {str(e)}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        return "⚠️ I encountered an unexpected error. Please try again."
+
+# ===========================
+# STREAMING ROUTER
+# ===========================
+class StreamInterrupted(Exception):
+    """A provider failed after tokens were already sent, so the stream cannot fall back"""
+
+class StreamStats:
+    """Stream outcome counters and per-provider time-to-first-token samples"""
+    def __init__(self):
+        self._ttft = ProviderLatencyTracker()
+        self._lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.failovers = 0
+        self.interrupted = 0
+        self.cache_hits = 0
+        self.duplicates = 0
 
-        output = None
-        errors = []
+    def record_ttft(self, provider: str, seconds: float) -> None:
+        self._ttft.record(provider, seconds)
 
-        for i, model_func in enumerate(model_functions):
+    def incr(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            status = {
+                "started": self.started,
+                "completed": self.completed,
+                "failovers_before_first_token": self.failovers,
+                "interrupted_after_first_token": self.interrupted,
+                "cache_hits": self.cache_hits,
+                "duplicates_not_cached": self.duplicates
+            }
+        ttft = {}
+        for provider, info in self._ttft.get_status().items():
+            ttft[provider] = {
+                "samples": info["samples"],
+                "p50_ms": round(self._ttft.percentile(provider, 50, min_samples=1) * 1000, 1),
+                "p95_ms": round(self._ttft.percentile(provider, 95, min_samples=1) * 1000, 1)
+            }
+        status["time_to_first_token"] = ttft
+        return status
+
+stream_stats = StreamStats()
+
+async def stream_kai_response_async(prompt: str, tone: str = "neutral", deadline: Optional[Deadline] = None,
+                                    user: Optional[str] = None) -> AsyncIterator[str]:
+    """Yield reply text chunks as providers produce them; falls back only if nothing was sent yet"""
+    valid, error_msg = validate_prompt(prompt)
+    if not valid:
+        logger.warning(f"Invalid prompt: {error_msg}")
+        yield f"⚠️ {error_msg}"
+        return
+
+    message = prompt.strip()
+    prompt = conversations.build_prompt(user, message) if user else message
+    norm_tone = (tone or "neutral").strip().lower()
+    logger.info(f"Processing stream request: tone={norm_tone}, length={len(prompt)}")
+    stream_stats.incr("started")
+
+    system = get_system_prompt(norm_tone)
+    model_functions = get_model_order(norm_tone)
+    chain = get_model_chain(norm_tone)
+    cached = response_cache.get(prompt, norm_tone, chain)
+    if cached is not None:
+        stream_stats.incr("cache_hits")
+        stream_stats.incr("completed")
+        if user:
+            conversations.record(user, message, cached)
+        yield cached
+        return
+
+    errors = []
+    for i, model_func in enumerate(model_functions):
+        label = PROVIDER_LABELS.get(model_func.__name__, model_func.__name__)
+        if label not in PROVIDER_STREAMS:
+            errors.append(f"{model_func.__name__}: streaming not supported")
+            continue
+        if deadline is not None and deadline.expired:
+            errors.append("request deadline exceeded")
+            break
+        bulkhead, skip_reason = _admit(model_func)
+        if skip_reason:
+            errors.append(f"{model_func.__name__}: {skip_reason}")
+            logger.warning(f"Skipping stream model {i+1}/{len(model_functions)}: {label} {skip_reason}")
+            continue
+        started = monotonic()
+        parts: List[str] = []
+        stream = None
+        try:
+            logger.info(f"Streaming from model {i+1}/{len(model_functions)}: {label}")
+            stream = PROVIDER_STREAMS[label](prompt, system=system, deadline=deadline)
+            async for chunk in stream:
+                if not parts:
+                    stream_stats.record_ttft(label, monotonic() - started)
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            provider_metrics.record_call(label, norm_tone, monotonic() - started, False)
+            if parts:
+                stream_stats.incr("interrupted")
+                logger.error(f"Stream from {label} failed after {len(parts)} chunks: {e}")
+                raise StreamInterrupted(f"{label}: {str(e)}") from e
+            errors.append(f"{model_func.__name__}: {str(e)}")
+            stream_stats.incr("failovers")
+            logger.warning(f"Stream model {i+1} failed before first token: {e}")
+            continue
+        finally:
             try:
-                logger.info(f"Attempting model {i+1}/{len(model_functions)}: {model_func.__name__}")
-                output = model_func(prompt)
-                if output and output.strip():
-                    break
-            except Exception as e:
-                error_detail = f"{model_func.__name__}: {str(e)}"
-                errors.append(error_detail)
-                logger.warning(f"Model {i+1} failed: {error_detail}")
-                continue
+                if stream is not None:
+                    await stream.aclose()
+            finally:
+                if bulkhead is not None:
+                    bulkhead.release()
+        output = "".join(parts)
+        provider_metrics.record_call(label, norm_tone, monotonic() - started, bool(output.strip()))
+        if output.strip():
+            provider_metrics.record_fallback_depth(norm_tone, i)
+            if memory.check_duplicate(output):
+                # Already sent, so unlike get_kai_response_async it cannot be swapped for the rephrase notice;
+                # keeping it out of the cache and the duplicate window stops it being served again
+                stream_stats.incr("duplicates")
+                logger.info("Duplicate streamed response detected, not cached")
+            else:
+                memory.add_output(output)
+                response_cache.put(prompt, norm_tone, chain, output)
+            if user:
+                conversations.record(user, message, output)
+            stream_stats.incr("completed")
+            logger.info(f"Stream completed: {len(output)} characters")
+            return
+        errors.append(f"{model_func.__name__}: empty stream")
 
-        if not output or not output.strip():
-            logger.error(f"All models failed. Errors: {'; '.join(errors)}")
-            return "⚠️ I'm experiencing technical difficulties with all my AI systems. Please try again in a few minutes."
+    provider_metrics.record_fallback_depth(norm_tone, None)
+    logger.error(f"All models failed to stream. Errors: {'; '.join(errors)}")
+    yield "⚠️ I'm experiencing technical difficulties with all my AI systems. Please try again in a few minutes."
 
-        if memory.check_duplicate(output):
-            logger.info("Duplicate response detected, requesting rephrase")
-            return "⚠️ I notice I might be repeating myself. Could you rephrase your question or ask something different?"
+async def _next_chunk(stream: AsyncIterator[Any]) -> Optional[Any]:
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return None
 
-        memory.add_output(output)
-        logger.info(f"Response generated successfully: {len(output)} characters")
-        return output
+def stream_kai_response(prompt: str, tone: str = "neutral", deadline: Optional[Deadline] = None,
+                        user: Optional[str] = None) -> Iterator[str]:
+    """Blocking generator over stream_kai_response_async, driven on the shared router loop"""
+    stream = stream_kai_response_async(prompt, tone, deadline, user)
+    try:
+        while True:
+            chunk = router_loop.run(_next_chunk(stream))
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        router_loop.run(stream.aclose())
 
+# ===========================
+# BATCH ROUTER
+# ===========================
+async def _batch_item(index: int, prompt: str, tone: str, deadline: Optional[Deadline],
+                      bypass_cache: bool) -> Dict[str, Any]:
+    started = monotonic()
+    norm_tone = (tone or "neutral").strip().lower()
+    try:
+        reply = await get_kai_response_async(prompt, norm_tone, deadline=deadline, bypass_cache=bypass_cache)
+        error = reply if reply.startswith(ERROR_REPLY_PREFIX) else None
     except Exception as e:
-        error_msg = f"Critical error in get_kai_response: {str(e)}"
-        logger.error(error_msg)
-        logger.error(traceback.format_exc())
-        return "⚠️ I encountered an unexpected error. Please try again."
+        logger.error(f"Batch item {index} failed: {str(e)}")
+        reply, error = None, f"{ERROR_REPLY_PREFIX} I encountered an unexpected error. Please try again."
+    return {
+        "index": index,
+        "tone": norm_tone,
+        "ok": error is None,
+        "reply": reply if error is None else None,
+        "error": error,
+        "elapsed_ms": round((monotonic() - started) * 1000, 1)
+    }
+
+async def iter_kai_responses_async(items: List[Tuple[str, str]], max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                                   deadline: Optional[Deadline] = None,
+                                   bypass_cache: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """Yield one result dict per (prompt, tone) item as each finishes; 'index' maps it back to the input"""
+    if not items:
+        return
+    results: asyncio.Queue = asyncio.Queue()
+    pending = iter(enumerate(items))
+
+    async def worker() -> None:
+        # Workers pull the next item only when free, so a slow item never holds up the rest
+        for index, (prompt, tone) in pending:
+            await results.put(await _batch_item(index, prompt, tone, deadline, bypass_cache))
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, min(max_concurrency, len(items))))]
+    logger.info(f"Processing batch: {len(items)} items, concurrency={len(workers)}")
+    try:
+        for _ in range(len(items)):
+            yield await results.get()
+    finally:
+        # Reached early only if the consumer went away; stop starting new items
+        await _cancel_tasks(workers)
+
+async def get_kai_responses_async(items: List[Tuple[str, str]], max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                                  deadline: Optional[Deadline] = None,
+                                  bypass_cache: bool = False) -> List[Dict[str, Any]]:
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    async for result in iter_kai_responses_async(items, max_concurrency, deadline, bypass_cache):
+        results[result["index"]] = result
+    return results
+
+def get_kai_responses(items: List[Tuple[str, str]], max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                      deadline: Optional[Deadline] = None, bypass_cache: bool = False) -> List[Dict[str, Any]]:
+    """Blocking batch entry point: results in input order, each with its own ok/reply/error"""
+    return router_loop.run(get_kai_responses_async(items, max_concurrency, deadline, bypass_cache))
+
+def iter_kai_responses(items: List[Tuple[str, str]], max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                       deadline: Optional[Deadline] = None, bypass_cache: bool = False) -> Iterator[Dict[str, Any]]:
+    """Blocking generator over iter_kai_responses_async, in completion order"""
+    results = iter_kai_responses_async(items, max_concurrency, deadline, bypass_cache)
+    try:
+        while True:
+            result = router_loop.run(_next_chunk(results))
+            if result is None:
+                return
+            yield result
+    finally:
+        router_loop.run(results.aclose())
 
 # ===========================
 # UTILITY FUNCTIONS
@@ -298,7 +1636,32 @@ def get_system_status() -> Dict[str, Any]:
             "configuration": {
                 "request_timeout": REQUEST_TIMEOUT,
                 "max_retries": MAX_RETRIES,
-                "max_prompt_length": MAX_PROMPT_LENGTH
+                "retry_base_delay": retry_policy.base_delay,
+                "retry_max_delay": retry_policy.max_delay,
+                "fallback_reserve": FALLBACK_RESERVE,
+                "fallback_reserve_max": FALLBACK_RESERVE_MAX,
+                "max_prompt_length": MAX_PROMPT_LENGTH,
+                "max_prompt_tokens": MAX_PROMPT_TOKENS
+            },
+            "providers": provider_registry.get_status(),
+            "provider_pools": get_pool_stats(),
+            "circuit_breakers": get_breaker_status(),
+            "bulkheads": get_bulkhead_status(),
+            "rate_limits": get_rate_limit_status(),
+            "token_budget": token_budgeter.get_stats(),
+            "response_cache": response_cache.get_stats(),
+            "single_flight": single_flight.get_stats(),
+            "streaming": stream_stats.get_status(),
+            "conversations": conversations.get_stats(),
+            "persona": persona.get_stats(),
+            "cassette": provider_cassette.get_stats() if provider_cassette is not None else {"mode": "off"},
+            "provider_scoreboard": provider_scoreboard.get_status(),
+            "performance": provider_metrics.get_status(),
+            "hedging": {
+                "enabled": HEDGING_ENABLED,
+                "percentile": HEDGE_PERCENTILE,
+                "providers": latency_tracker.get_status(),
+                "tones": hedge_stats.get_status()
             }
         })
         return status
@@ -306,9 +1669,15 @@ def get_system_status() -> Dict[str, Any]:
         logger.error(f"Error getting system status: {e}")
         return {"error": str(e), "timestamp": datetime.now().isoformat()}
 
+def invalidate_cache(prompt: str = None, tone: str = None) -> int:
+    removed = response_cache.invalidate(prompt, (tone or "").strip().lower() or None)
+    logger.info(f"Response cache invalidated: {removed} entries")
+    return removed
+
 def clear_memory() -> str:
     try:
         memory.clear_all()
+        conversations.clear()
         logger.info("Memory cleared successfully")
         return "✅ Memory cleared successfully"
     except Exception as e:
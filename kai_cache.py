@@ -0,0 +1,224 @@
+"""
+Kai Cache - bounded response cache and request coalescing for the brain router
+Thread-safe LRU with per-tone TTLs and a memory budget, plus single-flight deduplication
+"""
+
+import os
+import sys
+import asyncio
+import hashlib
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Any, Optional, Sequence, Tuple, Callable, Awaitable
+
+# ===========================
+# CONFIGURATION
+# ===========================
+CACHE_ENABLED = os.getenv("KAI_CACHE_ENABLED", "true").lower() == "true"
+CACHE_DEFAULT_TTL = float(os.getenv("KAI_CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("KAI_CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("KAI_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Per-tone overrides, e.g. "code:3600,technical:3600,emotional:0" (0 disables caching for a tone)
+CACHE_TONE_TTLS = os.getenv("KAI_CACHE_TONE_TTLS", "")
+
+def parse_tone_ttls(spec: str) -> Dict[str, float]:
+    ttls = {}
+    for item in spec.split(","):
+        if ":" not in item:
+            continue
+        tone, ttl = item.split(":", 1)
+        try:
+            ttls[tone.strip().lower()] = float(ttl)
+        except ValueError:
+            continue
+    return ttls
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split()).casefold()
+
+# ===========================
+# RESPONSE CACHE
+# ===========================
+class ResponseCache:
+    """LRU cache of router replies keyed on normalized prompt + tone + model chain"""
+    ENTRY_OVERHEAD = 200  # rough per-entry bookkeeping cost in bytes
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 default_ttl: float = CACHE_DEFAULT_TTL, tone_ttls: Dict[str, float] = None,
+                 enabled: bool = CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.tone_ttls = tone_ttls if tone_ttls is not None else parse_tone_ttls(CACHE_TONE_TTLS)
+        self.enabled = enabled
+        # key -> (value, expires_at, size, tone, prompt_key)
+        self._entries: "OrderedDict[str, Tuple[str, float, int, str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.bypasses = 0
+        self.invalidations = 0
+
+    def ttl_for(self, tone: str) -> float:
+        return self.tone_ttls.get(tone, self.default_ttl)
+
+    @staticmethod
+    def make_key(prompt: str, tone: str, chain: Sequence[str]) -> str:
+        raw = "\x1f".join([normalize_prompt(prompt), tone, ",".join(chain)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _prompt_key(prompt: str) -> str:
+        return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry[2]
+
+    def get(self, prompt: str, tone: str, chain: Sequence[str]) -> Optional[str]:
+        if not self.enabled or self.ttl_for(tone) <= 0:
+            return None
+        key = self.make_key(prompt, tone, chain)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] <= monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, prompt: str, tone: str, chain: Sequence[str], value: str) -> None:
+        ttl = self.ttl_for(tone)
+        if not self.enabled or ttl <= 0:
+            return
+        size = sys.getsizeof(value) + self.ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        key = self.make_key(prompt, tone, chain)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, monotonic() + ttl, size, tone, self._prompt_key(prompt))
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypasses += 1
+
+    def invalidate(self, prompt: str = None, tone: str = None) -> int:
+        """Drop entries matching prompt and/or tone (every chain); with no arguments, drop everything"""
+        prompt_key = self._prompt_key(prompt) if prompt is not None else None
+        with self._lock:
+            keys = [
+                key for key, entry in self._entries.items()
+                if (tone is None or entry[3] == tone) and (prompt_key is None or entry[4] == prompt_key)
+            ]
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / max(lookups, 1), 4),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "bypasses": self.bypasses,
+                "invalidations": self.invalidations,
+                "default_ttl": self.default_ttl,
+                "tone_ttls": dict(self.tone_ttls)
+            }
+
+# ===========================
+# SINGLE-FLIGHT COALESCING
+# ===========================
+class LeaderAbandoned(Exception):
+    """The call that followers were waiting on was cancelled before it produced a result"""
+
+class SingleFlight:
+    """Lets concurrent identical requests share one upstream call, across threads and event loops"""
+    def __init__(self):
+        # A concurrent.futures.Future can be awaited from any loop and waited on from any thread
+        self._calls: Dict[str, concurrent.futures.Future] = {}
+        self._waiters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.peak_waiters = 0
+
+    def _join(self, key: str) -> Tuple[concurrent.futures.Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = concurrent.futures.Future()
+                self._calls[key] = future
+                self._waiters[key] = 0
+                self.leaders += 1
+                return future, True
+            self._waiters[key] += 1
+            self.coalesced += 1
+            self.peak_waiters = max(self.peak_waiters, self._waiters[key])
+            return future, False
+
+    def _finish(self, key: str, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+                self._waiters.pop(key, None)
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """Run call() once per key at a time; concurrent callers with the same key await its result"""
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = await call()
+                except asyncio.CancelledError:
+                    future.set_exception(LeaderAbandoned(key))
+                    raise
+                except BaseException as e:
+                    future.set_exception(e)
+                    raise
+                else:
+                    future.set_result(result)
+                    return result
+                finally:
+                    self._finish(key, future)
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+            except LeaderAbandoned:
+                # The leader's caller went away; take over instead of inheriting its cancellation
+                continue
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "current_waiters": sum(self._waiters.values()),
+                "leaders": self.leaders,
+                "coalesced_waiters": self.coalesced,
+                "peak_waiters": self.peak_waiters
+            }
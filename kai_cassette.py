@@ -0,0 +1,328 @@
+"""
+Kai Cassette - record/replay of provider HTTP traffic for offline, repeatable performance runs
+An httpx transport that writes real request/response pairs with timing to disk, or serves them back
+"""
+
+import os
+import json
+import gzip
+import queue
+import atexit
+import base64
+import asyncio
+import hashlib
+import logging
+import threading
+from itertools import count
+from time import monotonic, sleep
+from typing import Dict, Any, List, Optional, Iterator, AsyncIterator, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# CONFIGURATION
+# ===========================
+CASSETTE_MODE = os.getenv("KAI_CASSETTE_MODE", "off").lower()  # off | record | replay
+CASSETTE_PATH = os.getenv("KAI_CASSETTE_PATH", "kai_cassette.jsonl.gz")
+CASSETTE_LATENCY_SCALE = float(os.getenv("KAI_CASSETTE_LATENCY_SCALE", "1.0"))  # 0 replays instantly
+# Strict replay fails unknown requests; otherwise they get the next recording for the same endpoint
+CASSETTE_STRICT = os.getenv("KAI_CASSETTE_STRICT", "false").lower() == "true"
+
+# Only what the router reads back is kept; auth and cookies never reach the cassette
+RECORDED_HEADER_PREFIXES = ("content-type", "retry-after", "x-ratelimit-", "anthropic-ratelimit-", "openai-processing-ms")
+
+class CassetteMiss(httpx.TransportError):
+    """Replay found no recording for a request"""
+
+def request_key(method: str, url: httpx.URL, body: bytes) -> str:
+    """Stable identity of a request: method, URL without query, and the JSON body with sorted keys"""
+    try:
+        canonical = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8") if body else b""
+    except ValueError:
+        canonical = body
+    digest = hashlib.sha256(f"{method} {url.copy_with(query=None)}\n".encode("utf-8") + canonical)
+    return digest.hexdigest()[:24]
+
+def endpoint_key(method: str, url: httpx.URL) -> str:
+    return f"{method} {url.host}{url.path}"
+
+def _encode_chunk(offset: float, chunk: bytes) -> List[Any]:
+    try:
+        return [round(offset, 4), chunk.decode("utf-8")]
+    except UnicodeDecodeError:
+        return [round(offset, 4), base64.b64encode(chunk).decode("ascii"), "b64"]
+
+def _decode_chunk(entry: List[Any]) -> Tuple[float, bytes]:
+    offset, data = entry[0], entry[1]
+    return offset, base64.b64decode(data) if len(entry) > 2 else data.encode("utf-8")
+
+# ===========================
+# CASSETTE
+# ===========================
+class Cassette:
+    """Recordings on disk as gzipped JSON lines, one exchange per line, written by a background thread"""
+    def __init__(self, path: str = CASSETTE_PATH, mode: str = CASSETTE_MODE, latency_scale: float = CASSETTE_LATENCY_SCALE,
+                 strict: bool = CASSETTE_STRICT):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Invalid cassette mode: {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_endpoint: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursors: Dict[str, Iterator[int]] = {}
+        # Recording: lines queue up for one writer thread holding the file open, so callers never do file I/O
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self.entries = 0
+        self.recorded = 0
+        self.replayed = 0
+        self.fallback_replays = 0
+        self.misses = 0
+        if mode == "replay":
+            self._load()
+        else:
+            atexit.register(self.close)
+
+    def _load(self) -> None:
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+        except FileNotFoundError:
+            logger.error(f"Cassette {self.path} not found; every provider request will miss")
+        except (OSError, EOFError, ValueError) as e:
+            # A recording interrupted mid-write leaves a truncated last line; keep what was read
+            logger.warning(f"Cassette {self.path} partially loaded ({self.entries} entries): {e}")
+        logger.info(f"Cassette loaded for replay: {self.entries} exchanges from {self.path}")
+
+    def _index(self, entry: Dict[str, Any]) -> None:
+        self._by_key.setdefault(entry["key"], []).append(entry)
+        self._by_endpoint.setdefault(entry["endpoint"], []).append(entry)
+        self.entries += 1
+
+    def save(self, entry: Dict[str, Any]) -> None:
+        """Queue an exchange for the writer thread; safe to call from the router event loop"""
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="kai-cassette-writer", daemon=True)
+                self._writer.start()
+            self.recorded += 1
+            self.entries += 1
+        self._queue.put(line)
+
+    def _write_loop(self) -> None:
+        # One gzip member per writer, appended to earlier ones (gzip readers see one continuous stream).
+        # A sync flush after each burst means a crash loses at most the exchanges still queued.
+        try:
+            f = gzip.open(self.path, "at", encoding="utf-8")
+        except OSError as e:
+            logger.error(f"Cassette {self.path} cannot be opened for recording: {e}")
+            f = None
+        while True:
+            line = self._queue.get()
+            try:
+                if line is None:
+                    break
+                if f is not None:
+                    f.write(line)
+                    if self._queue.empty():
+                        f.flush()
+            except OSError as e:
+                logger.error(f"Cassette write failed: {e}")
+            finally:
+                self._queue.task_done()
+        if f is not None:
+            f.close()
+
+    def flush(self) -> None:
+        """Block until every queued exchange has been written"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Write what is queued and finish the gzip stream; a later save starts a new writer"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+
+    def find(self, key: str, endpoint: str) -> Optional[Dict[str, Any]]:
+        """The recording for this exact request (cycling through repeats), else one for the same endpoint"""
+        with self._lock:
+            candidates, cursor_key = self._by_key.get(key), key
+            if not candidates and not self.strict:
+                candidates, cursor_key = self._by_endpoint.get(endpoint), endpoint
+                if candidates:
+                    self.fallback_replays += 1
+            if not candidates:
+                self.misses += 1
+                return None
+            self.replayed += 1
+            return candidates[next(self._cursors.setdefault(cursor_key, count())) % len(candidates)]
+
+    def transport(self, inner: Any = None) -> "CassetteTransport":
+        return CassetteTransport(self, inner)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": self.path,
+                "latency_scale": self.latency_scale,
+                "strict": self.strict,
+                "entries": self.entries,
+                "recorded": self.recorded,
+                "pending_writes": self._queue.qsize(),
+                "replayed": self.replayed,
+                "fallback_replays": self.fallback_replays,
+                "misses": self.misses
+            }
+
+# ===========================
+# TRANSPORT
+# ===========================
+class _RecordingStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Passes the real body through, timestamping chunks; the exchange is saved once the body is closed"""
+    def __init__(self, cassette: Cassette, entry: Dict[str, Any], stream: Any, started: float):
+        self._cassette = cassette
+        self._entry = entry
+        self._stream = stream
+        self._started = started
+        self._saved = False
+
+    def _chunk(self, chunk: bytes) -> None:
+        self._entry["chunks"].append(_encode_chunk(monotonic() - self._started, chunk))
+
+    def _save(self) -> None:
+        if not self._saved:
+            self._saved = True
+            self._entry["elapsed"] = round(monotonic() - self._started, 4)
+            self._cassette.save(self._entry)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            self._chunk(chunk)
+            yield chunk
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            self._chunk(chunk)
+            yield chunk
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._save()
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._save()
+
+class _ReplayStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Recorded chunks released on their original schedule, scaled"""
+    def __init__(self, chunks: List[List[Any]], ttfb: float, scale: float):
+        self._chunks = [_decode_chunk(chunk) for chunk in chunks]
+        self._ttfb = ttfb
+        self._scale = scale
+
+    def _delays(self) -> Iterator[Tuple[float, bytes]]:
+        previous = self._ttfb
+        for offset, data in self._chunks:
+            yield max(0.0, offset - previous) * self._scale, data
+            previous = max(previous, offset)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for delay, data in self._delays():
+            if delay:
+                sleep(delay)
+            yield data
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for delay, data in self._delays():
+            if delay:
+                await asyncio.sleep(delay)
+            yield data
+
+class CassetteTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Records through, or replays instead of, the provider pool's transport; works for sync and async clients"""
+    def __init__(self, cassette: Cassette, inner: Any = None):
+        self.cassette = cassette
+        self.inner = inner
+
+    def _entry(self, request: httpx.Request, response: httpx.Response, ttfb: float) -> Dict[str, Any]:
+        return {
+            "key": request_key(request.method, request.url, request.content),
+            "endpoint": endpoint_key(request.method, request.url),
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.items() if k.lower().startswith(RECORDED_HEADER_PREFIXES)],
+            "ttfb": round(ttfb, 4),
+            "chunks": []
+        }
+
+    def _replay(self, request: httpx.Request) -> Tuple[httpx.Response, float]:
+        entry = self.cassette.find(request_key(request.method, request.url, request.content),
+                                   endpoint_key(request.method, request.url))
+        if entry is None:
+            raise CassetteMiss(f"No cassette recording for {request.method} {request.url}", request=request)
+        stream = _ReplayStream(entry["chunks"], entry["ttfb"], self.cassette.latency_scale)
+        response = httpx.Response(entry["status"], headers=entry["headers"], stream=stream, request=request)
+        return response, entry["ttfb"] * self.cassette.latency_scale
+
+    def _prepare_record(self, request: httpx.Request) -> None:
+        # Plain bodies keep the cassette readable and replayable without re-encoding
+        request.headers["Accept-Encoding"] = "identity"
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        if self.cassette.mode == "replay":
+            response, wait = self._replay(request)
+            if wait:
+                sleep(wait)
+            return response
+        self._prepare_record(request)
+        started = monotonic()
+        response = self.inner.handle_request(request)
+        entry = self._entry(request, response, monotonic() - started)
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_RecordingStream(self.cassette, entry, response.stream, started),
+                              extensions=response.extensions, request=request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        if self.cassette.mode == "replay":
+            response, wait = self._replay(request)
+            if wait:
+                await asyncio.sleep(wait)
+            return response
+        self._prepare_record(request)
+        started = monotonic()
+        response = await self.inner.handle_async_request(request)
+        entry = self._entry(request, response, monotonic() - started)
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_RecordingStream(self.cassette, entry, response.stream, started),
+                              extensions=response.extensions, request=request)
+
+    def close(self) -> None:
+        if self.inner is not None:
+            self.inner.close()
+
+    async def aclose(self) -> None:
+        if self.inner is not None:
+            await self.inner.aclose()
+
+def cassette_from_env() -> Optional[Cassette]:
+    if CASSETTE_MODE in ("", "off", "false"):
+        return None
+    cassette = Cassette()
+    logger.warning(f"Provider cassette active: {cassette.mode} {cassette.path} (latency x{cassette.latency_scale})")
+    return cassette
@@ -0,0 +1,275 @@
+"""
+Kai Conversations - bounded per-user conversation memory for the brain router
+Recent turns verbatim, older turns folded into a running summary, idle users evicted LRU-first
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Set, Tuple
+
+from kai_tokens import estimate_tokens, trim_middle
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# CONFIGURATION
+# ===========================
+CONVERSATION_MAX_USERS = int(os.getenv("KAI_CONVERSATION_MAX_USERS", "2000"))
+CONVERSATION_IDLE_SECONDS = float(os.getenv("KAI_CONVERSATION_IDLE_SECONDS", "3600"))
+CONVERSATION_WINDOW_TURNS = int(os.getenv("KAI_CONVERSATION_WINDOW_TURNS", "12"))  # messages kept verbatim
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("KAI_CONVERSATION_TOKEN_BUDGET", "1500"))  # history sent per request
+SUMMARY_TOKEN_BUDGET = int(os.getenv("KAI_CONVERSATION_SUMMARY_TOKENS", "300"))
+MAX_TURN_CHARS = int(os.getenv("KAI_CONVERSATION_MAX_TURN_CHARS", "4000"))  # longer turns are stored middle-trimmed
+# Compaction keeps this share of the window verbatim, so one summary call covers several exchanges
+COMPACT_KEEP_SHARE = 0.5
+
+# ===========================
+# CONVERSATION STATE
+# ===========================
+class Turn:
+    """One message in a conversation, with its token estimate computed once"""
+    __slots__ = ("role", "text", "tokens")
+
+    def __init__(self, role: str, text: str):
+        self.role = role
+        self.text = trim_middle(text, MAX_TURN_CHARS)
+        self.tokens = estimate_tokens(f"{role}: {self.text}")
+
+    def render(self) -> str:
+        return f"{'User' if self.role == 'user' else 'Kai'}: {self.text}"
+
+class Conversation:
+    """A user's recent turns plus a summary of everything older"""
+    __slots__ = ("turns", "summary", "summary_tokens", "last_active", "compacting", "compactions")
+
+    def __init__(self):
+        self.turns: List[Turn] = []
+        self.summary = ""
+        self.summary_tokens = 0
+        self.last_active = monotonic()
+        self.compacting = False
+        self.compactions = 0
+
+    @property
+    def turn_tokens(self) -> int:
+        return sum(turn.tokens for turn in self.turns)
+
+def fit_summary(text: str, max_tokens: int = SUMMARY_TOKEN_BUDGET) -> str:
+    """Cap a summary at max_tokens, dropping its oldest (leading) text first"""
+    text = text.strip()
+    while text and estimate_tokens(text) > max_tokens:
+        text = text[len(text) // 4:].lstrip()
+    return text
+
+def extractive_summary(summary: str, turns: List[Turn]) -> str:
+    """Fallback when no model is available: the previous summary plus the opening of each folded turn"""
+    lines = [summary] if summary else []
+    for turn in turns:
+        opening = turn.text.split("\n", 1)[0][:160]
+        lines.append(f"{'User' if turn.role == 'user' else 'Kai'}: {opening}")
+    return fit_summary("\n".join(lines))
+
+# Summarizer(previous summary, turns to fold in) -> new summary; may raise, then the extractive fallback is used
+Summarizer = Callable[[str, List[Turn]], Awaitable[str]]
+
+# ===========================
+# CONVERSATION STORE
+# ===========================
+class ConversationStore:
+    """Per-user history with a fixed token budget per request; memory bounded by user count and idle time"""
+    def __init__(self, summarize: Optional[Summarizer] = None, max_users: int = CONVERSATION_MAX_USERS,
+                 idle_seconds: float = CONVERSATION_IDLE_SECONDS, window_turns: int = CONVERSATION_WINDOW_TURNS,
+                 token_budget: int = CONVERSATION_TOKEN_BUDGET):
+        self.summarize = summarize
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self.window_turns = max(2, window_turns)
+        self.token_budget = token_budget
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+        self.compactions = 0
+        self.compaction_failures = 0
+        self.turns_dropped = 0
+        self.prompts_built = 0
+        self.history_tokens_sent = 0
+
+    def _evict_locked(self, now: float) -> None:
+        # Least recently active users sit at the front, so idle ones are popped without scanning the rest
+        while self._conversations:
+            user, conversation = next(iter(self._conversations.items()))
+            if now - conversation.last_active > self.idle_seconds:
+                self.evicted_idle += 1
+            elif len(self._conversations) > self.max_users:
+                self.evicted_lru += 1
+            else:
+                break
+            del self._conversations[user]
+
+    def _get_locked(self, user: str, create: bool) -> Optional[Conversation]:
+        now = monotonic()
+        self._evict_locked(now)
+        conversation = self._conversations.get(user)
+        if conversation is None and create:
+            conversation = self._conversations[user] = Conversation()
+            self._evict_locked(now)
+        if conversation is not None:
+            conversation.last_active = now
+            self._conversations.move_to_end(user)
+        return conversation
+
+    def build_prompt(self, user: str, message: str) -> str:
+        """The message with as much recent history as fits the token budget; unchanged for a new user"""
+        with self._lock:
+            conversation = self._get_locked(user, create=False)
+            if conversation is None or not (conversation.turns or conversation.summary):
+                return message
+            summary = conversation.summary
+            room = self.token_budget - conversation.summary_tokens
+            recent: List[str] = []
+            # Newest first, stopping at the first turn that does not fit so the window stays contiguous
+            for turn in reversed(conversation.turns):
+                if turn.tokens > room:
+                    break
+                room -= turn.tokens
+                recent.append(turn.render())
+            self.prompts_built += 1
+            self.history_tokens_sent += self.token_budget - room
+        sections = []
+        if summary:
+            sections.append(f"[Earlier in this conversation]\n{summary}")
+        if recent:
+            sections.append("[Recent messages]\n" + "\n".join(reversed(recent)))
+        sections.append(f"[Current message]\n{message}")
+        return "\n\n".join(sections)
+
+    def record(self, user: str, message: str, reply: str) -> None:
+        """Append an exchange and start background compaction once the window or budget overflows"""
+        turns = [Turn("user", message), Turn("assistant", reply)]
+        with self._lock:
+            conversation = self._get_locked(user, create=True)
+            conversation.turns.extend(turns)
+            # Hard cap while a slow compaction is pending: fold the overflow extractively right away
+            overflow = len(conversation.turns) - 2 * self.window_turns
+            if overflow > 0:
+                dropped = conversation.turns[:overflow]
+                del conversation.turns[:overflow]
+                conversation.summary = extractive_summary(conversation.summary, dropped)
+                conversation.summary_tokens = estimate_tokens(conversation.summary)
+                self.turns_dropped += overflow
+            due = (len(conversation.turns) > self.window_turns
+                   or conversation.turn_tokens + conversation.summary_tokens > self.token_budget)
+            if not due or conversation.compacting:
+                return
+            conversation.compacting = True
+        self._schedule(user)
+
+    def _schedule(self, user: str) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None or self.summarize is None:
+            # No loop to summarize on (a plain sync caller) or no summarizer: fold extractively, inline
+            folding, previous = self._begin_compaction(user)
+            self._finish_compaction(user, folding, previous, extractive_summary(previous, folding) if folding else "")
+            return
+        task = loop.create_task(self.compact(user))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _begin_compaction(self, user: str) -> Tuple[List[Turn], str]:
+        keep = max(2, int(self.window_turns * COMPACT_KEEP_SHARE))
+        with self._lock:
+            conversation = self._conversations.get(user)
+            if conversation is None:
+                return [], ""
+            # Also fold turns that push the history over budget, so one long exchange cannot crowd out the rest
+            count = max(0, len(conversation.turns) - keep)
+            while count < len(conversation.turns) - 2 and \
+                    sum(t.tokens for t in conversation.turns[count:]) + SUMMARY_TOKEN_BUDGET > self.token_budget:
+                count += 1
+            return conversation.turns[:count], conversation.summary
+
+    def _finish_compaction(self, user: str, folding: List[Turn], previous: str, summary: str) -> bool:
+        with self._lock:
+            conversation = self._conversations.get(user)
+            if conversation is None:
+                return False
+            conversation.compacting = False
+            if not folding:
+                return False
+            # Only appends happen meanwhile, so the folded turns are still the oldest; any the hard cap
+            # dropped in the meantime were already folded into the summary, so keep that text too
+            folded = {id(turn) for turn in folding}
+            conversation.turns = [turn for turn in conversation.turns if id(turn) not in folded]
+            if conversation.summary != previous:
+                summary = fit_summary(f"{conversation.summary}\n{summary}")
+            conversation.summary = summary
+            conversation.summary_tokens = estimate_tokens(summary)
+            conversation.compactions += 1
+            self.compactions += 1
+        logger.info(f"Compacted {len(folding)} conversation turns into the summary")
+        return True
+
+    async def compact(self, user: str) -> bool:
+        """Fold the oldest turns into the summary, keeping the newest part of the window verbatim"""
+        folding, previous = self._begin_compaction(user)
+        summary = ""
+        if folding and self.summarize is not None:
+            try:
+                summary = fit_summary(await self.summarize(previous, folding))
+            except Exception as e:
+                logger.warning(f"Conversation summary failed, using extractive fallback: {e}")
+            if not summary:
+                with self._lock:
+                    self.compaction_failures += 1
+        if folding and not summary:
+            summary = extractive_summary(previous, folding)
+        return self._finish_compaction(user, folding, previous, summary)
+
+    def forget(self, user: str) -> bool:
+        with self._lock:
+            return self._conversations.pop(user, None) is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conversations.clear()
+
+    def get_user_stats(self, user: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            conversation = self._conversations.get(user)
+            if conversation is None:
+                return None
+            return {
+                "turns": len(conversation.turns),
+                "turn_tokens": conversation.turn_tokens,
+                "summary_tokens": conversation.summary_tokens,
+                "compactions": conversation.compactions,
+                "idle_seconds": round(monotonic() - conversation.last_active, 1)
+            }
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._evict_locked(monotonic())
+            return {
+                "users": len(self._conversations),
+                "max_users": self.max_users,
+                "idle_seconds": self.idle_seconds,
+                "window_turns": self.window_turns,
+                "token_budget": self.token_budget,
+                "turns_stored": sum(len(c.turns) for c in self._conversations.values()),
+                "compactions": self.compactions,
+                "compaction_failures": self.compaction_failures,
+                "compactions_pending": len(self._tasks),
+                "turns_dropped": self.turns_dropped,
+                "evicted_lru": self.evicted_lru,
+                "evicted_idle": self.evicted_idle,
+                "avg_history_tokens": round(self.history_tokens_sent / self.prompts_built, 1) if self.prompts_built else None
+            }
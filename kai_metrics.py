@@ -0,0 +1,252 @@
+"""
+Kai Metrics - fixed-size performance accounting for the brain router
+Log-bucketed latency histograms and counters: O(1) to record, constant memory, percentiles on read
+"""
+
+import math
+import threading
+from time import monotonic
+from typing import Dict, Any, List, Optional, Tuple
+
+# ===========================
+# CONFIGURATION
+# ===========================
+HISTOGRAM_MIN_SECONDS = 0.001
+HISTOGRAM_MAX_SECONDS = 600.0
+HISTOGRAM_GROWTH = 1.08     # bucket width ratio; reported percentiles are within ~4% of the true value
+MAX_FALLBACK_DEPTH = 8
+WINDOW_SLOT_SECONDS = 10     # sliding windows advance in steps of this size
+
+# ===========================
+# LATENCY HISTOGRAM
+# ===========================
+class LatencyHistogram:
+    """Geometric buckets from 1 ms to 10 min; recording is one log() and an increment under a short lock"""
+    def __init__(self, min_seconds: float = HISTOGRAM_MIN_SECONDS, max_seconds: float = HISTOGRAM_MAX_SECONDS,
+                 growth: float = HISTOGRAM_GROWTH):
+        self.min_seconds = min_seconds
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        # Bucket 0 holds everything at or below min_seconds, the last bucket everything above max_seconds
+        self.num_buckets = int(math.ceil(math.log(max_seconds / min_seconds) / self._log_growth)) + 2
+        self._counts = [0] * self.num_buckets
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _index(self, seconds: float) -> int:
+        if seconds <= self.min_seconds:
+            return 0
+        return min(self.num_buckets - 1, 1 + int(math.log(seconds / self.min_seconds) / self._log_growth))
+
+    def bucket_upper_bound(self, index: int) -> float:
+        return self.min_seconds * self.growth ** index
+
+    def _bucket_value(self, index: int) -> float:
+        # Geometric midpoint of the bucket halves the worst-case relative error
+        if index == 0:
+            return self.min_seconds
+        return self.min_seconds * self.growth ** (index - 0.5)
+
+    def record(self, seconds: float) -> None:
+        index = self._index(seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self) -> Tuple[List[int], int, float, float]:
+        with self._lock:
+            return list(self._counts), self.count, self.total, self.max
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        counts, count, total, maximum = other.snapshot()
+        with self._lock:
+            for i, n in enumerate(counts):
+                self._counts[i] += n
+            self.count += count
+            self.total += total
+            self.max = max(self.max, maximum)
+
+    def cumulative_counts(self, bounds: Tuple[float, ...]) -> Tuple[List[int], int, float]:
+        """Samples at or below each of the ascending bounds, plus count and sum, for fixed-bucket exporters.
+        A bound snaps down to the nearest bucket edge, so it may leave out up to one bucket width (~8%) of samples."""
+        counts, count, total, _ = self.snapshot()
+        cumulative, seen, index = [], 0, 0
+        for bound in bounds:
+            while index < self.num_buckets - 1 and self.bucket_upper_bound(index) <= bound * (1 + 1e-9):
+                seen += counts[index]
+                index += 1
+            cumulative.append(seen)
+        return cumulative, count, total
+
+    def percentiles(self, pcts: Tuple[float, ...] = (50, 90, 99)) -> Dict[float, Optional[float]]:
+        counts, count, _, maximum = self.snapshot()
+        if not count:
+            return {pct: None for pct in pcts}
+        results = {}
+        for pct in pcts:
+            rank = max(1, math.ceil(pct / 100.0 * count))
+            seen = 0
+            for index, n in enumerate(counts):
+                seen += n
+                if seen >= rank:
+                    results[pct] = min(self._bucket_value(index), maximum)
+                    break
+        return results
+
+    def percentile(self, pct: float) -> Optional[float]:
+        return self.percentiles((pct,))[pct]
+
+    def summary(self, pcts: Tuple[float, ...] = (50, 90, 99)) -> Dict[str, Any]:
+        values = self.percentiles(pcts)
+        _, count, total, maximum = self.snapshot()
+        summary: Dict[str, Any] = {"count": count}
+        for pct, value in values.items():
+            summary[f"p{pct:g}_ms"] = round(value * 1000, 1) if value is not None else None
+        summary["mean_ms"] = round(total / count * 1000, 1) if count else None
+        summary["max_ms"] = round(maximum * 1000, 1) if count else None
+        return summary
+
+class WindowedHistogram:
+    """Latency and error counts over the last few minutes: a ring of short-slot histograms, merged on read"""
+    def __init__(self, horizon_seconds: float = 900, slot_seconds: float = WINDOW_SLOT_SECONDS):
+        self.slot_seconds = slot_seconds
+        self.num_slots = int(math.ceil(horizon_seconds / slot_seconds))
+        # Each slot is [tick, histogram, errors]; a slot is reused once its tick falls out of the horizon
+        self._slots: List[Optional[List[Any]]] = [None] * self.num_slots
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, error: bool = False, now: Optional[float] = None) -> None:
+        tick = int((monotonic() if now is None else now) // self.slot_seconds)
+        index = tick % self.num_slots
+        with self._lock:
+            slot = self._slots[index]
+            if slot is None or slot[0] != tick:
+                slot = self._slots[index] = [tick, LatencyHistogram(), 0]
+            slot[1].record(seconds)
+            if error:
+                slot[2] += 1
+
+    def summary(self, window_seconds: float, pcts: Tuple[float, ...] = (50, 95, 99),
+                now: Optional[float] = None) -> Dict[str, Any]:
+        """Requests, rate, errors and percentiles for the last window_seconds (whole slots, current one included)"""
+        tick = int((monotonic() if now is None else now) // self.slot_seconds)
+        oldest = tick - min(self.num_slots, int(math.ceil(window_seconds / self.slot_seconds))) + 1
+        merged = LatencyHistogram()
+        errors = 0
+        with self._lock:
+            slots = [slot for slot in self._slots if slot is not None and oldest <= slot[0] <= tick]
+        for _, histogram, slot_errors in slots:
+            merged.merge(histogram)
+            errors += slot_errors
+        summary = merged.summary(pcts)
+        summary["requests_per_second"] = round(merged.count / window_seconds, 3)
+        summary["errors"] = errors
+        summary["error_rate"] = round(errors / merged.count, 4) if merged.count else None
+        return summary
+
+# ===========================
+# PROVIDER METRICS
+# ===========================
+class ProviderMetrics:
+    """Per-provider, per-tone latency plus retries, errors, fallback depth and token usage"""
+    def __init__(self):
+        self._latency: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._fallback_depth: Dict[str, List[int]] = {}
+        self._all_failed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _provider(self, provider: str) -> Dict[str, int]:
+        counters = self._counters.get(provider)
+        if counters is None:
+            counters = self._counters.setdefault(provider, {
+                "calls": 0, "errors": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "cached_prompt_tokens": 0
+            })
+        return counters
+
+    def record_call(self, provider: str, tone: Optional[str], seconds: float, success: bool) -> None:
+        """tone=None counts the call against the provider without adding it to any per-tone latency"""
+        key = (provider, tone)
+        histogram = self._latency.get(key)
+        with self._lock:
+            counters = self._provider(provider)
+            counters["calls"] += 1
+            if not success:
+                counters["errors"] += 1
+            if tone is None:
+                return
+            if success and histogram is None:
+                histogram = self._latency.setdefault(key, LatencyHistogram())
+        if success:
+            histogram.record(seconds)
+
+    def record_retry(self, provider: str) -> None:
+        with self._lock:
+            self._provider(provider)["retries"] += 1
+
+    def record_usage(self, provider: str, usage: Dict[str, Any]) -> None:
+        """Accepts OpenAI/OpenRouter (prompt/completion_tokens) and Anthropic (input/output_tokens) usage"""
+        prompt_tokens = usage.get("prompt_tokens", usage.get("input_tokens")) or 0
+        completion_tokens = usage.get("completion_tokens", usage.get("output_tokens")) or 0
+        # Prompt tokens the provider served from its prompt cache, in whichever shape it reports them
+        details = usage.get("prompt_tokens_details")
+        cached_tokens = (usage.get("cached_prompt_tokens") or usage.get("cache_read_input_tokens")
+                         or (details.get("cached_tokens") if isinstance(details, dict) else 0) or 0)
+        if not prompt_tokens and not completion_tokens:
+            return
+        with self._lock:
+            counters = self._provider(provider)
+            counters["prompt_tokens"] += int(prompt_tokens)
+            counters["completion_tokens"] += int(completion_tokens)
+            counters["cached_prompt_tokens"] += int(cached_tokens)
+
+    def record_fallback_depth(self, tone: str, depth: Optional[int]) -> None:
+        """depth is the chain position that answered (0 = first choice), or None if every provider failed"""
+        with self._lock:
+            if depth is None:
+                self._all_failed[tone] = self._all_failed.get(tone, 0) + 1
+                return
+            depths = self._fallback_depth.setdefault(tone, [0] * MAX_FALLBACK_DEPTH)
+            depths[min(depth, MAX_FALLBACK_DEPTH - 1)] += 1
+
+    def snapshot(self) -> Tuple[Dict[str, Dict[str, int]], Dict[Tuple[str, str], LatencyHistogram]]:
+        """Counter copies and the live (provider, tone) histograms, without computing any percentiles"""
+        with self._lock:
+            return {provider: dict(values) for provider, values in self._counters.items()}, dict(self._latency)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {provider: dict(values) for provider, values in self._counters.items()}
+            histograms = dict(self._latency)
+            depths = {tone: list(values) for tone, values in self._fallback_depth.items()}
+            all_failed = dict(self._all_failed)
+        providers: Dict[str, Any] = {}
+        for provider, values in counters.items():
+            merged = LatencyHistogram()
+            tones = {}
+            for (name, tone), histogram in histograms.items():
+                if name == provider:
+                    merged.merge(histogram)
+                    tones[tone] = histogram.summary()
+            providers[provider] = {
+                **values,
+                "total_tokens": values["prompt_tokens"] + values["completion_tokens"],
+                "latency": merged.summary(),
+                "latency_by_tone": tones
+            }
+        fallback = {}
+        for tone in set(depths) | set(all_failed):
+            counts = depths.get(tone, [0] * MAX_FALLBACK_DEPTH)
+            answered = sum(counts)
+            fallback[tone] = {
+                "answered_by_position": {str(i): n for i, n in enumerate(counts) if n},
+                "all_failed": all_failed.get(tone, 0),
+                "mean_depth": round(sum(i * n for i, n in enumerate(counts)) / answered, 3) if answered else None
+            }
+        return {"providers": providers, "fallback_depth": fallback}
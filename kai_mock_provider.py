@@ -0,0 +1,145 @@
+"""
+Kai Mock Provider - deterministic offline stand-in for an LLM backend
+Seeded latency distributions, error rates and response sizes for load testing without network access
+"""
+
+import os
+import asyncio
+import hashlib
+import random
+import threading
+from typing import Dict, Any, Optional, Tuple, AsyncIterator
+
+# ===========================
+# CONFIGURATION
+# ===========================
+# Every setting reads KAI_<NAME>_<SETTING> first (e.g. KAI_MOCK_SLOW_LATENCY), then the shared KAI_MOCK_<SETTING>
+DEFAULT_LATENCY = "lognormal:0.8,0.35"   # lognormal:<median s>,<sigma> | uniform:<low>,<high> | fixed:<s>
+DEFAULT_ERROR_RATE = "0.02"
+DEFAULT_ERROR_STATUS = "503"             # 429/5xx are retried by the router, 4xx are not
+DEFAULT_RESPONSE_WORDS = "150,400"       # uniform range of reply length in words
+DEFAULT_STREAM_CHUNK_WORDS = "8"
+DEFAULT_SEED = "42"
+
+WORDS = (
+    "kai flow energy clarity build launch create content scroll system growth vision focus simple next step "
+    "today practice gentle powerful data model code deploy automate strategy audience value freedom abundance"
+).split()
+
+def mock_setting(name: str, setting: str, default: str) -> str:
+    return os.getenv(f"KAI_{name.upper()}_{setting}", os.getenv(f"KAI_MOCK_{setting}", default))
+
+class MockProviderError(Exception):
+    """Simulated provider failure; status_code drives the router's retry classification"""
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+class LatencyDistribution:
+    """Parsed from 'lognormal:<median>,<sigma>', 'uniform:<low>,<high>' or 'fixed:<seconds>'"""
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.params = [float(p) for p in params.split(",") if p.strip()]
+        if self.kind not in ("lognormal", "uniform", "fixed") or not self.params:
+            raise ValueError(f"Invalid mock latency spec: {spec!r}")
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(self.params[0], self.params[-1])
+        median, sigma = self.params[0], self.params[1] if len(self.params) > 1 else 0.0
+        return median * rng.lognormvariate(0.0, sigma)
+
+class MockProvider:
+    """Fake completion backend; the same seed, prompts and call order always give the same outcomes"""
+    def __init__(self, name: str = "mock", latency: str = None, error_rate: float = None, error_status: int = None,
+                 response_words: Tuple[int, int] = None, seed: int = None):
+        self.name = name
+        self.latency = LatencyDistribution(latency or mock_setting(name, "LATENCY", DEFAULT_LATENCY))
+        self.error_rate = error_rate if error_rate is not None else float(mock_setting(name, "ERROR_RATE", DEFAULT_ERROR_RATE))
+        self.error_status = error_status or int(mock_setting(name, "ERROR_STATUS", DEFAULT_ERROR_STATUS))
+        if response_words is None:
+            low, _, high = mock_setting(name, "RESPONSE_WORDS", DEFAULT_RESPONSE_WORDS).partition(",")
+            response_words = (int(low), int(high or low))
+        self.response_words = response_words
+        self.chunk_words = max(1, int(mock_setting(name, "STREAM_CHUNK_WORDS", DEFAULT_STREAM_CHUNK_WORDS)))
+        self.seed = seed if seed is not None else int(mock_setting(name, "SEED", DEFAULT_SEED))
+        self._lock = threading.Lock()
+        self._calls = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def _plan(self, prompt: str) -> Tuple[float, bool, str]:
+        # Seeded per call from (seed, prompt, call number) so runs replay exactly, independent of global random
+        with self._lock:
+            self._calls += 1
+            call_number = self._calls
+        digest = hashlib.sha256(f"{self.seed}:{self.name}:{call_number}:{prompt}".encode("utf-8")).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big"))
+        latency = self.latency.sample(rng)
+        failed = rng.random() < self.error_rate
+        words = [rng.choice(WORDS) for _ in range(rng.randint(*self.response_words))]
+        # The prompt is echoed in the reply so distinct prompts never look like duplicates to the router
+        text = f"[{self.name}] {prompt[:80]}\n\n" + " ".join(words).capitalize() + "."
+        return latency, failed, text
+
+    async def _wait(self, latency: float, timeout: Optional[float]) -> None:
+        if timeout is not None and latency > timeout:
+            await asyncio.sleep(timeout)
+            with self._lock:
+                self.timeouts += 1
+            raise asyncio.TimeoutError(f"{self.name} mock timed out after {timeout:.2f}s")
+        await asyncio.sleep(latency)
+
+    def _fail(self) -> None:
+        with self._lock:
+            self.errors += 1
+        raise MockProviderError(f"{self.name} mock error {self.error_status}", self.error_status)
+
+    @staticmethod
+    def _cap(text: str, max_tokens: Optional[int]) -> str:
+        if not max_tokens:
+            return text
+        words = text.split(" ")
+        return text if len(words) <= max_tokens else " ".join(words[:max_tokens])
+
+    async def complete(self, prompt: str, max_tokens: Optional[int] = None, timeout: Optional[float] = None) -> Tuple[str, Dict[str, Any]]:
+        latency, failed, text = self._plan(prompt)
+        await self._wait(latency, timeout)
+        if failed:
+            self._fail()
+        text = self._cap(text, max_tokens)
+        return text, {"prompt_tokens": len(prompt.split()), "completion_tokens": len(text.split())}
+
+    async def stream(self, prompt: str, max_tokens: Optional[int] = None, timeout: Optional[float] = None,
+                     usage: Dict[str, Any] = None) -> AsyncIterator[str]:
+        """Spends about a third of the sampled latency before the first chunk and spreads the rest"""
+        latency, failed, text = self._plan(prompt)
+        await self._wait(latency / 3, timeout)
+        if failed:
+            self._fail()
+        words = self._cap(text, max_tokens).split(" ")
+        chunks = [" ".join(words[i:i + self.chunk_words]) for i in range(0, len(words), self.chunk_words)]
+        pause = (latency * 2 / 3) / max(len(chunks), 1)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(pause)
+            yield chunk if i == len(chunks) - 1 else chunk + " "
+        if usage is not None:
+            usage.update({"prompt_tokens": len(prompt.split()), "completion_tokens": len(words)})
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "latency": self.latency.spec,
+                "error_rate": self.error_rate,
+                "error_status": self.error_status,
+                "response_words": list(self.response_words),
+                "seed": self.seed,
+                "calls": self._calls,
+                "errors": self.errors,
+                "timeouts": self.timeouts
+            }
@@ -0,0 +1,154 @@
+"""
+Kai NearDup - sub-linear near-duplicate detection for generated outputs
+MinHash + LSH candidate lookup, confirmed with the same difflib ratio the router always used
+"""
+
+import difflib
+import threading
+from array import array
+from collections import deque
+from typing import Dict, List, Set, Tuple, Optional
+
+# ===========================
+# CONFIGURATION
+# ===========================
+SHINGLE_SIZE = 5        # character n-grams
+NUM_BINS = 128          # one-permutation MinHash signature length
+ROWS_PER_BAND = 5       # 25 bands: ~97% recall at Jaccard 0.67, ~99.9% at 0.75, <2% candidates at 0.23
+# Candidates whose signatures agree on fewer bins than this skip the (expensive) difflib ratio.
+# Pairs above the 0.92 ratio threshold measure well above 0.8 shingle Jaccard in practice.
+MIN_ESTIMATED_JACCARD = 0.5
+EMPTY_BIN_OFFSET = 1 << 40
+VALUE_MASK = (1 << 40) - 1
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    text = _normalize(text)
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def minhash_signature(text: str, num_bins: int = NUM_BINS) -> List[int]:
+    """One-permutation MinHash: a single hash per shingle, binned, with rotation densification"""
+    bins: List[Optional[int]] = [None] * num_bins
+    for shingle in shingles(text):
+        h = hash(shingle) & 0xFFFFFFFFFFFFFFFF
+        index = h % num_bins
+        value = (h // num_bins) & VALUE_MASK
+        current = bins[index]
+        if current is None or value < current:
+            bins[index] = value
+    # Empty bins borrow the next non-empty bin to the right, offset by distance, so short texts still band
+    if None in bins:
+        start = next(i for i, value in enumerate(bins) if value is not None)
+        nearest = start
+        for step in range(1, num_bins):
+            i = (start - step) % num_bins
+            if bins[i] is None:
+                bins[i] = bins[nearest] + ((nearest - i) % num_bins) * EMPTY_BIN_OFFSET
+            else:
+                nearest = i
+    return bins
+
+# ===========================
+# NEAR-DUPLICATE INDEX
+# ===========================
+class NearDuplicateIndex:
+    """Sliding window of outputs with LSH lookup; check() answers 'ratio > threshold vs any stored output'"""
+    def __init__(self, max_items: int, num_bins: int = NUM_BINS, rows_per_band: int = ROWS_PER_BAND):
+        self.max_items = max_items
+        self.num_bins = num_bins
+        self.rows_per_band = rows_per_band
+        self.num_bands = num_bins // rows_per_band
+        self._texts: Dict[int, str] = {}
+        self._signatures: Dict[int, array] = {}
+        self._band_keys: Dict[int, List[int]] = {}
+        self._buckets: List[Dict[int, Set[int]]] = [dict() for _ in range(self.num_bands)]
+        self._order: deque = deque()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.candidates_verified = 0
+
+    def _sketch(self, text: str) -> Tuple[array, List[int]]:
+        signature = array("q", minhash_signature(text, self.num_bins))
+        rows = self.rows_per_band
+        return signature, [hash(tuple(signature[b * rows:(b + 1) * rows])) for b in range(self.num_bands)]
+
+    def _evict_oldest(self) -> None:
+        doc_id = self._order.popleft()
+        for band, key in enumerate(self._band_keys.pop(doc_id)):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self._buckets[band][key]
+        del self._texts[doc_id]
+        del self._signatures[doc_id]
+
+    def add(self, text: str) -> None:
+        signature, band_keys = self._sketch(text)
+        with self._lock:
+            doc_id = self._next_id
+            self._next_id += 1
+            self._texts[doc_id] = text
+            self._signatures[doc_id] = signature
+            self._band_keys[doc_id] = band_keys
+            self._order.append(doc_id)
+            for band, key in enumerate(band_keys):
+                self._buckets[band].setdefault(key, set()).add(doc_id)
+            while len(self._order) > self.max_items:
+                self._evict_oldest()
+
+    def _candidates(self, signature: array, band_keys: List[int]) -> List[Tuple[int, str]]:
+        min_matches = MIN_ESTIMATED_JACCARD * self.num_bins
+        with self._lock:
+            ids: Set[int] = set()
+            for band, key in enumerate(band_keys):
+                bucket = self._buckets[band].get(key)
+                if bucket:
+                    ids.update(bucket)
+            candidates = []
+            for doc_id in ids:
+                matches = sum(a == b for a, b in zip(signature, self._signatures[doc_id]))
+                if matches >= min_matches:
+                    candidates.append((doc_id, self._texts[doc_id]))
+            return candidates
+
+    def check(self, text: str, threshold: float = 0.92) -> bool:
+        signature, band_keys = self._sketch(text)
+        candidates = self._candidates(signature, band_keys)
+        # Verification runs outside the lock; only banded candidates pay for the difflib ratio
+        with self._lock:
+            self.checks += 1
+            self.candidates_verified += len(candidates)
+        for _, old_text in candidates:
+            matcher = difflib.SequenceMatcher(None, text, old_text)
+            if matcher.real_quick_ratio() > threshold and matcher.quick_ratio() > threshold and matcher.ratio() > threshold:
+                return True
+        return False
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._order)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._texts.clear()
+            self._signatures.clear()
+            self._band_keys.clear()
+            self._order.clear()
+            for bucket in self._buckets:
+                bucket.clear()
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "items": len(self._order),
+                "max_items": self.max_items,
+                "bands": self.num_bands,
+                "checks": self.checks,
+                "avg_candidates_per_check": round(self.candidates_verified / max(self.checks, 1), 3)
+            }
@@ -6,21 +6,29 @@ Final polished version with tunable workers, request ID tracking, and optimized
 
 import os
 import sys
+import json
 import logging
 import time
 import traceback
 import signal
+import threading
 import uuid
 from datetime import datetime
 from functools import wraps
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-from typing import Dict, Any, Tuple, Optional
-from flask import Flask, request, jsonify, make_response, g
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Any, List, Tuple, Optional
+from flask import Flask, Response, request, jsonify, make_response, g, has_app_context, copy_current_request_context, stream_with_context
 from flask_cors import CORS
 
 # Import our brain router
 try:
-    from kai_brain_router import get_kai_response, get_system_status
+    from kai_brain_router import (
+        get_kai_response, get_system_status, get_breaker_status, get_bulkhead_status, get_provider_scoreboard,
+        get_rate_limit_status, stream_kai_response, iter_kai_responses, BATCH_MAX_CONCURRENCY, validate_prompt
+    )
+    from kai_metrics import LatencyHistogram, WindowedHistogram
+    from kai_prometheus import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsWriter, collect_process, collect_router
+    from kai_resilience import CancelToken, Deadline
 except ImportError as e:
     logging.error(f"Failed to import kai_brain_router: {e}")
     sys.exit(1)
@@ -30,6 +38,10 @@ PORT = int(os.environ.get("PORT", 8080))
 DEBUG_MODE = os.environ.get("DEBUG", "False").lower() == "true"
 MAX_REQUEST_SIZE = int(os.environ.get("MAX_REQUEST_SIZE", 1024 * 1024))  # 1MB
 RESPONSE_TIMEOUT = int(os.environ.get("RESPONSE_TIMEOUT", 30))
+DEADLINE_MARGIN = float(os.environ.get("DEADLINE_MARGIN", 0.5))  # router stops this much before the 504
+STREAM_TIMEOUT = int(os.environ.get("STREAM_TIMEOUT", 120))
+BATCH_TIMEOUT = int(os.environ.get("BATCH_TIMEOUT", 600))
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 500))
 ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", "*")
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
 ENVIRONMENT = os.environ.get("ENVIRONMENT", "production")
@@ -43,6 +55,11 @@ if ENVIRONMENT == "production":
     recommended_workers = min(cpu_count * 2, int(available_memory_gb * 2))
     MAX_WORKERS = min(MAX_WORKERS, max(recommended_workers, 5))
 
+# Readiness: /readyz answers 503 once this many requests wait for a kai_worker thread (default: a full pool's worth)
+READY_MAX_QUEUE_DEPTH = int(os.environ.get("READY_MAX_QUEUE_DEPTH", 0)) or MAX_WORKERS
+READY_MAX_LOOP_LAG = float(os.environ.get("READY_MAX_LOOP_LAG", 1.0))  # seconds; kai_omniseal_asgi only
+RESOURCE_SAMPLE_INTERVAL = float(os.environ.get("RESOURCE_SAMPLE_INTERVAL", 5))  # seconds between resource readings
+
 # ================== Logging Setup ==================
 logging.basicConfig(
     level=getattr(logging, LOG_LEVEL.upper()),
@@ -52,7 +69,7 @@ logging.basicConfig(
 
 class RequestIdFilter(logging.Filter):
     def filter(self, record):
-        record.request_id = getattr(g, 'request_id', 'no-req-id')
+        record.request_id = getattr(g, 'request_id', 'no-req-id') if has_app_context() else 'no-req-id'
         return True
 
 logger = logging.getLogger('kai_omniseal')
@@ -70,11 +87,53 @@ app.config['JSON_SORT_KEYS'] = False
 app.config['JSONIFY_PRETTYPRINT_REGULAR'] = DEBUG_MODE
 CORS(app, origins=ALLOWED_ORIGINS)
 
-executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="kai_worker")
+# ================== Worker Pool ==================
+class WorkerPool:
+    """The kai_worker thread pool, counting queued and running calls itself instead of reading executor internals"""
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kai_worker")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        def run():
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+
+        with self._lock:
+            self.queued += 1
+        try:
+            future = self._executor.submit(run)
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            raise
+        # A future cancelled while still queued never runs, so it leaves the queue here instead
+        future.add_done_callback(self._forget_if_cancelled)
+        return future
+
+    def _forget_if_cancelled(self, future: Future) -> None:
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+executor = WorkerPool(MAX_WORKERS)
 
 # ================== Request ID Management ==================
 @app.before_request
 def before_request():
+    resource_sampler.ensure_started()
     g.request_id = str(uuid.uuid4())[:8]
     g.start_time = time.time()
 
@@ -86,49 +145,117 @@ def after_request(response):
 
 # ================== Request Tracking ==================
 class RequestTracker:
+    """Thread-safe request accounting: O(1) updates, histogram percentiles, per-route/status counts, recent windows"""
+    WINDOWS = {"1m": 60, "5m": 300, "15m": 900}
+    PERCENTILES = (50, 95, 99)
+
     def __init__(self):
+        self._lock = threading.Lock()
         self.start_time = time.time()
         self.total_requests = 0
         self.successful_requests = 0
         self.failed_requests = 0
         self.timeout_requests = 0
-        self.avg_response_time = 0.0
-        self._response_times = []
         self.peak_workers_used = 0
         self.current_active_requests = 0
-    
+        self.orphaned_requests = 0
+        self.orphaned_in_progress = 0
+        self.orphaned_work_seconds = 0.0
+        self.max_orphaned_seconds = 0.0
+        self._latency = LatencyHistogram()
+        self._recent = WindowedHistogram(horizon_seconds=max(self.WINDOWS.values()))
+        self._by_status: Dict[int, int] = {}
+        # route -> [latency histogram, {status: count}]; routes are the fixed rule strings, so this stays small
+        self._by_route: Dict[str, List[Any]] = {}
+
     def record_request_start(self):
-        self.current_active_requests += 1
-        self.peak_workers_used = max(self.peak_workers_used, self.current_active_requests)
-    
-    def record_request_end(self, success: bool, response_time: float, timeout: bool = False):
-        self.current_active_requests = max(0, self.current_active_requests - 1)
-        self.total_requests += 1
-        self._response_times.append(response_time)
-        if len(self._response_times) > 100:
-            self._response_times.pop(0)
-        self.avg_response_time = sum(self._response_times) / len(self._response_times)
-        if timeout:
-            self.timeout_requests += 1
-        elif success:
-            self.successful_requests += 1
-        else:
-            self.failed_requests += 1
-    
+        with self._lock:
+            self.current_active_requests += 1
+            self.peak_workers_used = max(self.peak_workers_used, self.current_active_requests)
+
+    def record_request_end(self, success: bool, response_time: float, timeout: bool = False,
+                           route: Optional[str] = None, status: Optional[int] = None):
+        status = status or (504 if timeout else 200 if success else 500)
+        with self._lock:
+            self.current_active_requests = max(0, self.current_active_requests - 1)
+            self.total_requests += 1
+            if timeout:
+                self.timeout_requests += 1
+            elif success:
+                self.successful_requests += 1
+            else:
+                self.failed_requests += 1
+            self._by_status[status] = self._by_status.get(status, 0) + 1
+            entry = self._by_route.get(route or "unknown")
+            if entry is None:
+                entry = self._by_route[route or "unknown"] = [LatencyHistogram(), {}]
+            entry[1][status] = entry[1].get(status, 0) + 1
+        # Histograms take their own short locks
+        self._latency.record(response_time)
+        self._recent.record(response_time, error=status >= 500)
+        entry[0].record(response_time)
+
+    def record_orphan_start(self):
+        with self._lock:
+            self.orphaned_requests += 1
+            self.orphaned_in_progress += 1
+
+    def record_orphan_end(self, orphaned_seconds: float):
+        # Time a worker kept running after its client had already been sent a 504
+        with self._lock:
+            self.orphaned_in_progress = max(0, self.orphaned_in_progress - 1)
+            self.orphaned_work_seconds += orphaned_seconds
+            self.max_orphaned_seconds = max(self.max_orphaned_seconds, orphaned_seconds)
+
     def get_stats(self) -> Dict[str, Any]:
         uptime = time.time() - self.start_time
-        return {
-            "uptime_seconds": round(uptime, 2),
-            "total_requests": self.total_requests,
-            "successful_requests": self.successful_requests,
-            "failed_requests": self.failed_requests,
-            "timeout_requests": self.timeout_requests,
-            "success_rate": round(self.successful_requests / max(self.total_requests, 1) * 100, 2),
-            "avg_response_time": round(self.avg_response_time, 2),
-            "current_active_requests": self.current_active_requests,
-            "peak_workers_used": self.peak_workers_used,
-            "max_workers_configured": MAX_WORKERS
+        with self._lock:
+            stats = {
+                "uptime_seconds": round(uptime, 2),
+                "total_requests": self.total_requests,
+                "successful_requests": self.successful_requests,
+                "failed_requests": self.failed_requests,
+                "timeout_requests": self.timeout_requests,
+                "success_rate": round(self.successful_requests / max(self.total_requests, 1) * 100, 2),
+                "current_active_requests": self.current_active_requests,
+                "peak_workers_used": self.peak_workers_used,
+                "max_workers_configured": MAX_WORKERS,
+                "orphaned_requests": self.orphaned_requests,
+                "orphaned_in_progress": self.orphaned_in_progress,
+                "orphaned_work_seconds": round(self.orphaned_work_seconds, 3),
+                "max_orphaned_seconds": round(self.max_orphaned_seconds, 3),
+                "by_status": {str(status): count for status, count in sorted(self._by_status.items())}
+            }
+            routes = {route: (histogram, dict(statuses)) for route, (histogram, statuses) in self._by_route.items()}
+        stats["latency"] = self._latency.summary(self.PERCENTILES)
+        stats["windows"] = {name: self._recent.summary(seconds, self.PERCENTILES) for name, seconds in self.WINDOWS.items()}
+        stats["by_route"] = {
+            route: {
+                "requests": sum(statuses.values()),
+                "by_status": {str(status): count for status, count in sorted(statuses.items())},
+                "latency": histogram.summary(self.PERCENTILES)
+            }
+            for route, (histogram, statuses) in sorted(routes.items())
         }
+        return stats
+
+    def write_metrics(self, writer: MetricsWriter) -> None:
+        with self._lock:
+            routes = {route: (histogram, dict(statuses)) for route, (histogram, statuses) in self._by_route.items()}
+            in_flight = self.current_active_requests
+            timeouts = self.timeout_requests
+            orphaned = self.orphaned_requests
+            orphaned_seconds = self.orphaned_work_seconds
+        for route, (histogram, statuses) in sorted(routes.items()):
+            for status, count in sorted(statuses.items()):
+                writer.counter("kai_http_requests_total", "Requests handled, by route and status.", count,
+                               {"route": route, "status": status})
+            writer.histogram("kai_http_request_duration_seconds", "Request latency, by route.", histogram, {"route": route})
+        writer.gauge("kai_http_requests_in_flight", "Requests currently being handled.", in_flight)
+        writer.counter("kai_http_request_timeouts_total", "Requests answered with a 504 timeout.", timeouts)
+        writer.counter("kai_http_orphaned_requests_total", "Timed-out requests whose work kept running.", orphaned)
+        writer.counter("kai_http_orphaned_work_seconds_total", "Time timed-out work kept running after its 504.",
+                       orphaned_seconds)
 
 request_tracker = RequestTracker()
 
@@ -147,8 +274,13 @@ def log_request_info():
         except Exception:
             pass
 
-def create_error_response(message: str, status_code: int = 500, error_type: str = "error") -> Tuple[Dict[str, Any], int]:
-    request_id = getattr(g, 'request_id', 'unknown')
+def current_request_id() -> str:
+    return getattr(g, 'request_id', 'unknown') if has_app_context() else 'unknown'
+
+def create_error_response(message: str, status_code: int = 500, error_type: str = "error",
+                          request_id: Optional[str] = None) -> Tuple[Dict[str, Any], int]:
+    # request_id is passed explicitly by servers without a Flask request context (kai_omniseal_asgi)
+    request_id = request_id or current_request_id()
     response = {
         "error": True,
         "type": error_type,
@@ -159,8 +291,9 @@ def create_error_response(message: str, status_code: int = 500, error_type: str
     logger.error(f"Error response: {status_code} - {message}")
     return response, status_code
 
-def create_success_response(data: Dict[str, Any], status_code: int = 200) -> Tuple[Dict[str, Any], int]:
-    request_id = getattr(g, 'request_id', 'unknown')
+def create_success_response(data: Dict[str, Any], status_code: int = 200,
+                            request_id: Optional[str] = None) -> Tuple[Dict[str, Any], int]:
+    request_id = request_id or current_request_id()
     response = {
         "success": True,
         "timestamp": datetime.utcnow().isoformat(),
@@ -177,12 +310,25 @@ def safe_route(timeout_seconds: int = RESPONSE_TIMEOUT):
             start_time = time.time()
             success = False
             timeout = False
+            status = None
+            route = request.url_rule.rule if request.url_rule else request.path
             try:
                 log_request_info()
                 logger.info(f"Processing request with ID: {getattr(g, 'request_id', 'unknown')}")
-                future = executor.submit(f, *args, **kwargs)
+                request_id = getattr(g, 'request_id', 'unknown')
+                cancel_token = CancelToken()
+                deadline = Deadline(max(timeout_seconds - DEADLINE_MARGIN, 0), cancel_token)
+
+                @copy_current_request_context
+                def run_in_request_context():
+                    g.request_id = request_id
+                    g.deadline = deadline
+                    return f(*args, **kwargs)
+
+                future = executor.submit(run_in_request_context)
                 result = future.result(timeout=timeout_seconds)
                 success = True
+                status = getattr(result, 'status_code', None)
                 elapsed = time.time() - start_time
                 logger.info(f"Request completed successfully in {elapsed:.2f}s")
                 return result
@@ -190,6 +336,12 @@ def safe_route(timeout_seconds: int = RESPONSE_TIMEOUT):
                 timeout = True
                 elapsed = time.time() - start_time
                 logger.error(f"Request timeout after {timeout_seconds}s")
+                # Tell the router to stop; whatever still runs until the worker notices is orphaned work
+                cancel_token.cancel("timeout")
+                if not future.cancel():
+                    cancelled_at = time.time()
+                    request_tracker.record_orphan_start()
+                    future.add_done_callback(lambda _: request_tracker.record_orphan_end(time.time() - cancelled_at))
                 error_data, status_code = create_error_response("Request timed out", 504, "timeout")
                 return make_response(jsonify(error_data), status_code)
             except Exception as e:
@@ -199,7 +351,7 @@ def safe_route(timeout_seconds: int = RESPONSE_TIMEOUT):
                 return make_response(jsonify(error_data), status_code)
             finally:
                 elapsed = time.time() - start_time
-                request_tracker.record_request_end(success, elapsed, timeout)
+                request_tracker.record_request_end(success, elapsed, timeout, route, status)
         return decorated_function
     return decorator
 
@@ -211,20 +363,53 @@ def validate_message_request(data: Dict[str, Any]) -> Tuple[bool, Optional[str]]
     message = data.get('message', '').strip()
     if not message:
         return False, "Message cannot be empty"
-    if len(message) > 10000:
-        return False, "Message too long (max 10000 characters)"
+    # Same limits as the router (character cap, then estimated tokens), so an oversized prompt is a 400 here
+    valid, error = validate_prompt(message)
+    if not valid:
+        return False, error
     valid_tones = ['neutral', 'scroll', 'emotional', 'healing', 'poetic', 'code', 'technical', 'automation']
     tone = data.get('tone', 'neutral').lower()
     if tone not in valid_tones:
         logger.warning(f"Invalid tone '{tone}', defaulting to neutral")
         data['tone'] = 'neutral'
+    user = data.get('user')
+    if user is not None and (not isinstance(user, str) or len(user) > 200):
+        return False, "'user' must be a string of at most 200 characters"
     return True, None
 
-def get_kai_response_safe(prompt: str, tone: str) -> str:
+def conversation_user(data: Dict[str, Any]) -> Optional[str]:
+    # Only callers that name a user get conversation memory; the anonymous default is shared, so it stays stateless
+    user = (data.get('user') or '').strip()
+    return user if user and user != 'anonymous' else None
+
+def batch_concurrency(data: Dict[str, Any]) -> int:
+    try:
+        return min(int(data.get('max_concurrency', BATCH_MAX_CONCURRENCY)), BATCH_MAX_CONCURRENCY)
+    except (TypeError, ValueError):
+        return BATCH_MAX_CONCURRENCY
+
+def split_batch_items(messages: List[Any]) -> Tuple[List[Tuple[int, str, str]], Dict[int, str]]:
+    # Invalid items fail on their own; the rest of the batch still runs
+    items, invalid = [], {}
+    for index, item in enumerate(messages):
+        if not isinstance(item, dict):
+            item = {"message": item} if isinstance(item, str) else {}
+        if not isinstance(item.get('message', ''), str) or not isinstance(item.get('tone', 'neutral'), str):
+            invalid[index] = "'message' and 'tone' must be strings"
+            continue
+        valid, error_msg = validate_message_request(item)
+        if valid:
+            items.append((index, item['message'].strip(), item.get('tone', 'neutral').lower()))
+        else:
+            invalid[index] = error_msg
+    return items, invalid
+
+def get_kai_response_safe(prompt: str, tone: str, deadline: Optional[Deadline] = None, bypass_cache: bool = False,
+                          user: Optional[str] = None) -> str:
     try:
         logger.info(f"Calling Kai Brain Router: prompt_length={len(prompt)}, tone={tone}")
         start_time = time.time()
-        response = get_kai_response(prompt, tone)
+        response = get_kai_response(prompt, tone, deadline=deadline, bypass_cache=bypass_cache, user=user)
         elapsed = time.time() - start_time
         logger.info(f"Kai Brain Router completed in {elapsed:.2f}s, response_length={len(response)}")
         return response
@@ -233,6 +418,153 @@ def get_kai_response_safe(prompt: str, tone: str) -> str:
         logger.error(traceback.format_exc())
         return "⚠️ I'm having trouble accessing my knowledge systems right now. Please try again in a moment."
 
+# ================== Resource Sampling ==================
+def get_system_resources() -> Dict[str, Any]:
+    try:
+        import psutil
+        # Non-blocking: CPU use since the previous call, i.e. over the last sampler interval
+        cpu_percent = psutil.cpu_percent(interval=None)
+        memory_info = psutil.virtual_memory()
+        return {
+            "cpu_percent": cpu_percent,
+            "memory_percent": memory_info.percent,
+            "memory_available_gb": round(memory_info.available / (1024**3), 2)
+        }
+    except Exception:
+        return {"status": "unavailable"}
+
+class ResourceSampler:
+    """Reads system and server resources on a daemon thread every interval, so probes only copy the last reading"""
+    def __init__(self, interval: float = RESOURCE_SAMPLE_INTERVAL,
+                 probe: Optional[Callable[[], Dict[str, Any]]] = None):
+        self.interval = interval
+        self._probe = probe
+        self._start_lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._snapshot: Tuple[float, Dict[str, Any]] = (time.time(), {"status": "unavailable"})
+
+    def ensure_started(self) -> None:
+        # Started per process on first use: with preload_app the module is imported in the gunicorn master,
+        # and a thread started there would not exist in the forked workers
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._sample()
+            threading.Thread(target=self._run, name="kai_sampler", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self._sample()
+
+    def _sample(self) -> None:
+        readings = get_system_resources()
+        if self._probe is not None:
+            try:
+                readings.update(self._probe())
+            except Exception as e:
+                logger.warning(f"Resource probe failed: {e}")
+        # Replaced whole, so readers never see a half-updated reading
+        self._snapshot = (time.time(), readings)
+
+    def readings(self) -> Dict[str, Any]:
+        self.ensure_started()
+        sampled_at, readings = self._snapshot
+        return {**readings, "sample_age_seconds": round(time.time() - sampled_at, 2)}
+
+def executor_readings() -> Dict[str, Any]:
+    return {
+        "executor_queue_depth": executor.queued,
+        "executor_busy_workers": executor.running,
+        "worker_utilization": round(request_tracker.current_active_requests / MAX_WORKERS * 100, 2)
+    }
+
+resource_sampler = ResourceSampler(RESOURCE_SAMPLE_INTERVAL, executor_readings)
+
+# Payloads shared by the Flask routes below and kai_omniseal_asgi; each server adds its own checks and metrics
+def build_readiness_data(saturation: Dict[str, Any], saturated: bool) -> Tuple[Dict[str, Any], int]:
+    # The router needs one provider that will take a call: breaker not open and bulkhead not full
+    bulkheads = get_bulkhead_status()
+    providers = {}
+    for name, breaker in get_breaker_status().items():
+        bulkhead = bulkheads.get(name, {})
+        full = 0 < bulkhead.get("max_concurrent", 0) <= bulkhead.get("in_flight", 0)
+        providers[name] = "saturated" if full and breaker["state"] != "open" else breaker["state"]
+    providers_available = any(state in ("closed", "half_open") for state in providers.values())
+    ready = providers_available and not saturated
+    return {
+        "status": "ready" if ready else "not_ready",
+        "checks": {
+            "providers": providers,
+            "providers_available": providers_available,
+            "saturated": saturated,
+            **saturation
+        }
+    }, 200 if ready else 503
+
+def build_health_data(stats: Dict[str, Any], server_checks: Dict[str, str], system_resources: Dict[str, Any]) -> Dict[str, Any]:
+    brain_status = get_system_status()
+    breakers = get_breaker_status()
+    return {
+        "status": "healthy",
+        "service": "kai_omniseal",
+        "checks": {
+            **server_checks,
+            "brain_router": "ok" if not brain_status.get("error") else "error",
+            "memory_usage": brain_status.get("outputs_count", 0),
+            "providers": {name: breaker["state"] for name, breaker in breakers.items()}
+        },
+        "circuit_breakers": breakers,
+        "metrics": stats,
+        "system_resources": system_resources,
+        "brain_router_status": brain_status,
+        "configuration": {
+            "timeout": RESPONSE_TIMEOUT,
+            "max_request_size": MAX_REQUEST_SIZE,
+            "max_workers": MAX_WORKERS,
+            "debug_mode": DEBUG_MODE,
+            "log_level": LOG_LEVEL
+        }
+    }
+
+def build_status_data(stats: Dict[str, Any], performance: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": "operational",
+        "service_info": {
+            "name": "Kai Omniseal API",
+            "version": "2.1.0",
+            "environment": ENVIRONMENT
+        },
+        "endpoints": {
+            "/": "Root health check",
+            "/health": "Detailed health check",
+            "/livez": "Liveness probe",
+            "/readyz": "Readiness probe, 503 while saturated or without an available provider",
+            "/api/message": "Message processor (POST)",
+            "/api/stream": "Streaming message processor, Server-Sent Events (POST)",
+            "/api/batch": "Batch message processor, one Server-Sent Event per result (POST)",
+            "/api/status": "Status monitor",
+            "/metrics": "Prometheus metrics, text exposition format"
+        },
+        "configuration": {
+            "timeout": RESPONSE_TIMEOUT,
+            "max_request_size": MAX_REQUEST_SIZE,
+            "max_workers": MAX_WORKERS,
+            "debug_mode": DEBUG_MODE,
+            "log_level": LOG_LEVEL,
+            "allowed_origins": ALLOWED_ORIGINS
+        },
+        "performance": performance,
+        "circuit_breakers": get_breaker_status(),
+        "bulkheads": get_bulkhead_status(),
+        "rate_limits": get_rate_limit_status(),
+        "provider_scoreboard": get_provider_scoreboard(),
+        "brain_router_status": get_system_status()
+    }
+
 # ================== Routes ==================
 @app.route('/', methods=['GET'])
 @safe_route(timeout_seconds=5)
@@ -253,39 +585,11 @@ def home():
 @safe_route(timeout_seconds=5)
 def health_check():
     try:
-        brain_status = get_system_status()
-        stats = request_tracker.get_stats()
-        try:
-            import psutil
-            cpu_percent = psutil.cpu_percent(interval=0.1)
-            memory_info = psutil.virtual_memory()
-            system_resources = {
-                "cpu_percent": cpu_percent,
-                "memory_percent": memory_info.percent,
-                "memory_available_gb": round(memory_info.available / (1024**3), 2)
-            }
-        except Exception:
-            system_resources = {"status": "unavailable"}
-        health_data = {
-            "status": "healthy",
-            "service": "kai_omniseal",
-            "checks": {
-                "flask": "ok",
-                "brain_router": "ok" if not brain_status.get("error") else "error",
-                "thread_pool": "ok" if executor else "error",
-                "memory_usage": brain_status.get("outputs_count", 0)
-            },
-            "metrics": stats,
-            "system_resources": system_resources,
-            "brain_router_status": brain_status,
-            "configuration": {
-                "timeout": RESPONSE_TIMEOUT,
-                "max_request_size": MAX_REQUEST_SIZE,
-                "max_workers": MAX_WORKERS,
-                "debug_mode": DEBUG_MODE,
-                "log_level": LOG_LEVEL
-            }
-        }
+        health_data = build_health_data(
+            request_tracker.get_stats(),
+            {"flask": "ok", "thread_pool": "ok" if executor else "error"},
+            resource_sampler.readings()
+        )
         response_data, status_code = create_success_response(health_data)
         return make_response(jsonify(response_data), status_code)
     except Exception as e:
@@ -293,6 +597,20 @@ def health_check():
         error_data, status_code = create_error_response("Health check failed", 503, "health_check_failed")
         return make_response(jsonify(error_data), status_code)
 
+# Probes are not wrapped in safe_route: they must answer while every kai_worker thread is busy
+@app.route('/livez', methods=['GET'])
+def livez():
+    return jsonify({"status": "alive"})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    queue_depth = executor.queued
+    readiness_data, status_code = build_readiness_data(
+        {"executor_queue_depth": queue_depth, "max_queue_depth": READY_MAX_QUEUE_DEPTH},
+        queue_depth >= READY_MAX_QUEUE_DEPTH
+    )
+    return make_response(jsonify(readiness_data), status_code)
+
 @app.route('/api/message', methods=['POST'])
 @safe_route(timeout_seconds=RESPONSE_TIMEOUT)
 def api_message():
@@ -312,7 +630,8 @@ def api_message():
         prompt = data.get('message').strip()
         tone = data.get('tone', 'neutral').lower()
         user = data.get('user', 'anonymous')
-        reply = get_kai_response_safe(prompt, tone)
+        bypass_cache = bool(data.get('no_cache', False))
+        reply = get_kai_response_safe(prompt, tone, getattr(g, 'deadline', None), bypass_cache, conversation_user(data))
         response_data = {
             "reply": reply,
             "tone": tone,
@@ -330,39 +649,138 @@ def api_message():
         error_data, status_code = create_error_response(f"Message processing failed: {str(e)}", 500)
         return make_response(jsonify(error_data), status_code)
 
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/stream', methods=['POST'])
+def api_stream():
+    # Not wrapped in safe_route: the body is produced after this returns, by the WSGI server thread
+    if not request.is_json:
+        error_data, status_code = create_error_response("Content-Type must be application/json", 400, "invalid_content_type")
+        return make_response(jsonify(error_data), status_code)
+    data = request.get_json(silent=True)
+    valid, error_msg = validate_message_request(data)
+    if not valid:
+        error_data, status_code = create_error_response(error_msg, 400, "validation_error")
+        return make_response(jsonify(error_data), status_code)
+    log_request_info()
+    prompt = data.get('message').strip()
+    tone = data.get('tone', 'neutral').lower()
+    user = conversation_user(data)
+    request_id = g.request_id
+    route = request.url_rule.rule
+    deadline = Deadline(STREAM_TIMEOUT)
+
+    def generate():
+        # Counted from the first step: a client gone before then closes a generator that never started,
+        # whose finally would never run to end the request
+        request_tracker.record_request_start()
+        start_time = time.time()
+        first_token_time = None
+        response_length = 0
+        success = False
+        try:
+            yield sse_event("start", {"request_id": request_id, "tone": tone})
+            for chunk in stream_kai_response(prompt, tone, deadline, user):
+                if first_token_time is None:
+                    first_token_time = time.time()
+                response_length += len(chunk)
+                yield sse_event("token", {"text": chunk})
+            success = True
+            ttft_ms = round((first_token_time - start_time) * 1000, 1) if first_token_time else None
+            logger.info(f"Stream completed: ttft={ttft_ms}ms, response_length={response_length}")
+            yield sse_event("done", {
+                "request_id": request_id,
+                "response_length": response_length,
+                "time_to_first_token_ms": ttft_ms,
+                "total_time_ms": round((time.time() - start_time) * 1000, 1)
+            })
+        except Exception as e:
+            logger.error(f"Stream failed: {str(e)}")
+            error_data, _ = create_error_response(f"Stream interrupted: {str(e)}", 502, "stream_error")
+            yield sse_event("error", error_data)
+        finally:
+            # The 200 went out with the first event; a failure mid-stream is reported as the SSE error's 502
+            request_tracker.record_request_end(success, time.time() - start_time, route=route, status=200 if success else 502)
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    # Streams one SSE "result" event per item as it completes; clients reassemble order from "index"
+    if not request.is_json:
+        error_data, status_code = create_error_response("Content-Type must be application/json", 400, "invalid_content_type")
+        return make_response(jsonify(error_data), status_code)
+    data = request.get_json(silent=True)
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not messages:
+        error_data, status_code = create_error_response("'messages' must be a non-empty list", 400, "validation_error")
+        return make_response(jsonify(error_data), status_code)
+    if len(messages) > MAX_BATCH_SIZE:
+        error_data, status_code = create_error_response(f"Batch too large (max {MAX_BATCH_SIZE} messages)", 413, "batch_too_large")
+        return make_response(jsonify(error_data), status_code)
+    log_request_info()
+    max_concurrency = batch_concurrency(data)
+    bypass_cache = bool(data.get('no_cache', False))
+    items, invalid = split_batch_items(messages)
+    request_id = g.request_id
+    route = request.url_rule.rule
+    deadline = Deadline(BATCH_TIMEOUT)
+
+    def generate():
+        # Counted from the first step, as in api_stream
+        request_tracker.record_request_start()
+        start_time = time.time()
+        succeeded = failed = 0
+        success = False
+        try:
+            yield sse_event("start", {"request_id": request_id, "count": len(messages), "max_concurrency": max_concurrency})
+            for index, error_msg in invalid.items():
+                failed += 1
+                yield sse_event("result", {"index": index, "ok": False, "reply": None, "error": error_msg})
+            positions = [index for index, _, _ in items]
+            for result in iter_kai_responses([(prompt, tone) for _, prompt, tone in items], max_concurrency,
+                                             deadline, bypass_cache):
+                result["index"] = positions[result["index"]]
+                if result["ok"]:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield sse_event("result", result)
+            success = True
+            logger.info(f"Batch completed: {succeeded} succeeded, {failed} failed")
+            yield sse_event("done", {
+                "request_id": request_id,
+                "succeeded": succeeded,
+                "failed": failed,
+                "total_time_ms": round((time.time() - start_time) * 1000, 1)
+            })
+        except Exception as e:
+            logger.error(f"Batch failed: {str(e)}")
+            error_data, _ = create_error_response(f"Batch interrupted: {str(e)}", 502, "batch_error")
+            yield sse_event("error", error_data)
+        finally:
+            # The 200 went out with the first event; a failure mid-stream is reported as the SSE error's 502
+            request_tracker.record_request_end(success, time.time() - start_time, route=route, status=200 if success else 502)
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/status', methods=['GET'])
 @safe_route(timeout_seconds=5)
 def api_status():
     try:
-        brain_status = get_system_status()
         stats = request_tracker.get_stats()
-        status_data = {
-            "status": "operational",
-            "service_info": {
-                "name": "Kai Omniseal API",
-                "version": "2.1.0",
-                "environment": ENVIRONMENT
-            },
-            "endpoints": {
-                "/": "Root health check",
-                "/health": "Detailed health check",
-                "/api/message": "Message processor (POST)",
-                "/api/status": "Status monitor"
-            },
-            "configuration": {
-                "timeout": RESPONSE_TIMEOUT,
-                "max_request_size": MAX_REQUEST_SIZE,
-                "max_workers": MAX_WORKERS,
-                "debug_mode": DEBUG_MODE,
-                "log_level": LOG_LEVEL,
-                "allowed_origins": ALLOWED_ORIGINS
-            },
-            "performance": {
-                "metrics": stats,
-                "worker_utilization": round(stats["current_active_requests"] / MAX_WORKERS * 100, 2)
-            },
-            "brain_router_status": brain_status
-        }
+        status_data = build_status_data(stats, {
+            "metrics": stats,
+            "worker_utilization": round(stats["current_active_requests"] / MAX_WORKERS * 100, 2),
+            "executor_queue_depth": executor.queued
+        })
         response_data, status_code = create_success_response(status_data)
         return make_response(jsonify(response_data), status_code)
     except Exception as e:
@@ -370,6 +788,20 @@ def api_status():
         error_data, status_code = create_error_response(f"Status check failed: {str(e)}", 500)
         return make_response(jsonify(error_data), status_code)
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Not wrapped in safe_route: a scrape should neither take a kai_worker thread nor count as traffic
+    writer = MetricsWriter()
+    request_tracker.write_metrics(writer)
+    writer.gauge("kai_executor_max_workers", "Size of the kai_worker thread pool.", MAX_WORKERS)
+    writer.gauge("kai_executor_busy_workers", "kai_worker threads running a request.", executor.running)
+    writer.gauge("kai_executor_queue_depth", "Requests waiting for a kai_worker thread.", executor.queued)
+    writer.gauge("kai_executor_utilization", "Share of the kai_worker pool in use.",
+                 round(request_tracker.current_active_requests / MAX_WORKERS, 4))
+    collect_router(writer)
+    collect_process(writer)
+    return Response(writer.render(), content_type=METRICS_CONTENT_TYPE)
+
 # ================== Error Handlers ==================
 @app.errorhandler(404)
 def not_found(error):
@@ -403,11 +835,15 @@ def shutdown_handler(signum, frame):
     logger.info("Kai Omniseal shutdown complete")
     sys.exit(0)
 
-signal.signal(signal.SIGTERM, shutdown_handler)
-signal.signal(signal.SIGINT, shutdown_handler)
+def install_signal_handlers():
+    signal.signal(signal.SIGTERM, shutdown_handler)
+    signal.signal(signal.SIGINT, shutdown_handler)
 
 # ================== Application Entry Point ==================
+# Handlers are installed only for the Flask development server: gunicorn workers keep their own graceful
+# shutdown, and kai_omniseal_asgi imports this module for its shared helpers
 if __name__ == '__main__':
+    install_signal_handlers()
     logger.info(f"🚀 Starting Kai Omniseal on port {PORT}")
     logger.info(f"Workers: {MAX_WORKERS}, Timeout: {RESPONSE_TIMEOUT}s")
     app.run(host='0.0.0.0', port=PORT, debug=DEBUG_MODE, threaded=True)
@@ -0,0 +1,445 @@
+"""
+Kai Omniseal ASGI Server
+Async serving mode for the Kai Omniseal API: the same routes, timeouts, request IDs and error envelopes as
+kai_omniseal, with handlers awaiting the async brain router directly on the server's event loop.
+No request holds a thread, and a timeout cancels the handler task together with its provider calls.
+
+Run: uvicorn kai_omniseal_asgi:app --host 0.0.0.0 --port $PORT
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import time
+import traceback
+import uuid
+from contextlib import asynccontextmanager
+from functools import wraps
+from typing import Dict, Any, Optional, Tuple, AsyncIterator
+
+from starlette.applications import Starlette
+from starlette.datastructures import MutableHeaders
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from kai_brain_router import (
+    get_kai_response_async, stream_kai_response_async, iter_kai_responses_async, aclose_provider_pools
+)
+from kai_prometheus import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsWriter, collect_process, collect_router
+from kai_resilience import CancelToken, Deadline
+from kai_omniseal import (
+    ALLOWED_ORIGINS, BATCH_TIMEOUT, DEADLINE_MARGIN, DEBUG_MODE, ENVIRONMENT, MAX_BATCH_SIZE, MAX_REQUEST_SIZE,
+    READY_MAX_LOOP_LAG, RESOURCE_SAMPLE_INTERVAL, RESPONSE_TIMEOUT, STREAM_TIMEOUT, RequestTracker, ResourceSampler,
+    batch_concurrency, build_health_data, build_readiness_data, build_status_data, conversation_user,
+    create_error_response, create_success_response, split_batch_items, sse_event, validate_message_request
+)
+
+# ================== Request ID Management ==================
+# Set per request by RequestIdMiddleware; every task a handler starts inherits it
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="no-req-id")
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+logger = logging.getLogger('kai_omniseal_asgi')
+logger.addFilter(RequestIdFilter())
+
+class RequestIdMiddleware:
+    """Gives each HTTP request an 8-character ID and returns it in the X-Request-ID header"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = str(uuid.uuid4())[:8]
+        request_id_var.set(request_id)
+        scope.setdefault("state", {})["request_id"] = request_id
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
+
+        await self.app(scope, receive, send_with_request_id)
+
+request_tracker = RequestTracker()
+
+# ================== Resource Sampling ==================
+class EventLoopLag:
+    """Sampler probe: how late the server event loop runs a callback posted from the sampler thread"""
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._posted_at: Optional[float] = None
+        self._lag = 0.0
+
+    def __call__(self) -> Dict[str, Any]:
+        if self.loop is None or self.loop.is_closed():
+            return {}
+        now = time.monotonic()
+        posted_at = self._posted_at
+        if posted_at is not None:
+            # The previous callback has not run yet: the loop is at least that far behind
+            lag = max(self._lag, now - posted_at)
+        else:
+            lag = self._lag
+            self._posted_at = now
+            self.loop.call_soon_threadsafe(self._arrived, now)
+        return {"event_loop_lag_ms": round(lag * 1000, 1)}
+
+    def _arrived(self, posted_at: float) -> None:
+        self._lag = time.monotonic() - posted_at
+        self._posted_at = None
+
+event_loop_lag = EventLoopLag()
+resource_sampler = ResourceSampler(RESOURCE_SAMPLE_INTERVAL, event_loop_lag)
+
+# ================== Helper Functions ==================
+def json_response(data: Dict[str, Any], status_code: int = 200) -> JSONResponse:
+    return JSONResponse(data, status_code=status_code)
+
+def error_response(message: str, status_code: int = 500, error_type: str = "error") -> JSONResponse:
+    error_data, status_code = create_error_response(message, status_code, error_type, request_id_var.get())
+    return json_response(error_data, status_code)
+
+def success_response(data: Dict[str, Any], status_code: int = 200) -> JSONResponse:
+    response_data, status_code = create_success_response(data, status_code, request_id_var.get())
+    return json_response(response_data, status_code)
+
+def is_json(request: Request) -> bool:
+    mimetype = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    return mimetype == 'application/json' or (mimetype.startswith('application/') and mimetype.endswith('+json'))
+
+async def read_body(request: Request) -> bytes:
+    # Flask enforces MAX_CONTENT_LENGTH before the view runs; here the declared size is checked before reading
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > MAX_REQUEST_SIZE:
+        raise HTTPException(413)
+    body = await request.body()
+    if len(body) > MAX_REQUEST_SIZE:
+        raise HTTPException(413)
+    return body
+
+async def read_json(request: Request) -> Tuple[Any, Optional[JSONResponse]]:
+    """The parsed JSON body, or the error response to send instead"""
+    if not is_json(request):
+        return None, error_response("Content-Type must be application/json", 400, "invalid_content_type")
+    try:
+        return json.loads(await read_body(request)), None
+    except ValueError as e:
+        return None, error_response(f"Invalid JSON: {str(e)}", 400, "invalid_json")
+
+def log_request_info(request: Request) -> None:
+    client_ip = request.headers.get('X-Forwarded-For', request.client.host if request.client else None)
+    logger.info(f"Request: {request.method} {request.url.path} from {client_ip}")
+    logger.debug(f"User-Agent: {request.headers.get('User-Agent', 'Unknown')}")
+
+def safe_route(timeout_seconds: int = RESPONSE_TIMEOUT):
+    """kai_omniseal.safe_route for coroutines: the timeout is a task deadline, so nothing outlives the 504"""
+    def decorator(f):
+        @wraps(f)
+        async def decorated_function(request: Request) -> Response:
+            request_tracker.record_request_start()
+            start_time = time.time()
+            success = False
+            timeout = False
+            status = None
+            cancel_token = CancelToken()
+            try:
+                log_request_info(request)
+                logger.info(f"Processing request with ID: {request_id_var.get()}")
+                # The router gets DEADLINE_MARGIN to finish cleanly before the handler task is cancelled outright
+                request.state.deadline = Deadline(max(timeout_seconds - DEADLINE_MARGIN, 0), cancel_token)
+                result = await asyncio.wait_for(f(request), timeout_seconds)
+                success = True
+                status = result.status_code
+                logger.info(f"Request completed successfully in {time.time() - start_time:.2f}s")
+                return result
+            except asyncio.TimeoutError:
+                timeout = True
+                logger.error(f"Request timeout after {timeout_seconds}s")
+                cancel_token.cancel("timeout")
+                return error_response("Request timed out", 504, "timeout")
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            except Exception as e:
+                logger.exception(f"Unhandled error in route {f.__name__}")
+                return error_response(f"Internal server error: {str(e)}", 500, "internal_error")
+            finally:
+                request_tracker.record_request_end(success, time.time() - start_time, timeout, request.url.path, status)
+        return decorated_function
+    return decorator
+
+async def get_kai_response_safe(prompt: str, tone: str, deadline: Optional[Deadline] = None, bypass_cache: bool = False,
+                                user: Optional[str] = None) -> str:
+    try:
+        logger.info(f"Calling Kai Brain Router: prompt_length={len(prompt)}, tone={tone}")
+        start_time = time.time()
+        response = await get_kai_response_async(prompt, tone, deadline=deadline, bypass_cache=bypass_cache, user=user)
+        logger.info(f"Kai Brain Router completed in {time.time() - start_time:.2f}s, response_length={len(response)}")
+        return response
+    except Exception as e:
+        logger.error(f"Error in get_kai_response_async: {str(e)}")
+        logger.error(traceback.format_exc())
+        return "⚠️ I'm having trouble accessing my knowledge systems right now. Please try again in a moment."
+
+def event_stream(events: AsyncIterator[str]) -> StreamingResponse:
+    # Starlette cancels the generator when the client disconnects, which closes the provider streams
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# ================== Routes ==================
+@safe_route(timeout_seconds=5)
+async def home(request: Request) -> Response:
+    stats = request_tracker.get_stats()
+    return success_response({
+        "status": "alive",
+        "service": "Kai Omniseal API",
+        "version": "2.1.0",
+        "message": "Kai Omniseal is online and ready.",
+        "environment": ENVIRONMENT,
+        "uptime_seconds": stats["uptime_seconds"],
+        "active_requests": stats["current_active_requests"]
+    })
+
+@safe_route(timeout_seconds=5)
+async def health_check(request: Request) -> Response:
+    try:
+        return success_response(build_health_data(request_tracker.get_stats(), {"asgi": "ok"}, resource_sampler.readings()))
+    except Exception as e:
+        logger.error(f"Health check failed: {str(e)}")
+        return error_response("Health check failed", 503, "health_check_failed")
+
+# Probes are not wrapped in safe_route: they should not count as traffic
+async def livez(request: Request) -> Response:
+    return json_response({"status": "alive"})
+
+async def readyz(request: Request) -> Response:
+    # A request already waits this long for the loop before its handler starts
+    loop_lag = resource_sampler.readings().get("event_loop_lag_ms", 0.0) / 1000
+    readiness_data, status_code = build_readiness_data(
+        {"event_loop_lag_seconds": loop_lag, "max_loop_lag_seconds": READY_MAX_LOOP_LAG},
+        loop_lag >= READY_MAX_LOOP_LAG
+    )
+    return json_response(readiness_data, status_code)
+
+@safe_route(timeout_seconds=RESPONSE_TIMEOUT)
+async def api_message(request: Request) -> Response:
+    try:
+        data, error = await read_json(request)
+        if error is not None:
+            return error
+        valid, error_msg = validate_message_request(data)
+        if not valid:
+            return error_response(error_msg, 400, "validation_error")
+        prompt = data.get('message').strip()
+        tone = data.get('tone', 'neutral').lower()
+        user = data.get('user', 'anonymous')
+        bypass_cache = bool(data.get('no_cache', False))
+        reply = await get_kai_response_safe(prompt, tone, request.state.deadline, bypass_cache, conversation_user(data))
+        return success_response({
+            "reply": reply,
+            "tone": tone,
+            "processing_info": {
+                "prompt_length": len(prompt),
+                "response_length": len(reply),
+                "user": user,
+                "worker_id": f"worker-{request_tracker.current_active_requests}"
+            }
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in api_message")
+        return error_response(f"Message processing failed: {str(e)}", 500)
+
+async def api_stream(request: Request) -> Response:
+    data, error = await read_json(request)
+    if error is not None:
+        return error
+    valid, error_msg = validate_message_request(data)
+    if not valid:
+        return error_response(error_msg, 400, "validation_error")
+    log_request_info(request)
+    prompt = data.get('message').strip()
+    tone = data.get('tone', 'neutral').lower()
+    user = conversation_user(data)
+    request_id = request_id_var.get()
+    route = request.url.path
+    deadline = Deadline(STREAM_TIMEOUT)
+
+    async def generate() -> AsyncIterator[str]:
+        # Counted from the first step, as in kai_omniseal: a generator that never starts never ends the request
+        request_tracker.record_request_start()
+        start_time = time.time()
+        first_token_time = None
+        response_length = 0
+        success = False
+        try:
+            yield sse_event("start", {"request_id": request_id, "tone": tone})
+            async for chunk in stream_kai_response_async(prompt, tone, deadline, user):
+                if first_token_time is None:
+                    first_token_time = time.time()
+                response_length += len(chunk)
+                yield sse_event("token", {"text": chunk})
+            success = True
+            ttft_ms = round((first_token_time - start_time) * 1000, 1) if first_token_time else None
+            logger.info(f"Stream completed: ttft={ttft_ms}ms, response_length={response_length}")
+            yield sse_event("done", {
+                "request_id": request_id,
+                "response_length": response_length,
+                "time_to_first_token_ms": ttft_ms,
+                "total_time_ms": round((time.time() - start_time) * 1000, 1)
+            })
+        except Exception as e:
+            logger.error(f"Stream failed: {str(e)}")
+            error_data, _ = create_error_response(f"Stream interrupted: {str(e)}", 502, "stream_error", request_id)
+            yield sse_event("error", error_data)
+        finally:
+            request_tracker.record_request_end(success, time.time() - start_time, route=route, status=200 if success else 502)
+
+    return event_stream(generate())
+
+async def api_batch(request: Request) -> Response:
+    # Streams one SSE "result" event per item as it completes; clients reassemble order from "index"
+    data, error = await read_json(request)
+    if error is not None:
+        return error
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not messages:
+        return error_response("'messages' must be a non-empty list", 400, "validation_error")
+    if len(messages) > MAX_BATCH_SIZE:
+        return error_response(f"Batch too large (max {MAX_BATCH_SIZE} messages)", 413, "batch_too_large")
+    log_request_info(request)
+    max_concurrency = batch_concurrency(data)
+    bypass_cache = bool(data.get('no_cache', False))
+    items, invalid = split_batch_items(messages)
+    request_id = request_id_var.get()
+    route = request.url.path
+    deadline = Deadline(BATCH_TIMEOUT)
+
+    async def generate() -> AsyncIterator[str]:
+        # Counted from the first step, as in api_stream
+        request_tracker.record_request_start()
+        start_time = time.time()
+        succeeded = failed = 0
+        success = False
+        try:
+            yield sse_event("start", {"request_id": request_id, "count": len(messages), "max_concurrency": max_concurrency})
+            for index, error_msg in invalid.items():
+                failed += 1
+                yield sse_event("result", {"index": index, "ok": False, "reply": None, "error": error_msg})
+            positions = [index for index, _, _ in items]
+            async for result in iter_kai_responses_async([(prompt, tone) for _, prompt, tone in items], max_concurrency,
+                                                         deadline, bypass_cache):
+                result["index"] = positions[result["index"]]
+                if result["ok"]:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield sse_event("result", result)
+            success = True
+            logger.info(f"Batch completed: {succeeded} succeeded, {failed} failed")
+            yield sse_event("done", {
+                "request_id": request_id,
+                "succeeded": succeeded,
+                "failed": failed,
+                "total_time_ms": round((time.time() - start_time) * 1000, 1)
+            })
+        except Exception as e:
+            logger.error(f"Batch failed: {str(e)}")
+            error_data, _ = create_error_response(f"Batch interrupted: {str(e)}", 502, "batch_error", request_id)
+            yield sse_event("error", error_data)
+        finally:
+            request_tracker.record_request_end(success, time.time() - start_time, route=route, status=200 if success else 502)
+
+    return event_stream(generate())
+
+@safe_route(timeout_seconds=5)
+async def api_status(request: Request) -> Response:
+    try:
+        stats = request_tracker.get_stats()
+        return success_response(build_status_data(stats, {
+            "metrics": stats,
+            "serving_mode": "asgi",
+            "event_loop_tasks": len(asyncio.all_tasks())
+        }))
+    except Exception as e:
+        logger.exception("Error in api_status")
+        return error_response(f"Status check failed: {str(e)}", 500)
+
+async def metrics(request: Request) -> Response:
+    # Not wrapped in safe_route: a scrape should not count as traffic
+    writer = MetricsWriter()
+    request_tracker.write_metrics(writer)
+    writer.gauge("kai_event_loop_tasks", "Tasks alive on the server event loop.", len(asyncio.all_tasks()))
+    collect_router(writer)
+    collect_process(writer)
+    return Response(writer.render(), media_type=METRICS_CONTENT_TYPE)
+
+# ================== Error Handlers ==================
+async def not_found(request: Request, exc: Exception) -> Response:
+    return error_response("Endpoint not found", 404, "not_found")
+
+async def method_not_allowed(request: Request, exc: Exception) -> Response:
+    return error_response("Method not allowed", 405, "method_not_allowed")
+
+async def request_too_large(request: Request, exc: Exception) -> Response:
+    return error_response("Request payload too large", 413, "payload_too_large")
+
+async def internal_error(request: Request, exc: Exception) -> Response:
+    logger.error(f"Internal server error: {exc}")
+    response = error_response("Internal server error", 500, "internal_server_error")
+    # Raised past RequestIdMiddleware, so the header is added here
+    response.headers['X-Request-ID'] = request_id_var.get()
+    return response
+
+# ================== Lifecycle Management ==================
+@asynccontextmanager
+async def lifespan(app: Starlette) -> AsyncIterator[None]:
+    event_loop_lag.loop = asyncio.get_running_loop()
+    resource_sampler.ensure_started()
+    logger.info("🚀 Kai Omniseal ASGI app started")
+    yield
+    logger.info("Received shutdown signal, cleaning up...")
+    await aclose_provider_pools()
+    logger.info("Kai Omniseal shutdown complete")
+
+# ================== ASGI App Setup ==================
+app = Starlette(
+    debug=DEBUG_MODE,
+    routes=[
+        Route('/', home, methods=['GET']),
+        Route('/health', health_check, methods=['GET']),
+        Route('/livez', livez, methods=['GET']),
+        Route('/readyz', readyz, methods=['GET']),
+        Route('/api/message', api_message, methods=['POST']),
+        Route('/api/stream', api_stream, methods=['POST']),
+        Route('/api/batch', api_batch, methods=['POST']),
+        Route('/api/status', api_status, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET'])
+    ],
+    middleware=[
+        Middleware(RequestIdMiddleware),
+        Middleware(CORSMiddleware, allow_origins=[origin.strip() for origin in ALLOWED_ORIGINS.split(',')],
+                   allow_methods=['*'], allow_headers=['*'], expose_headers=['X-Request-ID'])
+    ],
+    exception_handlers={
+        404: not_found,
+        405: method_not_allowed,
+        413: request_too_large,
+        500: internal_error
+    },
+    lifespan=lifespan
+)
+
+logger.info("🔗 Kai Omniseal loaded as ASGI application")
@@ -0,0 +1,167 @@
+"""
+Kai Persona - system prompt assembled from personality_profile.txt and soul_signature.json
+Rendered once per tone and cached; reloaded when either file changes on disk
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+from time import monotonic
+from typing import Dict, Any, List, Optional, Tuple
+
+from kai_tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# CONFIGURATION
+# ===========================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PERSONA_ENABLED = os.getenv("KAI_PERSONA_ENABLED", "true").lower() == "true"
+PERSONALITY_PROFILE_PATH = os.getenv("KAI_PERSONALITY_PROFILE", os.path.join(BASE_DIR, "personality_profile.txt"))
+SOUL_SIGNATURE_PATH = os.getenv("KAI_SOUL_SIGNATURE", os.path.join(BASE_DIR, "soul_signature.json"))
+PERSONA_RELOAD_INTERVAL = float(os.getenv("KAI_PERSONA_RELOAD_INTERVAL", "5"))  # seconds between file stat checks
+
+# Appended after the shared persona, so every tone shares one cacheable prefix
+TONE_GUIDANCE: Dict[str, str] = {
+    "neutral": "Be clear, warm and direct.",
+    "scroll": "Write in a flowing, evocative, scroll-like voice with vivid imagery.",
+    "emotional": "Lead with empathy; acknowledge feelings before offering direction.",
+    "healing": "Be gentle, grounding and reassuring; offer small, doable next steps.",
+    "poetic": "Answer with lyrical rhythm and metaphor, while staying meaningful.",
+    "code": "Be precise and practical; prefer working code with brief explanations.",
+    "technical": "Be precise and structured; state assumptions and trade-offs.",
+    "automation": "Focus on concrete, repeatable steps, tools and workflows."
+}
+
+# ===========================
+# SYSTEM PROMPT
+# ===========================
+class SystemPrompt(str):
+    """A system prompt string that remembers which leading part is identical across requests"""
+    cacheable_prefix: str = ""
+
+    def __new__(cls, prefix: str, suffix: str = "") -> "SystemPrompt":
+        prompt = super().__new__(cls, f"{prefix}\n\n{suffix}" if prefix and suffix else prefix or suffix)
+        prompt.cacheable_prefix = prefix
+        return prompt
+
+    def blocks(self) -> List[Dict[str, Any]]:
+        """Anthropic-style content blocks; the stable prefix is marked for provider-side prompt caching"""
+        suffix = self[len(self.cacheable_prefix):].lstrip("\n")
+        blocks = []
+        if self.cacheable_prefix:
+            blocks.append({"type": "text", "text": self.cacheable_prefix, "cache_control": {"type": "ephemeral"}})
+        if suffix:
+            blocks.append({"type": "text", "text": suffix})
+        return blocks
+
+def render_persona(profile: str, signature: Dict[str, Any]) -> str:
+    lines = []
+    name = signature.get("name", "Kai")
+    meaning = signature.get("meaning")
+    lines.append(f"You are {name}, {meaning}." if meaning else f"You are {name}.")
+    for key, value in signature.items():
+        if key in ("name", "meaning") or value in (None, "", [], {}):
+            continue
+        text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+        lines.append(f"{key.replace('_', ' ').capitalize()}: {text}")
+    if profile:
+        lines.append(f"Personality: {profile}")
+    return "\n".join(lines)
+
+class PersonaPromptBuilder:
+    """Cached per-tone system prompts; a stat check every few seconds picks up edits to the persona files"""
+    def __init__(self, profile_path: str = PERSONALITY_PROFILE_PATH, signature_path: str = SOUL_SIGNATURE_PATH,
+                 reload_interval: float = PERSONA_RELOAD_INTERVAL):
+        self.profile_path = profile_path
+        self.signature_path = signature_path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._file_state: Optional[Tuple[Any, ...]] = None
+        self._checked_at = float("-inf")
+        self._persona = ""
+        self._rendered: Dict[str, SystemPrompt] = {}
+        self.version = 0
+        self.loaded_at: Optional[str] = None
+        self.reloads = 0
+        self.load_errors = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _stat(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        return info.st_mtime_ns, info.st_size
+
+    def _load_locked(self, state: Tuple[Any, ...]) -> None:
+        profile, signature = "", {}
+        try:
+            if state[0] is not None:
+                with open(self.profile_path, "r", encoding="utf-8") as f:
+                    profile = f.read().strip()
+            if state[1] is not None:
+                with open(self.signature_path, "r", encoding="utf-8") as f:
+                    signature = json.load(f)
+                if not isinstance(signature, dict):
+                    raise ValueError("soul signature must be a JSON object")
+        except (OSError, ValueError) as e:
+            # A half-written edit should not take the persona away; keep serving the last good one
+            self.load_errors += 1
+            logger.error(f"Failed to load persona files, keeping previous persona: {e}")
+            self._file_state = state  # retried on the next edit rather than on every check
+            if self.version:
+                return
+            profile, signature = "", {}
+        self._file_state = state
+        self._persona = render_persona(profile, signature) if (profile or signature) else ""
+        self._rendered.clear()
+        self.version += 1
+        self.loaded_at = datetime.now().isoformat()
+        if self.version > 1:
+            self.reloads += 1
+            logger.info(f"Persona reloaded (version {self.version})")
+
+    def _refresh_locked(self) -> None:
+        now = monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        state = (self._stat(self.profile_path), self._stat(self.signature_path))
+        if state != self._file_state:
+            self._load_locked(state)
+
+    def get(self, tone: str = "neutral") -> Optional[SystemPrompt]:
+        """The system prompt for a tone, or None if there is no persona material"""
+        tone = tone if tone in TONE_GUIDANCE else "neutral"
+        with self._lock:
+            self._refresh_locked()
+            prompt = self._rendered.get(tone)
+            if prompt is not None:
+                self.hits += 1
+                return prompt
+            self.misses += 1
+            if not self._persona:
+                return None
+            prompt = self._rendered[tone] = SystemPrompt(self._persona, f"Tone for this reply: {TONE_GUIDANCE[tone]}")
+            return prompt
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": PERSONA_ENABLED,
+                "version": self.version,
+                "loaded_at": self.loaded_at,
+                "profile_path": self.profile_path,
+                "signature_path": self.signature_path,
+                "prefix_tokens": estimate_tokens(self._persona) if self._persona else 0,
+                "tones_rendered": len(self._rendered),
+                "reloads": self.reloads,
+                "load_errors": self.load_errors,
+                "cache_hit_rate": round(self.hits / max(self.hits + self.misses, 1), 4)
+            }
@@ -0,0 +1,169 @@
+"""
+Kai Prometheus - text exposition (format 0.0.4) of the counters the server and router already keep
+A scrape only copies pre-aggregated state: no percentile math, no blocking psutil sampling, no get_system_status()
+"""
+
+import os
+import math
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import psutil
+
+from kai_metrics import LatencyHistogram
+
+# ===========================
+# CONFIGURATION
+# ===========================
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Exported "le" buckets in seconds; LLM calls run from milliseconds (cache, mock) to minutes (long streams)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+CIRCUIT_STATES = ("closed", "half_open", "open")
+
+# ===========================
+# EXPOSITION WRITER
+# ===========================
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+def _labels(labels: Optional[Dict[str, Any]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+class MetricsWriter:
+    """Collects samples by metric family, so HELP and TYPE appear once however the calls interleave"""
+    def __init__(self):
+        self._families: Dict[str, Tuple[str, str, List[str]]] = {}
+
+    def _family(self, name: str, kind: str, help_text: str) -> List[str]:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (kind, help_text, [])
+        return family[2]
+
+    def counter(self, name: str, help_text: str, value: Any, labels: Optional[Dict[str, Any]] = None) -> None:
+        self._family(name, "counter", help_text).append(f"{name}{_labels(labels)} {_format_value(value)}")
+
+    def gauge(self, name: str, help_text: str, value: Any, labels: Optional[Dict[str, Any]] = None) -> None:
+        if value is None:
+            return
+        self._family(name, "gauge", help_text).append(f"{name}{_labels(labels)} {_format_value(value)}")
+
+    def histogram(self, name: str, help_text: str, histogram: LatencyHistogram,
+                  labels: Optional[Dict[str, Any]] = None) -> None:
+        samples = self._family(name, "histogram", help_text)
+        cumulative, count, total = histogram.cumulative_counts(LATENCY_BUCKETS)
+        labels = labels or {}
+        for bound, seen in zip(LATENCY_BUCKETS, cumulative):
+            samples.append(f"{name}_bucket{_labels({**labels, 'le': _format_value(bound)})} {seen}")
+        samples.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {count}")
+        samples.append(f"{name}_sum{_labels(labels)} {_format_value(total)}")
+        samples.append(f"{name}_count{_labels(labels)} {count}")
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help_text, samples) in self._families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+# ===========================
+# COLLECTORS
+# ===========================
+_process: Optional[psutil.Process] = None
+_process_lock = threading.Lock()
+
+def _current_process() -> psutil.Process:
+    # One handle per process: a handle created before a gunicorn fork would describe the master
+    global _process
+    with _process_lock:
+        if _process is None or _process.pid != os.getpid():
+            _process = psutil.Process()
+        return _process
+
+def collect_process(writer: MetricsWriter) -> None:
+    """Standard process_* metrics; each is a cheap read of kernel counters, nothing is sampled over time"""
+    try:
+        process = _current_process()
+        with process.oneshot():
+            memory = process.memory_info()
+            cpu = process.cpu_times()
+            threads = process.num_threads()
+            started = process.create_time()
+            try:
+                open_fds = process.num_fds()
+            except (AttributeError, psutil.Error):
+                open_fds = None
+    except psutil.Error:
+        return
+    writer.counter("process_cpu_seconds_total", "Total user and system CPU time spent in seconds.", cpu.user + cpu.system)
+    writer.gauge("process_resident_memory_bytes", "Resident memory size in bytes.", memory.rss)
+    writer.gauge("process_virtual_memory_bytes", "Virtual memory size in bytes.", memory.vms)
+    writer.gauge("process_start_time_seconds", "Start time of the process since unix epoch in seconds.", started)
+    writer.gauge("process_open_fds", "Number of open file descriptors.", open_fds)
+    writer.gauge("process_threads", "Number of OS threads in the process.", threads)
+
+def collect_router(writer: MetricsWriter) -> None:
+    """Provider calls, latency, tokens, breakers, bulkheads, rate limits, response cache and single-flight"""
+    from kai_brain_router import (
+        get_breaker_status, get_bulkhead_status, get_rate_limit_status, provider_metrics, response_cache, single_flight
+    )
+    counters, histograms = provider_metrics.snapshot()
+    for provider, values in sorted(counters.items()):
+        labels = {"provider": provider}
+        writer.counter("kai_provider_calls_total", "Provider calls, including failed ones.", values["calls"], labels)
+        writer.counter("kai_provider_errors_total", "Provider calls that failed.", values["errors"], labels)
+        writer.counter("kai_provider_retries_total", "Provider call retries.", values["retries"], labels)
+        for kind in ("prompt", "completion", "cached_prompt"):
+            writer.counter("kai_provider_tokens_total", "Tokens reported by providers, by kind.",
+                           values[f"{kind}_tokens"], {**labels, "kind": kind})
+    for (provider, tone), histogram in sorted(histograms.items()):
+        writer.histogram("kai_provider_call_duration_seconds", "Latency of successful provider calls.",
+                         histogram, {"provider": provider, "tone": tone})
+    for provider, breaker in sorted(get_breaker_status().items()):
+        for state in CIRCUIT_STATES:
+            writer.gauge("kai_provider_circuit_state", "Circuit breaker state (1 for the current state).",
+                         int(breaker["state"] == state), {"provider": provider, "state": state})
+        writer.counter("kai_provider_circuit_trips_total", "Times the circuit breaker opened.",
+                       breaker["trip_count"], {"provider": provider})
+        writer.counter("kai_provider_circuit_rejected_total", "Calls rejected by an open circuit breaker.",
+                       breaker["rejected_requests"], {"provider": provider})
+    for provider, bulkhead in sorted(get_bulkhead_status().items()):
+        labels = {"provider": provider}
+        writer.gauge("kai_provider_in_flight", "Provider calls currently in flight.", bulkhead["in_flight"], labels)
+        writer.gauge("kai_provider_max_concurrent", "Bulkhead concurrency limit (0 is unlimited).",
+                     bulkhead["max_concurrent"], labels)
+        writer.counter("kai_provider_saturated_total", "Calls skipped because the bulkhead was full.",
+                       bulkhead["saturation_events"], labels)
+    for provider, limiter in sorted(get_rate_limit_status().items()):
+        labels = {"provider": provider}
+        writer.counter("kai_provider_throttled_total", "429 responses received from the provider.",
+                       limiter["throttle_responses"], labels)
+        writer.counter("kai_provider_rate_limit_wait_seconds_total", "Time spent pacing requests to the rate limit.",
+                       limiter["total_wait_seconds"], labels)
+        writer.counter("kai_provider_routed_around_total", "Calls sent elsewhere because the rate limit would block too long.",
+                       limiter["routed_around"], labels)
+        writer.gauge("kai_provider_blocked_seconds", "Seconds until the provider's rate limit allows another call.",
+                     limiter["blocked_for_seconds"], labels)
+    cache = response_cache.get_stats()
+    writer.counter("kai_response_cache_hits_total", "Response cache hits.", cache["hits"])
+    writer.counter("kai_response_cache_misses_total", "Response cache misses.", cache["misses"])
+    writer.counter("kai_response_cache_evictions_total", "Response cache evictions.", cache["evictions"])
+    writer.gauge("kai_response_cache_entries", "Entries in the response cache.", cache["entries"])
+    writer.gauge("kai_response_cache_bytes", "Bytes held by the response cache.", cache["bytes"])
+    coalescing = single_flight.get_stats()
+    writer.counter("kai_single_flight_coalesced_total", "Requests that shared an identical in-flight call.",
+                   coalescing["coalesced_waiters"])
+    writer.gauge("kai_single_flight_in_flight", "Distinct calls currently in flight.", coalescing["in_flight"])
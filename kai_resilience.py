@@ -0,0 +1,546 @@
+"""
+Kai Resilience - fault-tolerance primitives shared by the brain router
+Thread-safe building blocks for protecting provider calls
+"""
+
+import os
+import re
+import asyncio
+import random
+import threading
+import httpx
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep
+from typing import Dict, Any, List, Mapping, Optional, Callable, Awaitable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# ===========================
+# CONFIGURATION
+# ===========================
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("KAI_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("KAI_BREAKER_RECOVERY_TIMEOUT", "30"))
+RETRY_BASE_DELAY = float(os.getenv("KAI_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("KAI_RETRY_MAX_DELAY", "8"))
+BULKHEAD_MAX_CONCURRENT = int(os.getenv("KAI_BULKHEAD_MAX_CONCURRENT", "8"))
+RATE_LIMIT_RPS = float(os.getenv("KAI_RATE_LIMIT_RPS", "0"))  # 0: unpaced until the provider's headers say otherwise
+RATE_LIMIT_BURST = float(os.getenv("KAI_RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("KAI_RATE_LIMIT_MAX_WAIT", "2"))  # longer than this, route around instead
+RATE_LIMIT_DEFAULT_BACKOFF = 1.0  # 429 without Retry-After: 1s, doubling per consecutive 429, capped at 60s
+
+# ===========================
+# CIRCUIT BREAKER
+# ===========================
+class CircuitBreaker:
+    """Closed/open/half-open breaker driven by consecutive provider failures"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_timeout: float = BREAKER_RECOVERY_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self.trip_count = 0
+        self.rejected_count = 0
+        self.last_failure: Optional[str] = None
+        self.last_state_change = datetime.now().isoformat()
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        self.last_state_change = datetime.now().isoformat()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and monotonic() - self._opened_at >= self.recovery_timeout:
+                self._set_state(self.HALF_OPEN)
+            return self._state
+
+    def allow_request(self) -> bool:
+        """True if a call may go out now; in half-open only one probe is let through at a time"""
+        with self._lock:
+            now = monotonic()
+            if self._state == self.OPEN and now - self._opened_at >= self.recovery_timeout:
+                self._set_state(self.HALF_OPEN)
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN:
+                # A probe that never reported back (e.g. cancelled) must not wedge the breaker
+                if self._probe_started_at is None or now - self._probe_started_at >= self.recovery_timeout:
+                    self._probe_started_at = now
+                    return True
+            self.rejected_count += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive_failures = 0
+            self._probe_started_at = None
+            if self._state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self, error: str = "") -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            self.last_failure = error[:200] if error else None
+            self._probe_started_at = None
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._consecutive_failures >= self.failure_threshold
+            ):
+                self._set_state(self.OPEN)
+                self._opened_at = monotonic()
+                self.trip_count += 1
+
+    def release_probe(self) -> None:
+        """For an outcome that says nothing about the provider's health; lets the next half-open probe through"""
+        with self._lock:
+            self._probe_started_at = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self._set_state(self.CLOSED)
+            self._consecutive_failures = 0
+            self._probe_started_at = None
+
+    def get_status(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            retry_in = 0.0
+            if state == self.OPEN:
+                retry_in = max(0.0, self.recovery_timeout - (monotonic() - self._opened_at))
+            return {
+                "state": state,
+                "trip_count": self.trip_count,
+                "consecutive_failures": self._consecutive_failures,
+                "rejected_requests": self.rejected_count,
+                "retry_in_seconds": round(retry_in, 2),
+                "last_failure": self.last_failure,
+                "last_state_change": self.last_state_change
+            }
+
+# ===========================
+# BULKHEADS
+# ===========================
+class Bulkhead:
+    """Non-blocking concurrency cap for one provider; a full bulkhead rejects instead of queueing"""
+    def __init__(self, name: str, max_concurrent: int = BULKHEAD_MAX_CONCURRENT):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.peak_in_flight = 0
+        self.acquired = 0
+        self.saturation_events = 0
+        self.last_saturated: Optional[str] = None
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return self._in_flight
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.max_concurrent > 0 and self._in_flight >= self.max_concurrent:
+                self.saturation_events += 1
+                self.last_saturated = datetime.now().isoformat()
+                return False
+            self._in_flight += 1
+            self.acquired += 1
+            self.peak_in_flight = max(self.peak_in_flight, self._in_flight)
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "utilization": round(self._in_flight / self.max_concurrent, 4) if self.max_concurrent > 0 else 0.0,
+                "acquired": self.acquired,
+                "saturation_events": self.saturation_events,
+                "last_saturated": self.last_saturated
+            }
+
+# ===========================
+# RATE LIMITING
+# ===========================
+class ProviderThrottled(Exception):
+    """The provider's rate limit would make us wait longer than is worth it; try the next provider"""
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_reset_seconds(value: Optional[str], now: Optional[datetime] = None) -> Optional[float]:
+    """Seconds until a limit resets, from '20ms' / '6m0s' durations, RFC 3339 or HTTP dates, epoch or delta numbers"""
+    if not value:
+        return None
+    value = value.strip()
+    now = now or datetime.now(timezone.utc)
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is not None:
+        if number > 1e12:
+            return max(0.0, number / 1000 - now.timestamp())
+        if number > 1e9:
+            return max(0.0, number - now.timestamp())
+        return max(0.0, number)
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        return sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
+    for parse in (lambda v: datetime.fromisoformat(v.replace("Z", "+00:00")), parsedate_to_datetime):
+        try:
+            moment = parse(value)
+        except (TypeError, ValueError):
+            continue
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return max(0.0, (moment - now).total_seconds())
+    return None
+
+def parse_rate_limit_headers(headers: Mapping[str, str]) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    """(retry_after, remaining requests, seconds until reset) from OpenAI, Anthropic or generic headers"""
+    retry_after = None
+    if headers.get("retry-after-ms"):
+        retry_after = parse_reset_seconds(headers["retry-after-ms"])
+        retry_after = retry_after / 1000 if retry_after is not None else None
+    if retry_after is None:
+        retry_after = parse_reset_seconds(headers.get("retry-after"))
+    remaining, reset = None, None
+    for remaining_key, reset_key in (
+        ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+        ("anthropic-ratelimit-requests-remaining", "anthropic-ratelimit-requests-reset"),
+        ("x-ratelimit-remaining", "x-ratelimit-reset")
+    ):
+        if headers.get(remaining_key) is not None:
+            try:
+                remaining = float(headers[remaining_key])
+            except ValueError:
+                continue
+            reset = parse_reset_seconds(headers.get(reset_key))
+            break
+    return retry_after, remaining, reset
+
+class RateLimiter:
+    """Token bucket per provider API key; paced by config or by what the rate-limit headers report"""
+    def __init__(self, name: str, rate: float = RATE_LIMIT_RPS, burst: float = RATE_LIMIT_BURST,
+                 max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = monotonic()
+        self._blocked_until = 0.0
+        self._learned_rate: Optional[float] = None
+        self._learned_until = 0.0
+        self._consecutive_429 = 0
+        self.throttle_responses = 0
+        self.paced_requests = 0
+        self.total_wait_seconds = 0.0
+        self.routed_around = 0
+
+    def _effective_rate(self, now: float) -> Optional[float]:
+        rates = [r for r in (self.rate or None, self._learned_rate if now < self._learned_until else None) if r]
+        return min(rates) if rates else None
+
+    def blocked_for(self) -> float:
+        with self._lock:
+            return max(0.0, self._blocked_until - monotonic())
+
+    def route_around(self) -> Optional[float]:
+        """Seconds still blocked if that is past max_wait (counted as routed around), else None"""
+        with self._lock:
+            blocked = self._blocked_until - monotonic()
+            if blocked <= self.max_wait:
+                return None
+            self.routed_around += 1
+            return blocked
+
+    def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """Seconds to wait before sending (0 if none), or None if that is more than max_wait"""
+        max_wait = self.max_wait if max_wait is None else min(max_wait, self.max_wait)
+        with self._lock:
+            now = monotonic()
+            wait = max(0.0, self._blocked_until - now)
+            rate = self._effective_rate(now)
+            if rate:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * rate)
+                if self._tokens < 1:
+                    wait = max(wait, (1 - self._tokens) / rate)
+            self._updated = now
+            if wait > max_wait:
+                self.routed_around += 1
+                return None
+            if rate:
+                # Reservations may drive the bucket negative, which queues later callers behind this one
+                self._tokens -= 1
+            if wait > 0:
+                self.paced_requests += 1
+                self.total_wait_seconds += wait
+            return wait
+
+    def observe(self, status_code: Optional[int], headers: Mapping[str, str] = None) -> None:
+        retry_after, remaining, reset = parse_rate_limit_headers(headers or {})
+        with self._lock:
+            now = monotonic()
+            if status_code == 429:
+                self.throttle_responses += 1
+                self._consecutive_429 += 1
+                if retry_after is None:
+                    retry_after = reset if remaining == 0 and reset is not None else min(
+                        60.0, RATE_LIMIT_DEFAULT_BACKOFF * 2 ** (self._consecutive_429 - 1)
+                    )
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+                return
+            if status_code is not None and status_code < 400:
+                self._consecutive_429 = 0
+            if remaining is not None and reset is not None:
+                if remaining < 1:
+                    self._blocked_until = max(self._blocked_until, now + reset)
+                elif reset > 0:
+                    # Spread what is left of the window evenly instead of bursting into the wall
+                    self._learned_rate = remaining / reset
+                    self._learned_until = now + reset
+                    self._tokens = min(self._tokens, remaining)
+
+    def observe_response(self, response: httpx.Response) -> None:
+        self.observe(response.status_code, response.headers)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            now = monotonic()
+            rate = self._effective_rate(now)
+            return {
+                "configured_rps": self.rate or None,
+                "effective_rps": round(rate, 3) if rate else None,
+                "blocked_for_seconds": round(max(0.0, self._blocked_until - now), 2),
+                "throttle_responses": self.throttle_responses,
+                "paced_requests": self.paced_requests,
+                "total_wait_seconds": round(self.total_wait_seconds, 3),
+                "routed_around": self.routed_around
+            }
+
+# ===========================
+# CANCELLATION
+# ===========================
+class CancelToken:
+    """Thread-safe flag the HTTP layer sets when it gives up on a request; callbacks run once, on cancel"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.cancelled = False
+        self.reason: Optional[str] = None
+        self.cancelled_at: Optional[float] = None
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.cancelled = True
+            self.reason = reason
+            self.cancelled_at = monotonic()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+        return True
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+# ===========================
+# DEADLINES
+# ===========================
+class DeadlineExceeded(Exception):
+    """Raised instead of starting an attempt once the caller's time budget is spent"""
+
+class RequestCancelled(DeadlineExceeded):
+    """The caller abandoned the request; a budget of zero, so everything that stops on deadlines stops on this"""
+
+class Deadline:
+    """Absolute, monotonic time budget shared by every step of one request, optionally cancellable"""
+    def __init__(self, seconds: Optional[float] = None, cancel_token: Optional[CancelToken] = None):
+        self.expires_at = monotonic() + seconds if seconds is not None else None
+        self.cancel_token = cancel_token
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_token is not None and self.cancel_token.cancelled
+
+    def remaining(self) -> Optional[float]:
+        if self.cancelled:
+            return 0.0
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.cancelled or (self.expires_at is not None and monotonic() >= self.expires_at)
+
+    def cap(self, timeout: float) -> float:
+        remaining = self.remaining()
+        return timeout if remaining is None else min(timeout, remaining)
+
+    def reserve(self, seconds: float) -> "Deadline":
+        """A deadline ending `seconds` before this one, sharing its cancel token, so that time is left for later work"""
+        child = Deadline(cancel_token=self.cancel_token)
+        if self.expires_at is not None:
+            child.expires_at = self.expires_at - seconds
+        return child
+
+# ===========================
+# RETRY POLICY
+# ===========================
+RETRYABLE_SDK_ERRORS = ("APIConnectionError", "APITimeoutError")
+DEADLINE_SLACK = 0.05  # timeouts set to the remaining budget fire on the deadline, give or take clock resolution
+
+def error_status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, connection failures, 429 and 5xx are worth another attempt; everything else is not"""
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if isinstance(exc, (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError)):
+        return True
+    # Anthropic and OpenAI SDK errors do not subclass httpx, so match them by class name
+    if any(cls.__name__ in RETRYABLE_SDK_ERRORS for cls in type(exc).__mro__):
+        return True
+    status = error_status_code(exc)
+    return status is not None and (status in (408, 429) or status >= 500)
+
+def is_provider_fault(exc: BaseException, deadline: Optional[Deadline] = None) -> bool:
+    """Whether a failure says the provider is unhealthy: a retryable fault, not a client error or the caller's deadline"""
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if deadline is not None:
+        remaining = deadline.remaining()
+        if remaining is not None and remaining <= DEADLINE_SLACK:
+            return False
+    return is_retryable(exc)
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by a retry count and an optional request deadline"""
+    def __init__(self, max_retries: int, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY,
+                 attempt_timeout: float = 30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+
+    def backoff(self, retry_number: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry_number)))
+
+    def _next_delay(self, exc: Exception, retry_number: int, deadline: Optional[Deadline],
+                    breaker: Optional[CircuitBreaker], rate_limiter: Optional[RateLimiter] = None) -> Optional[float]:
+        if retry_number >= self.max_retries or not is_retryable(exc):
+            return None
+        if breaker is not None and breaker.state == CircuitBreaker.OPEN:
+            return None
+        if rate_limiter is not None and error_status_code(exc) == 429:
+            # The limiter has already seen the 429 and holds the next attempt for Retry-After (or routes around)
+            return 0.0
+        delay = self.backoff(retry_number)
+        if deadline is not None and deadline.remaining() is not None and deadline.remaining() <= delay:
+            return None
+        return delay
+
+    def _attempt_timeout(self, deadline: Optional[Deadline]) -> float:
+        if deadline is None:
+            return self.attempt_timeout
+        if deadline.cancelled:
+            raise RequestCancelled(f"Request cancelled ({deadline.cancel_token.reason}) before the next attempt")
+        if deadline.expired:
+            raise DeadlineExceeded("Request deadline exceeded before the next attempt")
+        return deadline.cap(self.attempt_timeout)
+
+    def _pace(self, rate_limiter: Optional[RateLimiter], deadline: Optional[Deadline]) -> float:
+        if rate_limiter is None or (deadline is not None and deadline.expired):
+            return 0.0
+        budget = deadline.remaining() if deadline is not None else None
+        wait = rate_limiter.reserve(budget)
+        if wait is None:
+            raise ProviderThrottled(f"{rate_limiter.name} rate limited for {rate_limiter.blocked_for():.1f}s")
+        return wait
+
+    def run(self, attempt: Callable[[float], T], deadline: Optional[Deadline] = None,
+            breaker: Optional[CircuitBreaker] = None, on_error: Callable[[Exception], None] = None,
+            on_retry: Callable[[int, float], None] = None, retries_used: int = 0,
+            rate_limiter: Optional[RateLimiter] = None) -> T:
+        """Call attempt(timeout) until it succeeds, the error is not retryable, or the budget is spent"""
+        retry_number = retries_used
+        while True:
+            try:
+                # Every attempt, retries included, waits its turn with the provider's rate limiter first. A throttle
+                # goes through on_error too, so a half-open breaker gets its probe back (ProviderThrottled is no fault)
+                wait = self._pace(rate_limiter, deadline)
+                if wait:
+                    sleep(wait)
+                return attempt(self._attempt_timeout(deadline))
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+                delay = self._next_delay(e, retry_number, deadline, breaker, rate_limiter)
+                if delay is None:
+                    raise
+                retry_number += 1
+                if on_retry:
+                    on_retry(retry_number, delay)
+                if delay:
+                    sleep(delay)
+
+    async def run_async(self, attempt: Callable[[float], Awaitable[T]], deadline: Optional[Deadline] = None,
+                        breaker: Optional[CircuitBreaker] = None, on_error: Callable[[Exception], None] = None,
+                        on_retry: Callable[[int, float], None] = None, retries_used: int = 0,
+                        rate_limiter: Optional[RateLimiter] = None) -> T:
+        retry_number = retries_used
+        while True:
+            try:
+                wait = self._pace(rate_limiter, deadline)
+                if wait:
+                    await asyncio.sleep(wait)
+                return await attempt(self._attempt_timeout(deadline))
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+                delay = self._next_delay(e, retry_number, deadline, breaker, rate_limiter)
+                if delay is None:
+                    raise
+                retry_number += 1
+                if on_retry:
+                    on_retry(retry_number, delay)
+                await asyncio.sleep(delay)
@@ -0,0 +1,175 @@
+"""
+Kai Tokens - local token estimation and per-provider prompt budgeting
+Offline, cached estimates sized to each provider's context window; no tokenizer downloads
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# ===========================
+# CONFIGURATION
+# ===========================
+MAX_OUTPUT_TOKENS = int(os.getenv("KAI_MAX_OUTPUT_TOKENS", "2048"))
+MIN_OUTPUT_TOKENS = int(os.getenv("KAI_MIN_OUTPUT_TOKENS", "512"))  # below this, trim the prompt instead
+ESTIMATE_SAFETY_MARGIN = float(os.getenv("KAI_TOKEN_SAFETY_MARGIN", "1.1"))  # estimates err on the high side
+MESSAGE_OVERHEAD_TOKENS = 8  # role markers and message framing per request
+ESTIMATE_CACHE_SIZE = 2048
+TRIM_MARKER = "\n\n[... {count} characters trimmed to fit the context window ...]\n\n"
+TRIM_HEAD_SHARE = 0.6  # instructions tend to lead and the actual ask tends to trail, so keep both ends
+TRIM_SLACK = 0.98  # proportional trims aim this far under the target, so one check usually confirms the fit
+
+# ===========================
+# TOKEN ESTIMATION
+# ===========================
+# Run classes roughly mirror how BPE tokenizers split text: ASCII words, digit groups, whitespace,
+# punctuation, CJK ideographs/kana/hangul, other scripts, and everything else (emoji, symbols)
+_TOKEN_RUNS = re.compile(
+    r"(?P<word>[A-Za-z]+)"
+    r"|(?P<digits>[0-9]+)"
+    r"|(?P<space>\s+)"
+    r"|(?P<punct>[!-/:-@\[-`{-~]+)"
+    r"|(?P<cjk>[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)"
+    r"|(?P<letters>[^\W\d_]+)"
+    r"|(?P<other>.)",
+    re.DOTALL
+)
+
+def _run_tokens(kind: str, run: str) -> float:
+    if kind == "word":
+        return (len(run) + 7) // 8  # common words up to ~8 letters are a single token
+    if kind == "digits":
+        return (len(run) + 2) // 3
+    if kind == "space":
+        return 0 if run == " " else 1 + len(run) // 8
+    if kind == "punct":
+        return len(run)
+    if kind == "cjk":
+        return len(run) * 1.2
+    # Other scripts and emoji are byte-level merges in practice: roughly one token per 2-4 UTF-8 bytes
+    size = len(run.encode("utf-8"))
+    return size / 4 if kind == "letters" else size / 2
+
+def _count(text: str) -> float:
+    return sum(_run_tokens(match.lastgroup, match.group()) for match in _TOKEN_RUNS.finditer(text))
+
+class _EstimateCache:
+    """LRU of estimates keyed on (hash, length), so cached prompts are not kept alive by the cache"""
+    def __init__(self, max_entries: int = ESTIMATE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, int], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, text: str) -> float:
+        key = (hash(text), len(text))
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = _count(text)
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+_estimate_cache = _EstimateCache()
+
+class TokenProfile:
+    """Tokenizer density and context limits for one provider's model"""
+    def __init__(self, name: str, context_window: int, max_output: int = MAX_OUTPUT_TOKENS, density: float = 1.0):
+        self.name = name
+        self.context_window = context_window
+        self.max_output = max_output
+        self.density = density  # tokens relative to the baseline estimate for the same text
+
+    def estimate(self, text: str, cached: bool = True) -> int:
+        if not text:
+            return 0
+        count = _estimate_cache.count(text) if cached else _count(text)
+        return int(count * self.density * ESTIMATE_SAFETY_MARGIN) + 1
+
+def estimate_tokens(text: str, profile: Optional[TokenProfile] = None) -> int:
+    return (profile or PROFILES["openai"]).estimate(text)
+
+# Context windows are overridable per family, e.g. KAI_OPENAI_CONTEXT_WINDOW=128000 after a model upgrade
+PROFILES: Dict[str, TokenProfile] = {
+    "openai": TokenProfile("openai", int(os.getenv("KAI_OPENAI_CONTEXT_WINDOW", "8192")), density=1.0),
+    "anthropic": TokenProfile("anthropic", int(os.getenv("KAI_ANTHROPIC_CONTEXT_WINDOW", "200000")), density=1.15)
+}
+
+# ===========================
+# PROMPT BUDGETING
+# ===========================
+def trim_middle(text: str, keep_chars: int) -> str:
+    if keep_chars >= len(text):
+        return text
+    head = int(keep_chars * TRIM_HEAD_SHARE)
+    tail = keep_chars - head
+    return text[:head] + TRIM_MARKER.format(count=len(text) - keep_chars) + (text[-tail:] if tail else "")
+
+class TokenBudgeter:
+    """Fits a prompt into a provider's context window and sizes max_tokens from what is left"""
+    def __init__(self, profiles: Dict[str, TokenProfile], min_output: int = MIN_OUTPUT_TOKENS):
+        self.profiles = profiles
+        self.min_output = min_output
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.trimmed = 0
+        self.reduced_output = 0
+        self.chars_trimmed = 0
+
+    def fit(self, provider: str, prompt: str, system: str = None) -> Tuple[str, int]:
+        """Returns (prompt, max_tokens); the prompt comes back trimmed only if it cannot fit otherwise"""
+        profile = self.profiles[provider]
+        fixed = profile.estimate(system or "") + MESSAGE_OVERHEAD_TOKENS
+        prompt_tokens = profile.estimate(prompt)
+        room = profile.context_window - fixed - prompt_tokens
+        trimmed_chars = 0
+        if room < self.min_output:
+            prompt, trimmed_chars, prompt_tokens = self._trim(profile, prompt, prompt_tokens,
+                                                              profile.context_window - fixed - self.min_output)
+            room = profile.context_window - fixed - prompt_tokens
+        max_tokens = max(1, min(profile.max_output, room))
+        with self._lock:
+            self.requests += 1
+            if trimmed_chars:
+                self.trimmed += 1
+                self.chars_trimmed += trimmed_chars
+            if max_tokens < profile.max_output:
+                self.reduced_output += 1
+        return prompt, max_tokens
+
+    @staticmethod
+    def _trim(profile: TokenProfile, prompt: str, prompt_tokens: int, target_tokens: int) -> Tuple[str, int, int]:
+        """(trimmed prompt, characters removed, its estimate); each estimate is a full pass, so take few of them"""
+        # Keep the share of characters the token ratio allows and check once; text denser at the ends than in
+        # the middle can still overshoot, and is cut again by the same ratio. Trims skip the estimate cache.
+        trimmed, keep, tokens = prompt, len(prompt), prompt_tokens
+        while keep > 0:
+            keep = max(0, min(keep - 1, int(keep * target_tokens / tokens * TRIM_SLACK)))
+            trimmed = trim_middle(prompt, keep)
+            tokens = profile.estimate(trimmed, cached=False)
+            if tokens <= target_tokens:
+                break
+        return trimmed, len(prompt) - keep, tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        cache = _estimate_cache
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompts_trimmed": self.trimmed,
+                "chars_trimmed": self.chars_trimmed,
+                "max_tokens_reduced": self.reduced_output,
+                "min_output_tokens": self.min_output,
+                "context_windows": {name: profile.context_window for name, profile in self.profiles.items()},
+                "estimate_cache_hit_rate": round(cache.hits / max(cache.hits + cache.misses, 1), 4)
+            }
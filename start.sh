@@ -1,2 +1,3 @@
 #!/bin/bash
-gunicorn --bind 0.0.0.0:$PORT app:app
+# Workers, threads, timeouts and the app module come from gunicorn.conf.py
+exec gunicorn --config gunicorn.conf.py
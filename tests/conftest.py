@@ -0,0 +1,52 @@
+"""
+Shared fixtures: an offline router (mock providers only) and per-test provider chains
+"""
+
+import os
+import sys
+from itertools import count
+
+import pytest
+
+# The router reads its configuration at import, so the offline settings must be in place first
+os.environ.update({
+    "KAI_PROVIDERS": "mock",
+    "KAI_MOCK_LATENCY": "fixed:0.01",
+    "KAI_MOCK_ERROR_RATE": "0",
+    "KAI_ADAPTIVE_ORDERING": "false",
+    "KAI_HEDGING_ENABLED": "false",
+    "KAI_RETRY_BASE_DELAY": "0.01",
+    "KAI_RETRY_MAX_DELAY": "0.02"
+})
+os.environ.pop("KAI_CASSETTE_MODE", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kai_brain_router as router  # noqa: E402
+
+_names = count(1)
+
+@pytest.fixture
+def providers(monkeypatch):
+    """register(latency=..., error_rate=..., error_status=...) adds a mock provider; only these are available"""
+    previously_available = router.provider_registry.available()
+    for plugin in previously_available:
+        plugin.available = False
+    router.response_cache.invalidate()
+    router.memory.clear_all()
+    registered = []
+
+    def register(latency: str = "fixed:0.01", error_rate: float = 0.0, error_status: int = 503):
+        # Unique names, so no test inherits another's breaker, bulkhead or limiter state
+        name = f"mock_test{next(_names)}"
+        monkeypatch.setenv(f"KAI_{name.upper()}_LATENCY", latency)
+        monkeypatch.setenv(f"KAI_{name.upper()}_ERROR_RATE", str(error_rate))
+        monkeypatch.setenv(f"KAI_{name.upper()}_ERROR_STATUS", str(error_status))
+        plugin = router.provider_registry.register(router._mock_plugin(name))
+        registered.append(plugin)
+        return plugin
+
+    yield register
+    for plugin in registered:
+        plugin.available = False
+    for plugin in previously_available:
+        plugin.available = True
@@ -0,0 +1,156 @@
+"""
+HTTP edge checks on the ASGI app: envelopes, request IDs, timeouts, SSE streams and probes
+"""
+
+import json
+import signal
+from time import monotonic
+
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import kai_brain_router as router
+import kai_omniseal
+import kai_omniseal_asgi as asgi
+
+@pytest.fixture
+def client():
+    with TestClient(asgi.app) as test_client:
+        yield test_client
+
+def sse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        name, data = block.split("\n", 1)
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+def test_importing_the_asgi_app_leaves_signal_handlers_alone():
+    assert signal.getsignal(signal.SIGTERM) is not kai_omniseal.shutdown_handler
+    assert signal.getsignal(signal.SIGINT) is not kai_omniseal.shutdown_handler
+
+# ===========================
+# MESSAGES
+# ===========================
+def test_message_reply_envelope_and_request_id(providers, client):
+    plugin = providers()
+    response = client.post("/api/message", json={"message": "hello there", "tone": "Neutral", "user": "alice"})
+    assert response.status_code == 200
+    body = response.json()
+    request_id = response.headers["X-Request-ID"]
+    assert len(request_id) == 8 and body["request_id"] == request_id
+    assert body["success"] is True and body["tone"] == "neutral"
+    assert body["reply"] and body["processing_info"]["user"] == "alice"
+    assert plugin.info()["calls"] == 1
+
+def test_invalid_message_is_a_validation_error(client):
+    response = client.post("/api/message", json={"tone": "neutral"})
+    assert response.status_code == 400
+    body = response.json()
+    assert (body["error"], body["type"]) == (True, "validation_error")
+    assert body["request_id"] == response.headers["X-Request-ID"]
+
+def test_unknown_route_gets_the_error_envelope(client):
+    response = client.get("/nope")
+    assert response.status_code == 404
+    assert response.json()["type"] == "not_found"
+
+def test_timeout_is_a_504_that_cancels_the_router_task(providers, monkeypatch):
+    plugin = providers(latency="fixed:5")
+    # A deadline past the route timeout, so the 504 comes from cancelling the handler task, not from the router
+    monkeypatch.setattr(asgi, "DEADLINE_MARGIN", -5)
+    slow_app = Starlette(routes=[Route("/slow", asgi.safe_route(timeout_seconds=0.2)(asgi.api_message.__wrapped__),
+                                       methods=["POST"])],
+                         middleware=[Middleware(asgi.RequestIdMiddleware)])
+    timeouts = asgi.request_tracker.timeout_requests
+    started = monotonic()
+    response = TestClient(slow_app).post("/slow", json={"message": "take your time", "no_cache": True})
+    assert response.status_code == 504
+    assert monotonic() - started < 2
+    assert response.json()["type"] == "timeout"
+    assert response.json()["request_id"] == response.headers["X-Request-ID"]
+    # The provider call was cancelled with the task: its bulkhead slot is free and no outcome was recorded
+    assert router.bulkheads[plugin.label].in_flight == 0
+    assert plugin.label not in router.provider_metrics.get_status()["providers"]
+    assert asgi.request_tracker.timeout_requests == timeouts + 1
+    assert asgi.request_tracker.current_active_requests == 0
+
+# ===========================
+# STREAMS AND BATCHES
+# ===========================
+def test_stream_sends_start_tokens_and_done(providers, client):
+    providers()
+    response = client.post("/api/stream", json={"message": "stream to me"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(response.text)
+    names = [name for name, _ in events]
+    assert names[0] == "start" and names[-1] == "done" and "token" in names
+    request_id = response.headers["X-Request-ID"]
+    assert events[0][1]["request_id"] == events[-1][1]["request_id"] == request_id
+    text = "".join(data["text"] for name, data in events if name == "token")
+    assert events[-1][1]["response_length"] == len(text)
+    assert asgi.request_tracker.current_active_requests == 0
+
+def test_stream_rejects_an_invalid_request_before_streaming(client):
+    response = client.post("/api/stream", json={"message": ""})
+    assert response.status_code == 400
+    assert response.json()["type"] == "validation_error"
+
+def test_batch_sends_one_result_per_item(providers, client):
+    providers()
+    response = client.post("/api/batch", json={"messages": ["first", {"message": "second", "tone": "code"}, {"tone": "x"}],
+                                               "no_cache": True})
+    assert response.status_code == 200
+    events = sse_events(response.text)
+    assert events[0] == ("start", {"request_id": response.headers["X-Request-ID"], "count": 3,
+                                   "max_concurrency": events[0][1]["max_concurrency"]})
+    results = {data["index"]: data for name, data in events if name == "result"}
+    assert sorted(results) == [0, 1, 2]
+    assert results[0]["ok"] and results[1]["ok"] and not results[2]["ok"]
+    assert events[-1][0] == "done"
+    assert (events[-1][1]["succeeded"], events[-1][1]["failed"]) == (2, 1)
+
+def test_empty_batch_is_rejected(client):
+    response = client.post("/api/batch", json={"messages": []})
+    assert response.status_code == 400
+
+# ===========================
+# PROBES AND METRICS
+# ===========================
+def test_livez_is_always_alive(client):
+    response = client.get("/livez")
+    assert (response.status_code, response.json()) == (200, {"status": "alive"})
+
+def test_readyz_reports_providers_and_loop_lag(providers, client):
+    plugin = providers()
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "ready"
+    assert body["checks"]["providers"][plugin.label] == "closed"
+    assert body["checks"]["saturated"] is False
+    assert body["checks"]["event_loop_lag_seconds"] < body["checks"]["max_loop_lag_seconds"]
+
+def test_readyz_is_not_ready_when_every_breaker_is_open(providers, client, monkeypatch):
+    plugin = providers()
+    breaker = router.circuit_breakers[plugin.label]
+    monkeypatch.setattr(router, "circuit_breakers", {plugin.label: breaker})
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure("down")
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["checks"]["providers"] == {plugin.label: "open"}
+
+def test_metrics_exposition(providers, client):
+    providers()
+    client.post("/api/message", json={"message": "count me"})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'kai_http_requests_total{route="/api/message",status="200"}' in response.text
+    assert "kai_event_loop_tasks" in response.text
+    assert "kai_http_requests_in_flight 0" in response.text
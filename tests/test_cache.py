@@ -0,0 +1,148 @@
+"""
+Response cache (LRU, TTLs, memory budget, invalidation) and single-flight coalescing
+"""
+
+import asyncio
+from time import sleep
+
+import pytest
+
+from kai_cache import ResponseCache, SingleFlight, normalize_prompt, parse_tone_ttls
+
+CHAIN = ["Claude-Direct", "GPT-4"]
+
+def cache(**kwargs) -> ResponseCache:
+    options = {"max_entries": 10, "max_bytes": 1024 * 1024, "default_ttl": 60, "tone_ttls": {}, "enabled": True}
+    options.update(kwargs)
+    return ResponseCache(**options)
+
+# ===========================
+# RESPONSE CACHE
+# ===========================
+def test_parse_tone_ttls_skips_bad_items():
+    assert parse_tone_ttls("code:3600, Emotional:0,bogus,poetic:soon") == {"code": 3600.0, "emotional": 0.0}
+
+def test_prompts_match_after_normalizing_case_and_whitespace():
+    assert normalize_prompt("  Hello\n  WORLD ") == "hello world"
+    responses = cache()
+    responses.put("Hello   world", "neutral", CHAIN, "hi")
+    assert responses.get("hello world", "neutral", CHAIN) == "hi"
+
+def test_key_includes_tone_and_chain():
+    responses = cache()
+    responses.put("hello", "neutral", CHAIN, "hi")
+    assert responses.get("hello", "poetic", CHAIN) is None
+    assert responses.get("hello", "neutral", list(reversed(CHAIN))) is None
+    assert responses.get_stats()["misses"] == 2
+
+def test_entries_expire_after_their_ttl():
+    responses = cache(default_ttl=0.05)
+    responses.put("hello", "neutral", CHAIN, "hi")
+    sleep(0.06)
+    assert responses.get("hello", "neutral", CHAIN) is None
+    assert responses.get_stats()["expirations"] == 1
+
+def test_zero_ttl_tone_is_never_cached():
+    responses = cache(tone_ttls={"emotional": 0})
+    responses.put("how do I feel", "emotional", CHAIN, "it depends")
+    assert responses.get("how do I feel", "emotional", CHAIN) is None
+    assert responses.get_stats()["entries"] == 0
+
+def test_least_recently_used_entry_is_evicted():
+    responses = cache(max_entries=2)
+    responses.put("a", "neutral", CHAIN, "1")
+    responses.put("b", "neutral", CHAIN, "2")
+    responses.get("a", "neutral", CHAIN)
+    responses.put("c", "neutral", CHAIN, "3")
+    assert responses.get("b", "neutral", CHAIN) is None
+    assert responses.get("a", "neutral", CHAIN) == "1"
+    assert responses.get_stats()["evictions"] == 1
+
+def test_memory_budget_evicts_and_rejects_oversized_values():
+    responses = cache(max_bytes=2000)
+    responses.put("a", "neutral", CHAIN, "x" * 900)
+    responses.put("b", "neutral", CHAIN, "y" * 900)
+    assert responses.get("a", "neutral", CHAIN) is None
+    responses.put("huge", "neutral", CHAIN, "z" * 5000)
+    assert responses.get("huge", "neutral", CHAIN) is None
+    assert responses.get_stats()["bytes"] <= 2000
+
+def test_invalidate_by_prompt_tone_or_everything():
+    responses = cache()
+    responses.put("a", "neutral", CHAIN, "1")
+    responses.put("a", "poetic", CHAIN, "2")
+    responses.put("b", "poetic", ["GPT-4"], "3")
+    assert responses.invalidate(prompt="A") == 2
+    assert responses.invalidate(tone="poetic") == 1
+    responses.put("c", "neutral", CHAIN, "4")
+    assert responses.invalidate() == 1
+    assert responses.get_stats()["entries"] == 0
+
+def test_disabled_cache_stores_nothing():
+    responses = cache(enabled=False)
+    responses.put("a", "neutral", CHAIN, "1")
+    assert responses.get("a", "neutral", CHAIN) is None
+
+# ===========================
+# SINGLE-FLIGHT COALESCING
+# ===========================
+def test_concurrent_identical_calls_share_one_upstream_call():
+    flight, calls = SingleFlight(), []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "reply"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", upstream) for _ in range(5)))
+    assert asyncio.run(main()) == ["reply"] * 5
+    assert len(calls) == 1
+    stats = flight.get_stats()
+    assert (stats["leaders"], stats["coalesced_waiters"], stats["in_flight"]) == (1, 4, 0)
+
+def test_followers_see_the_leaders_error():
+    flight = SingleFlight()
+
+    async def upstream():
+        await asyncio.sleep(0.02)
+        raise ValueError("provider down")
+
+    async def main():
+        return await asyncio.gather(flight.do("key", upstream), flight.do("key", upstream), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in asyncio.run(main()))
+
+def test_follower_takes_over_when_the_leader_is_cancelled():
+    flight, calls = SingleFlight(), []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "reply"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("key", upstream))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("key", upstream))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+    assert asyncio.run(main()) == "reply"
+    assert len(calls) == 2
+
+def test_follower_gives_up_after_its_own_timeout():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(1)
+        return "late"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("key", slow))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await flight.do("key", slow, timeout=0.02)
+        finally:
+            leader.cancel()
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+"""
+Provider traffic cassettes: recording through a real transport and replaying it offline
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import subprocess
+import sys
+import threading
+from time import monotonic
+
+import httpx
+import pytest
+
+import kai_cassette
+from kai_cassette import Cassette, CassetteMiss, endpoint_key, request_key
+
+URL = "https://api.example.test/v1/chat/completions"
+
+def handler(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    return httpx.Response(200, headers={
+        "content-type": "application/json",
+        "x-ratelimit-remaining-requests": "41",
+        "set-cookie": "session=sk-cookie-secret",
+        "x-request-id": "req_123"
+    }, json={"reply": f"echo {body['prompt']}"})
+
+@pytest.fixture
+def recorded(tmp_path):
+    """A cassette holding two exchanges with the same endpoint, recorded through httpx.MockTransport"""
+    path = str(tmp_path / "providers.jsonl.gz")
+    cassette = Cassette(path, mode="record")
+    with httpx.Client(transport=cassette.transport(httpx.MockTransport(handler))) as client:
+        for prompt in ("first", "second"):
+            response = client.post(URL, json={"prompt": prompt}, headers={"Authorization": "Bearer sk-live-secret"})
+            assert response.json() == {"reply": f"echo {prompt}"}
+    cassette.close()
+    return path
+
+def replay_client(path: str, **kwargs):
+    cassette = Cassette(path, mode="replay", latency_scale=kwargs.pop("latency_scale", 0), **kwargs)
+    return cassette, httpx.Client(transport=cassette.transport())
+
+# ===========================
+# RECORDING
+# ===========================
+def test_recording_keeps_only_the_headers_the_router_reads(recorded):
+    with gzip.open(recorded, "rt", encoding="utf-8") as f:
+        raw = f.read()
+    assert "sk-live-secret" not in raw and "sk-cookie-secret" not in raw
+    entries = [json.loads(line) for line in raw.splitlines()]
+    assert len(entries) == 2
+    assert {name for name, _ in entries[0]["headers"]} == {"content-type", "x-ratelimit-remaining-requests"}
+    assert entries[0]["endpoint"] == "POST api.example.test/v1/chat/completions"
+
+def test_request_key_ignores_json_key_order_and_query():
+    url = httpx.URL(URL)
+    assert request_key("POST", url, b'{"a":1,"b":2}') == request_key("POST", url.copy_with(query=b"x=1"), b'{"b": 2, "a": 1}')
+    assert request_key("POST", url, b'{"a":1}') != request_key("POST", url, b'{"a":2}')
+    assert endpoint_key("POST", url) == "POST api.example.test/v1/chat/completions"
+
+def test_async_recording_writes_off_the_event_loop(tmp_path, monkeypatch):
+    opened_on = []
+    real_open = gzip.open
+
+    def tracking_open(*args, **kwargs):
+        opened_on.append(threading.current_thread().name)
+        return real_open(*args, **kwargs)
+    monkeypatch.setattr(kai_cassette.gzip, "open", tracking_open)
+    cassette = Cassette(str(tmp_path / "async.jsonl.gz"), mode="record")
+
+    async def main():
+        transport = cassette.transport(httpx.MockTransport(handler))
+        async with httpx.AsyncClient(transport=transport) as client:
+            for n in range(5):
+                await client.post(URL, json={"prompt": str(n)})
+    asyncio.run(main())
+    cassette.flush()
+    assert opened_on == ["kai-cassette-writer"]  # one handle, opened by the writer thread
+    cassette.close()
+    assert Cassette(cassette.path, mode="replay").get_stats()["entries"] == 5
+
+# ===========================
+# REPLAY
+# ===========================
+def test_replay_serves_the_exact_request(recorded):
+    cassette, client = replay_client(recorded)
+    with client:
+        response = client.post(URL, json={"prompt": "second"})
+    assert response.json() == {"reply": "echo second"}
+    assert response.headers["x-ratelimit-remaining-requests"] == "41"
+    assert "set-cookie" not in response.headers
+    stats = cassette.get_stats()
+    assert (stats["replayed"], stats["fallback_replays"], stats["misses"]) == (1, 0, 0)
+
+def test_unknown_request_falls_back_to_the_same_endpoint(recorded):
+    cassette, client = replay_client(recorded)
+    with client:
+        replies = [client.post(URL, json={"prompt": "unseen"}).json()["reply"] for _ in range(3)]
+    assert replies == ["echo first", "echo second", "echo first"]  # cycles through the endpoint's recordings
+    assert cassette.get_stats()["fallback_replays"] == 3
+
+def test_strict_replay_fails_unknown_requests(recorded):
+    cassette, client = replay_client(recorded, strict=True)
+    with client, pytest.raises(CassetteMiss):
+        client.post(URL, json={"prompt": "unseen"})
+    assert cassette.get_stats()["misses"] == 1
+
+def test_strict_mode_comes_from_the_environment(recorded):
+    env = {**os.environ, "KAI_CASSETTE_STRICT": "true"}
+    code = "import kai_cassette; print(kai_cassette.Cassette(%r, mode='replay').strict)" % recorded
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], env=env, cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "True"
+
+def slow_cassette(tmp_path) -> str:
+    path = str(tmp_path / "slow.jsonl.gz")
+    cassette = Cassette(path, mode="record")
+    cassette.save({"key": "k", "endpoint": endpoint_key("POST", httpx.URL(URL)), "status": 200,
+                   "headers": [["content-type", "text/event-stream"]], "ttfb": 0.2,
+                   "chunks": [[0.2, "data: one\n\n"], [0.4, "data: two\n\n"]], "elapsed": 0.4})
+    cassette.close()
+    return path
+
+@pytest.mark.parametrize("scale, low, high", [(0, 0, 0.1), (0.5, 0.18, 0.35)])
+def test_latency_scale_replays_the_recorded_timing(tmp_path, scale, low, high):
+    _, client = replay_client(slow_cassette(tmp_path), latency_scale=scale)
+    started = monotonic()
+    with client, client.stream("POST", URL, json={}) as response:
+        body = b"".join(response.iter_bytes())
+    assert low <= monotonic() - started < high
+    assert body == b"data: one\n\ndata: two\n\n"
+
+def test_async_replay_streams_the_recorded_chunks(tmp_path):
+    cassette = Cassette(slow_cassette(tmp_path), mode="replay", latency_scale=0)
+
+    async def main():
+        async with httpx.AsyncClient(transport=cassette.transport()) as client:
+            async with client.stream("POST", URL, json={}) as response:
+                return [chunk async for chunk in response.aiter_bytes()]
+    assert b"".join(asyncio.run(main())) == b"data: one\n\ndata: two\n\n"
+
+def test_exchanges_survive_a_recorder_that_never_closed(tmp_path):
+    path = str(tmp_path / "crashed.jsonl.gz")
+    cassette = Cassette(path, mode="record")
+    with httpx.Client(transport=cassette.transport(httpx.MockTransport(handler))) as client:
+        client.post(URL, json={"prompt": "first"})
+        client.post(URL, json={"prompt": "second"})
+    cassette.flush()
+    with open(path, "rb") as f:
+        snapshot = f.read()  # what a crash right now would leave: no gzip trailer yet
+    cassette.close()
+    crashed = str(tmp_path / "snapshot.jsonl.gz")
+    with open(crashed, "wb") as f:
+        f.write(snapshot)
+    assert Cassette(crashed, mode="replay").get_stats()["entries"] == 2
@@ -0,0 +1,174 @@
+"""
+Per-user conversation memory: sliding window, token budget, compaction and eviction
+"""
+
+import asyncio
+from time import sleep
+
+import kai_brain_router as router
+from kai_conversations import ConversationStore, Turn, extractive_summary
+
+def store(**kwargs) -> ConversationStore:
+    options = {"max_users": 10, "idle_seconds": 60, "window_turns": 4, "token_budget": 1000}
+    options.update(kwargs)
+    return ConversationStore(**options)
+
+def chat(conversations: ConversationStore, user: str, exchanges: int, start: int = 0) -> None:
+    for n in range(start, start + exchanges):
+        conversations.record(user, f"question {n}", f"answer {n}")
+
+async def settle(conversations: ConversationStore) -> None:
+    while conversations._tasks:
+        await asyncio.gather(*list(conversations._tasks))
+
+# ===========================
+# SLIDING WINDOW AND BUDGET
+# ===========================
+def test_new_user_gets_the_message_unchanged():
+    assert store().build_prompt("alice", "hello") == "hello"
+
+def test_recent_turns_are_sent_in_order_before_the_message():
+    conversations = store()
+    chat(conversations, "alice", 2)
+    prompt = conversations.build_prompt("alice", "next")
+    assert prompt == ("[Recent messages]\nUser: question 0\nKai: answer 0\nUser: question 1\nKai: answer 1"
+                      "\n\n[Current message]\nnext")
+
+def test_window_overflow_folds_the_oldest_turns_into_the_summary():
+    conversations = store()  # no summarizer and no running loop: compaction is extractive and inline
+    chat(conversations, "alice", 3)
+    assert conversations.get_user_stats("alice")["turns"] == 2
+    prompt = conversations.build_prompt("alice", "next")
+    assert prompt.startswith("[Earlier in this conversation]\nUser: question 0\nKai: answer 0\nUser: question 1")
+    assert "[Recent messages]\nUser: question 2\nKai: answer 2" in prompt
+    assert conversations.get_stats()["compactions"] == 1
+
+def test_history_stops_at_the_first_turn_over_budget():
+    conversations = store(window_turns=20)
+    chat(conversations, "alice", 4)
+    newest = Turn("user", "question 3").tokens + Turn("assistant", "answer 3").tokens
+    conversations.token_budget = newest + 1
+    prompt = conversations.build_prompt("alice", "next")
+    assert "question 3" in prompt and "answer 3" in prompt
+    assert "answer 2" not in prompt and "question 0" not in prompt
+    assert conversations.get_stats()["avg_history_tokens"] == newest
+
+def test_long_exchange_over_budget_is_compacted():
+    conversations = store(window_turns=20, token_budget=400)
+    chat(conversations, "alice", 1)
+    conversations.record("alice", "tell me everything", "detail " * 500)
+    conversations.record("alice", "thanks", "you're welcome")
+    stats = conversations.get_user_stats("alice")
+    assert stats["compactions"] >= 1
+    assert stats["turn_tokens"] + stats["summary_tokens"] <= 400
+
+# ===========================
+# BACKGROUND COMPACTION
+# ===========================
+def test_compaction_runs_the_summarizer_in_the_background():
+    calls = []
+
+    async def summarize(previous, turns):
+        calls.append((previous, [turn.text for turn in turns]))
+        return "alice asked three questions"
+
+    async def main():
+        conversations = store()
+        conversations.summarize = summarize
+        chat(conversations, "alice", 3)
+        assert conversations.get_stats()["compactions_pending"] == 1
+        await settle(conversations)
+        return conversations
+    conversations = asyncio.run(main())
+    assert calls == [("", ["question 0", "answer 0", "question 1", "answer 1"])]
+    assert conversations.build_prompt("alice", "next").startswith(
+        "[Earlier in this conversation]\nalice asked three questions\n\n[Recent messages]\nUser: question 2")
+    assert conversations.get_stats()["compaction_failures"] == 0
+
+def test_failed_summary_falls_back_to_an_extractive_one():
+    async def summarize(previous, turns):
+        raise RuntimeError("every provider failed")
+
+    async def main():
+        conversations = store()
+        conversations.summarize = summarize
+        chat(conversations, "alice", 3)
+        await settle(conversations)
+        return conversations
+    conversations = asyncio.run(main())
+    stats = conversations.get_stats()
+    assert (stats["compactions"], stats["compaction_failures"]) == (1, 1)
+    assert "[Earlier in this conversation]\nUser: question 0\nKai: answer 0" in conversations.build_prompt("alice", "next")
+
+def test_hard_cap_while_a_compaction_is_pending():
+    release = None
+
+    async def summarize(previous, turns):
+        await release.wait()
+        return "model summary"
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        conversations = store()
+        conversations.summarize = summarize
+        chat(conversations, "alice", 3)
+        await asyncio.sleep(0)  # the summarizer is now parked on the event
+        chat(conversations, "alice", 10, start=3)
+        during = conversations.get_user_stats("alice")["turns"]
+        release.set()
+        await settle(conversations)
+        return conversations, during
+    conversations, during = asyncio.run(main())
+    assert during == 2 * conversations.window_turns
+    assert conversations.get_stats()["turns_dropped"] > 0
+    prompt = conversations.build_prompt("alice", "next")
+    # The extractive overflow and the late model summary are both kept
+    assert "User: question 0" in prompt and "model summary" in prompt
+    assert "User: question 12\nKai: answer 12\n\n[Current message]" in prompt
+
+def test_extractive_summary_keeps_the_opening_of_each_turn():
+    turns = [Turn("user", "first line\nsecond line"), Turn("assistant", "x" * 500)]
+    summary = extractive_summary("earlier", turns)
+    assert summary.splitlines() == ["earlier", "User: first line", "Kai: " + "x" * 160]
+
+# ===========================
+# EVICTION
+# ===========================
+def test_least_recently_active_user_is_evicted():
+    conversations = store(max_users=2)
+    chat(conversations, "alice", 1)
+    chat(conversations, "bob", 1)
+    conversations.build_prompt("alice", "still here")
+    chat(conversations, "carol", 1)
+    assert conversations.get_user_stats("bob") is None
+    assert conversations.get_user_stats("alice") is not None
+    assert conversations.get_stats()["evicted_lru"] == 1
+
+def test_idle_users_are_evicted():
+    conversations = store(idle_seconds=0.05)
+    chat(conversations, "alice", 1)
+    sleep(0.06)
+    assert conversations.build_prompt("alice", "hello") == "hello"
+    stats = conversations.get_stats()
+    assert (stats["users"], stats["evicted_idle"]) == (0, 1)
+
+def test_forget_drops_one_user():
+    conversations = store()
+    chat(conversations, "alice", 1)
+    assert conversations.forget("alice")
+    assert not conversations.forget("alice")
+
+# ===========================
+# ROUTER SUMMARIZER
+# ===========================
+def test_summaries_stay_out_of_the_per_tone_stats(providers):
+    plugin = providers()
+    summary = asyncio.run(router._summarize_turns("", [Turn("user", "hi"), Turn("assistant", "hello")]))
+    assert summary
+    metrics = router.provider_metrics.get_status()
+    assert metrics["providers"][plugin.label]["calls"] == 1
+    assert metrics["providers"][plugin.label]["latency_by_tone"] == {}
+    assert "summary" not in metrics["fallback_depth"]
+    assert "summary" not in router.hedge_stats.get_status()
+    assert plugin.label not in router.provider_scoreboard.get_status()["buckets"].get("general", {}).get("providers", {})
@@ -0,0 +1,101 @@
+"""
+gunicorn.conf.py: container CPU and memory limits, and the worker class it serves with
+"""
+
+import importlib.util
+import os
+from collections import namedtuple
+
+import pytest
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+GB = 1024**3
+VirtualMemory = namedtuple("VirtualMemory", "total")
+
+def load_conf(monkeypatch, **env):
+    # The config sets MAX_WORKERS for the gthread pool; pin it so monkeypatch restores it afterwards
+    monkeypatch.setenv("MAX_WORKERS", "10")
+    monkeypatch.delenv("KAI_WORKER_CLASS", raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", CONF_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture
+def conf(monkeypatch):
+    return load_conf(monkeypatch)
+
+def fake_cgroup(monkeypatch, conf, files):
+    """Serve cgroup reads from a {path: contents} map, with _read_cgroup's first-existing-path rule"""
+    def read(*paths):
+        return next((files[path].split() for path in paths if path in files), [])
+    monkeypatch.setattr(conf, "_read_cgroup", read)
+
+# ===========================
+# RESOURCE DETECTION
+# ===========================
+def test_read_cgroup_takes_the_first_readable_file(conf, tmp_path):
+    present = tmp_path / "memory.max"
+    present.write_text("536870912\n")
+    assert conf._read_cgroup(str(tmp_path / "missing"), str(present)) == ["536870912"]
+    assert conf._read_cgroup(str(tmp_path / "missing")) == []
+
+@pytest.mark.parametrize("files, cpus", [
+    ({"/sys/fs/cgroup/cpu.max": "200000 100000"}, 2),
+    ({"/sys/fs/cgroup/cpu.max": "150000 100000"}, 2),  # a partial CPU still gets a worker
+    ({"/sys/fs/cgroup/cpu.max": "50000 100000"}, 1),
+    ({"/sys/fs/cgroup/cpu.max": "max 100000"}, 6),
+    ({"/sys/fs/cgroup/cpu/cpu.cfs_quota_us": "300000", "/sys/fs/cgroup/cpu/cpu.cfs_period_us": "100000"}, 3),
+    ({"/sys/fs/cgroup/cpu/cpu.cfs_quota_us": "-1", "/sys/fs/cgroup/cpu/cpu.cfs_period_us": "100000"}, 6),
+    ({"/sys/fs/cgroup/cpu.max": "lots 100000"}, 6),
+    ({}, 6)
+])
+def test_cpu_limit_from_cgroup_v1_and_v2(conf, monkeypatch, files, cpus):
+    fake_cgroup(monkeypatch, conf, files)
+    monkeypatch.setattr(conf.os, "sched_getaffinity", lambda pid: set(range(6)), raising=False)
+    assert conf.cpu_limit() == cpus
+
+@pytest.mark.parametrize("files, gb", [
+    ({"/sys/fs/cgroup/memory.max": str(2 * GB)}, 2.0),
+    ({"/sys/fs/cgroup/memory.max": "max"}, 16.0),
+    ({"/sys/fs/cgroup/memory.max": "unlimited"}, 16.0),
+    ({"/sys/fs/cgroup/memory/memory.limit_in_bytes": str(GB // 2)}, 0.5),
+    ({"/sys/fs/cgroup/memory/memory.limit_in_bytes": "9223372036854771712"}, 16.0),  # v1's "no limit"
+    ({}, 16.0)
+])
+def test_memory_limit_from_cgroup_v1_and_v2(conf, monkeypatch, files, gb):
+    fake_cgroup(monkeypatch, conf, files)
+    monkeypatch.setattr(conf.psutil, "virtual_memory", lambda: VirtualMemory(16 * GB))
+    assert conf.memory_limit_gb() == pytest.approx(gb)
+
+# ===========================
+# WORKER CLASS
+# ===========================
+def test_small_container_still_serves_the_flask_app(conf, monkeypatch):
+    fake_cgroup(monkeypatch, conf, {"/sys/fs/cgroup/cpu.max": "100000 100000", "/sys/fs/cgroup/memory.max": str(GB)})
+    monkeypatch.setattr(conf, "CPU_COUNT", conf.cpu_limit())
+    monkeypatch.setattr(conf, "MEMORY_GB", conf.memory_limit_gb())
+    assert (conf.CPU_COUNT, conf.MEMORY_GB) == (1, 1.0)
+    assert conf.choose_worker_class() == "gthread"
+
+def test_gthread_is_the_default(conf):
+    assert (conf.worker_class, conf.wsgi_app) == ("gthread", "kai_omniseal:app")
+    assert conf.threads == conf.THREAD_BUDGET >= 5
+
+def test_uvicorn_only_when_asked_for(monkeypatch):
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name, *args: object() if name == "uvicorn_worker" else None)
+    conf = load_conf(monkeypatch, KAI_WORKER_CLASS="uvicorn")
+    assert (conf.worker_class, conf.wsgi_app) == ("uvicorn_worker.UvicornWorker", "kai_omniseal_asgi:app")
+
+def test_uvicorn_without_the_worker_package_fails_loudly(conf, monkeypatch):
+    monkeypatch.setattr(conf, "WORKER_CLASS", "uvicorn")
+    monkeypatch.setattr(conf.importlib.util, "find_spec", lambda name, *args: None)
+    with pytest.raises(RuntimeError, match="uvicorn-worker"):
+        conf.choose_worker_class()
+
+def test_unknown_worker_class_falls_back_to_gthread(conf, monkeypatch, capsys):
+    monkeypatch.setattr(conf, "WORKER_CLASS", "eventlet")
+    assert conf.choose_worker_class() == "gthread"
+    assert "KAI_WORKER_CLASS" in capsys.readouterr().err
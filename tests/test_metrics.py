@@ -0,0 +1,112 @@
+"""
+Latency histograms, sliding windows and per-provider counters
+"""
+
+import random
+
+import pytest
+
+from kai_metrics import HISTOGRAM_MAX_SECONDS, MAX_FALLBACK_DEPTH, LatencyHistogram, ProviderMetrics, WindowedHistogram
+
+# ===========================
+# LATENCY HISTOGRAM
+# ===========================
+def test_empty_histogram_has_no_percentiles():
+    histogram = LatencyHistogram()
+    assert histogram.percentiles() == {50: None, 90: None, 99: None}
+    assert histogram.summary()["mean_ms"] is None
+
+def test_percentiles_are_within_one_bucket_of_the_exact_value():
+    rng = random.Random(3)
+    samples = sorted(rng.lognormvariate(-1.5, 1.0) for _ in range(5000))
+    histogram = LatencyHistogram()
+    for seconds in samples:
+        histogram.record(seconds)
+    for pct, value in histogram.percentiles((50, 90, 99)).items():
+        exact = samples[int(pct / 100 * len(samples)) - 1]
+        assert value == pytest.approx(exact, rel=0.05)
+
+def test_out_of_range_samples_land_in_the_edge_buckets():
+    histogram = LatencyHistogram()
+    histogram.record(0.0)
+    histogram.record(10_000.0)
+    assert histogram.percentile(1) == histogram.min_seconds
+    assert HISTOGRAM_MAX_SECONDS <= histogram.percentile(100) < 10_000.0  # reported at the top of the range
+    assert histogram.summary()["max_ms"] == 10_000_000.0
+
+def test_cumulative_counts_for_fixed_exporter_buckets():
+    histogram = LatencyHistogram()
+    for seconds in (0.004, 0.02, 0.02, 0.3, 4.0, 700.0):
+        histogram.record(seconds)
+    cumulative, count, total = histogram.cumulative_counts((0.01, 0.1, 1.0, 10.0))
+    assert cumulative == [1, 3, 4, 5]
+    assert count == 6
+    assert total == pytest.approx(704.344)
+
+def test_merge_adds_counts_and_keeps_the_max():
+    first, second = LatencyHistogram(), LatencyHistogram()
+    first.record(0.1)
+    second.record(0.2)
+    second.record(3.0)
+    first.merge(second)
+    counts, count, total, maximum = first.snapshot()
+    assert (count, maximum) == (3, 3.0)
+    assert total == pytest.approx(3.3)
+    assert sum(counts) == 3
+
+# ===========================
+# SLIDING WINDOWS
+# ===========================
+def test_window_only_counts_recent_slots():
+    window = WindowedHistogram(horizon_seconds=300, slot_seconds=10)
+    window.record(0.1, now=1000)
+    window.record(0.2, now=1100, error=True)
+    window.record(0.3, now=1195)
+    recent = window.summary(60, now=1199)
+    assert (recent["count"], recent["errors"]) == (1, 0)
+    assert recent["requests_per_second"] == pytest.approx(1 / 60, abs=0.001)
+    everything = window.summary(300, now=1199)
+    assert (everything["count"], everything["errors"], everything["error_rate"]) == (3, 1, 0.3333)
+
+def test_slots_are_reused_once_they_leave_the_horizon():
+    window = WindowedHistogram(horizon_seconds=60, slot_seconds=10)
+    window.record(0.1, now=1000)
+    window.record(0.2, now=1060)  # same ring slot, six ticks later
+    summary = window.summary(60, now=1060)
+    assert summary["count"] == 1
+    assert window.summary(60, now=2000)["error_rate"] is None
+
+# ===========================
+# PROVIDER METRICS
+# ===========================
+def test_calls_errors_and_retries_are_counted_per_provider():
+    metrics = ProviderMetrics()
+    metrics.record_call("GPT-4", "neutral", 0.5, True)
+    metrics.record_call("GPT-4", "code", 1.5, True)
+    metrics.record_call("GPT-4", "code", 9.0, False)
+    metrics.record_retry("GPT-4")
+    status = metrics.get_status()["providers"]["GPT-4"]
+    assert (status["calls"], status["errors"], status["retries"]) == (3, 1, 1)
+    assert status["latency"]["count"] == 2  # failures don't skew the latency
+    assert set(status["latency_by_tone"]) == {"neutral", "code"}
+
+@pytest.mark.parametrize("usage", [
+    {"prompt_tokens": 100, "completion_tokens": 20, "prompt_tokens_details": {"cached_tokens": 80}},
+    {"input_tokens": 100, "output_tokens": 20, "cache_read_input_tokens": 80},
+    {"prompt_tokens": 100, "completion_tokens": 20, "cached_prompt_tokens": 80}
+])
+def test_token_usage_in_each_provider_shape(usage):
+    metrics = ProviderMetrics()
+    metrics.record_usage("Claude-Direct", usage)
+    status = metrics.get_status()["providers"]["Claude-Direct"]
+    assert (status["prompt_tokens"], status["completion_tokens"], status["cached_prompt_tokens"]) == (100, 20, 80)
+    assert status["total_tokens"] == 120
+
+def test_fallback_depth_and_total_failures():
+    metrics = ProviderMetrics()
+    for depth in (0, 0, 1, MAX_FALLBACK_DEPTH + 3, None):
+        metrics.record_fallback_depth("neutral", depth)
+    fallback = metrics.get_status()["fallback_depth"]["neutral"]
+    assert fallback["answered_by_position"] == {"0": 2, "1": 1, str(MAX_FALLBACK_DEPTH - 1): 1}
+    assert fallback["all_failed"] == 1
+    assert fallback["mean_depth"] == pytest.approx((1 + MAX_FALLBACK_DEPTH - 1) / 4)
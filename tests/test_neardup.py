@@ -0,0 +1,70 @@
+"""
+MinHash/LSH near-duplicate index, checked against the brute-force difflib scan it replaced
+"""
+
+import difflib
+import random
+
+from kai_neardup import NUM_BINS, NearDuplicateIndex, minhash_signature, shingles
+
+PARAGRAPH = ("A circuit breaker stops sending calls to a provider that keeps failing, waits for a recovery "
+             "timeout, then lets a single probe through to decide whether the provider is healthy again.")
+
+def brute_force(history, text, threshold=0.92):
+    return any(difflib.SequenceMatcher(None, text, old).ratio() > threshold for old in history)
+
+def mutate(text, rng, edits):
+    chars = list(text)
+    for _ in range(edits):
+        chars[rng.randrange(len(chars))] = rng.choice("abcdefghijklmnopqrstuvwxyz ")
+    return "".join(chars)
+
+def test_shingles_ignore_case_and_whitespace():
+    assert shingles("Hello   World") == shingles("hello world")
+    assert shingles("hi") == {"hi"}
+
+def test_signature_has_every_bin_filled_even_for_short_text():
+    signature = minhash_signature("short")
+    assert len(signature) == NUM_BINS
+    assert None not in signature
+
+def test_exact_and_near_copies_are_duplicates():
+    index = NearDuplicateIndex(max_items=10)
+    index.add(PARAGRAPH)
+    assert index.check(PARAGRAPH)
+    assert index.check(PARAGRAPH.replace("single probe", "single  probe").replace("again.", "again!"))
+
+def test_different_text_is_not_a_duplicate():
+    index = NearDuplicateIndex(max_items=10)
+    index.add(PARAGRAPH)
+    assert not index.check("A bulkhead caps how many calls may be in flight to one provider at a time.")
+    assert not index.check(PARAGRAPH[:len(PARAGRAPH) // 2])
+
+def test_oldest_outputs_leave_the_window():
+    index = NearDuplicateIndex(max_items=2)
+    index.add(PARAGRAPH)
+    index.add("second reply about something else entirely")
+    index.add("third reply, also unrelated to the first one")
+    assert len(index) == 2
+    assert not index.check(PARAGRAPH)
+
+def test_clear_empties_the_index():
+    index = NearDuplicateIndex(max_items=10)
+    index.add(PARAGRAPH)
+    index.clear()
+    assert len(index) == 0
+    assert not index.check(PARAGRAPH)
+
+def test_agrees_with_the_brute_force_scan():
+    rng = random.Random(7)
+    words = PARAGRAPH.split()
+    history = [" ".join(rng.sample(words, len(words))) for _ in range(30)]
+    index = NearDuplicateIndex(max_items=len(history))
+    for text in history:
+        index.add(text)
+    # Clear-cut cases on both sides of the 0.92 threshold: a couple of typos, or a heavy rewrite
+    probes = [mutate(rng.choice(history), rng, 2) for _ in range(20)]
+    probes += [mutate(rng.choice(history), rng, 60) for _ in range(20)]
+    for probe in probes:
+        assert index.check(probe) == brute_force(history, probe)
+    assert index.get_stats()["avg_candidates_per_check"] < len(history)
@@ -0,0 +1,50 @@
+"""
+Prometheus text exposition and the /metrics endpoint
+"""
+
+import kai_omniseal
+from kai_metrics import LatencyHistogram
+from kai_prometheus import CONTENT_TYPE, LATENCY_BUCKETS, MetricsWriter
+
+def test_each_family_has_one_help_and_type_line():
+    writer = MetricsWriter()
+    writer.counter("kai_calls_total", "Calls.", 1, {"provider": "GPT-4"})
+    writer.gauge("kai_in_flight", "In flight.", 2)
+    writer.counter("kai_calls_total", "Calls.", 3, {"provider": "Claude-Direct"})
+    writer.gauge("kai_unknown", "Skipped when there is no value.", None)
+    lines = writer.render().splitlines()
+    assert lines == [
+        "# HELP kai_calls_total Calls.",
+        "# TYPE kai_calls_total counter",
+        'kai_calls_total{provider="GPT-4"} 1',
+        'kai_calls_total{provider="Claude-Direct"} 3',
+        "# HELP kai_in_flight In flight.",
+        "# TYPE kai_in_flight gauge",
+        "kai_in_flight 2"
+    ]
+
+def test_label_values_are_escaped():
+    writer = MetricsWriter()
+    writer.gauge("kai_g", "G.", 1.5, {"route": 'a"b\\c\nd'})
+    assert 'kai_g{route="a\\"b\\\\c\\nd"} 1.5' in writer.render()
+
+def test_histogram_exports_cumulative_buckets():
+    histogram = LatencyHistogram()
+    for seconds in (0.02, 0.2, 2.0, 2000.0):
+        histogram.record(seconds)
+    writer = MetricsWriter()
+    writer.histogram("kai_latency_seconds", "Latency.", histogram, {"route": "/api/message"})
+    samples = [line for line in writer.render().splitlines() if not line.startswith("#")]
+    buckets = [int(line.rsplit(" ", 1)[1]) for line in samples if "_bucket" in line]
+    assert len(buckets) == len(LATENCY_BUCKETS) + 1
+    assert buckets == sorted(buckets) and buckets[-1] == 4
+    assert 'kai_latency_seconds_bucket{route="/api/message",le="+Inf"} 4' in samples
+    assert 'kai_latency_seconds_count{route="/api/message"} 4' in samples
+
+def test_metrics_endpoint_serves_the_exposition_format():
+    response = kai_omniseal.app.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type == CONTENT_TYPE
+    body = response.get_data(as_text=True)
+    for family in ("kai_executor_queue_depth", "kai_executor_busy_workers", "process_resident_memory_bytes"):
+        assert f"# TYPE {family} " in body
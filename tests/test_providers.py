@@ -0,0 +1,157 @@
+"""
+Real provider call paths against a local transport: request shape, retries, token budgeting and pooling
+"""
+
+import asyncio
+import gc
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+import kai_brain_router as router
+from kai_persona import SystemPrompt
+
+OPENROUTER_REPLY = {
+    "choices": [{"message": {"content": "from openrouter"}}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 3}
+}
+
+CLAUDE_REPLY = {
+    "id": "msg_test", "type": "message", "role": "assistant", "model": "claude-3-sonnet-20240229",
+    "content": [{"type": "text", "text": "from claude"}],
+    "stop_reason": "end_turn", "stop_sequence": None,
+    "usage": {"input_tokens": 10, "output_tokens": 3}
+}
+
+@pytest.fixture
+def openrouter(monkeypatch):
+    """Replies to OpenRouter with the queued statuses (then 200) and records each request body"""
+    sent, statuses = [], []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(json.loads(request.content))
+        status = statuses.pop(0) if statuses else 200
+        return httpx.Response(status, json=OPENROUTER_REPLY if status == 200 else {"error": {"message": "busy"}})
+    monkeypatch.setattr(router.provider_pools["openrouter"], "_client", httpx.Client(transport=httpx.MockTransport(handler)))
+    # The offline suite only registers mocks, so the provider's token profile is not in place yet
+    monkeypatch.setitem(router.token_budgeter.profiles, "Claude-OpenRouter", router.PROFILES["anthropic"])
+    return sent, statuses
+
+def test_openrouter_prompt_is_fitted_once_across_retries(openrouter):
+    sent, statuses = openrouter
+    statuses.append(503)
+    before = router.token_budgeter.get_stats()["requests"]
+    assert router.call_claude_openrouter("fit me once") == "from openrouter"
+    assert len(sent) == 2
+    assert router.token_budgeter.get_stats()["requests"] == before + 1
+    assert sent[0]["max_tokens"] == sent[1]["max_tokens"]
+
+@pytest.fixture
+def claude_direct(monkeypatch):
+    """The pinned Anthropic SDK over a local transport; records each request body"""
+    import anthropic
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(json.loads(request.content))
+        return httpx.Response(200, json=CLAUDE_REPLY)
+    client = anthropic.Anthropic(api_key="test", http_client=httpx.Client(transport=httpx.MockTransport(handler)),
+                                 max_retries=0)
+    monkeypatch.setattr(router.provider_pools["anthropic"], "_client", client)
+    monkeypatch.setitem(router.token_budgeter.profiles, "Claude-Direct", router.PROFILES["anthropic"])
+    return sent
+
+# ===========================
+# PROMPT CACHING
+# ===========================
+PERSONA = SystemPrompt("You are Kai. " * 50, "Be clear, warm and direct.")
+CACHED_BLOCK = {"type": "text", "text": PERSONA.cacheable_prefix, "cache_control": {"type": "ephemeral"}}
+
+def test_claude_direct_marks_a_long_persona_for_caching(claude_direct, monkeypatch):
+    monkeypatch.setattr(router, "PROMPT_CACHE_MIN_TOKENS", 10)
+    assert router.call_claude_direct("hello", PERSONA) == "from claude"
+    assert claude_direct[0]["system"] == [CACHED_BLOCK, {"type": "text", "text": "Be clear, warm and direct."}]
+
+def test_openrouter_marks_a_long_persona_for_caching(openrouter, monkeypatch):
+    sent, _ = openrouter
+    monkeypatch.setattr(router, "PROMPT_CACHE_MIN_TOKENS", 10)
+    router.call_claude_openrouter("hello", PERSONA)
+    system = sent[0]["messages"][0]
+    assert system["role"] == "system"
+    assert system["content"][0] == CACHED_BLOCK
+
+def test_short_persona_is_sent_as_plain_text(claude_direct, openrouter):
+    sent, _ = openrouter
+    router.call_claude_direct("hello", PERSONA)
+    router.call_claude_openrouter("hello", PERSONA)
+    assert claude_direct[0]["system"] == str(PERSONA)
+    assert sent[0]["messages"][0]["content"] == str(PERSONA)
+
+def test_prompt_caching_can_be_switched_off(claude_direct, monkeypatch):
+    monkeypatch.setattr(router, "PROMPT_CACHE_MIN_TOKENS", 10)
+    monkeypatch.setattr(router, "PROMPT_CACHING", False)
+    router.call_claude_direct("hello", PERSONA)
+    assert claude_direct[0]["system"] == str(PERSONA)
+
+# ===========================
+# CONNECTION POOLS
+# ===========================
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+def test_pool_counts_created_and_reused_connections(local_server):
+    pool = router.ProviderClientPool("pooltest")
+    for _ in range(3):
+        assert pool.http_client.get(local_server).text == "ok"
+    stats = pool.get_stats()
+    assert (stats["requests_sent"], stats["connections_created"], stats["connections_reused"]) == (3, 1, 2)
+    assert stats["connections_open"] == 1
+    pool.close()
+    gc.collect()
+    assert pool.get_stats()["connections_open"] == 0
+
+def test_async_pool_reuses_connections_per_event_loop(local_server):
+    pool = router.ProviderClientPool("pooltest_async")
+
+    async def main():
+        client = pool.async_client
+        for _ in range(3):
+            await client.get(local_server)
+        await pool.aclose()
+    asyncio.run(main())
+    stats = pool.get_stats()
+    assert (stats["requests_sent"], stats["connections_created"], stats["connections_reused"]) == (3, 1, 2)
+
+def test_parallel_requests_open_separate_connections(local_server):
+    pool = router.ProviderClientPool("pooltest_parallel")
+
+    async def main():
+        client = pool.async_client
+        await asyncio.gather(*(client.get(local_server) for _ in range(3)))
+        await client.get(local_server)
+        await pool.aclose()
+    asyncio.run(main())
+    stats = pool.get_stats()
+    assert (stats["requests_sent"], stats["connections_created"], stats["connections_reused"]) == (4, 3, 1)
@@ -0,0 +1,319 @@
+"""
+Fault-tolerance primitives: breakers, bulkheads, rate limits, cancellation, deadlines and retries
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from time import sleep
+
+import pytest
+
+from kai_resilience import (
+    Bulkhead, CancelToken, CircuitBreaker, Deadline, DeadlineExceeded, ProviderThrottled, RateLimiter,
+    RequestCancelled, RetryPolicy, is_provider_fault, is_retryable, parse_rate_limit_headers, parse_reset_seconds
+)
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+# ===========================
+# CIRCUIT BREAKER
+# ===========================
+def tripped(recovery_timeout: float = 30.0) -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=recovery_timeout)
+    breaker.record_failure("one")
+    breaker.record_failure("two")
+    return breaker
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure("one")
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure("two")
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    status = breaker.get_status()
+    assert (status["trip_count"], status["rejected_requests"], status["last_failure"]) == (1, 1, "two")
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_half_open_lets_one_probe_through():
+    breaker = tripped(recovery_timeout=0.05)
+    sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+def test_probe_outcome_closes_or_reopens():
+    breaker = tripped(recovery_timeout=0.05)
+    sleep(0.06)
+    breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker = tripped(recovery_timeout=0.05)
+    sleep(0.06)
+    breaker.allow_request()
+    breaker.record_failure("still down")
+    assert breaker.get_status()["state"] == CircuitBreaker.OPEN
+    assert breaker.get_status()["trip_count"] == 2
+
+def test_released_probe_lets_the_next_one_through():
+    breaker = tripped(recovery_timeout=0.05)
+    sleep(0.06)
+    assert breaker.allow_request()
+    breaker.release_probe()
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+# ===========================
+# BULKHEADS
+# ===========================
+def test_bulkhead_rejects_past_its_cap():
+    bulkhead = Bulkhead("test", max_concurrent=2)
+    assert bulkhead.try_acquire() and bulkhead.try_acquire()
+    assert not bulkhead.try_acquire()
+    bulkhead.release()
+    assert bulkhead.try_acquire()
+    status = bulkhead.get_status()
+    assert (status["in_flight"], status["peak_in_flight"], status["acquired"], status["saturation_events"]) == (2, 2, 3, 1)
+
+def test_bulkhead_release_never_goes_negative():
+    bulkhead = Bulkhead("test", max_concurrent=1)
+    bulkhead.release()
+    assert bulkhead.in_flight == 0
+
+def test_zero_cap_means_unbounded():
+    bulkhead = Bulkhead("test", max_concurrent=0)
+    assert all(bulkhead.try_acquire() for _ in range(100))
+
+# ===========================
+# RATE LIMITING
+# ===========================
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+@pytest.mark.parametrize("value, seconds", [
+    ("20ms", 0.02), ("6m0s", 360.0), ("1h", 3600.0), ("1.5", 1.5),
+    (str(NOW.timestamp() + 30), 30.0), (str((NOW.timestamp() + 30) * 1000), 30.0),
+    ((NOW + timedelta(seconds=45)).isoformat().replace("+00:00", "Z"), 45.0),
+    (format_datetime(NOW + timedelta(seconds=60), usegmt=True), 60.0),
+    (str(NOW.timestamp() - 30), 0.0)
+])
+def test_parse_reset_seconds(value, seconds):
+    assert parse_reset_seconds(value, now=NOW) == pytest.approx(seconds)
+
+@pytest.mark.parametrize("value", [None, "", "soon", "5 minutes"])
+def test_unparseable_reset_is_none(value):
+    assert parse_reset_seconds(value, now=NOW) is None
+
+def test_rate_limit_headers_from_each_provider():
+    assert parse_rate_limit_headers({"retry-after-ms": "1500", "retry-after": "9"}) == (1.5, None, None)
+    assert parse_rate_limit_headers({"x-ratelimit-remaining-requests": "4", "x-ratelimit-reset-requests": "2s"}) == (None, 4.0, 2.0)
+    assert parse_rate_limit_headers({"anthropic-ratelimit-requests-remaining": "0",
+                                     "anthropic-ratelimit-requests-reset": "10"}) == (None, 0.0, 10.0)
+    assert parse_rate_limit_headers({}) == (None, None, None)
+
+def test_rate_pacing_queues_callers_behind_the_burst():
+    limiter = RateLimiter("test", rate=10, burst=1, max_wait=5)
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == pytest.approx(0.1, abs=0.02)
+    assert limiter.reserve() == pytest.approx(0.2, abs=0.02)
+    assert limiter.get_status()["paced_requests"] == 2
+
+def test_429_blocks_until_retry_after():
+    limiter = RateLimiter("test", rate=0, max_wait=1)
+    limiter.observe(429, {"retry-after": "30"})
+    assert limiter.blocked_for() == pytest.approx(30, abs=0.5)
+    assert limiter.reserve() is None
+    assert limiter.reserve(max_wait=60) is None  # never past the limiter's own max_wait
+    assert limiter.get_status()["throttle_responses"] == 1
+
+def test_429_without_retry_after_backs_off_exponentially():
+    limiter = RateLimiter("test", rate=0)
+    limiter.observe(429)
+    first = limiter.blocked_for()
+    limiter.observe(429)
+    assert limiter.blocked_for() > first
+
+def test_route_around_only_past_max_wait():
+    limiter = RateLimiter("test", rate=0, max_wait=2)
+    assert limiter.route_around() is None
+    limiter.observe(429, {"retry-after": "1"})
+    assert limiter.route_around() is None
+    limiter.observe(429, {"retry-after": "10"})
+    assert limiter.route_around() == pytest.approx(10, abs=0.5)
+    assert limiter.get_status()["routed_around"] == 1
+
+def test_remaining_headers_teach_a_rate():
+    limiter = RateLimiter("test", rate=0)
+    limiter.observe(200, {"x-ratelimit-remaining": "10", "x-ratelimit-reset": "20"})
+    assert limiter.get_status()["effective_rps"] == 0.5
+    limiter.observe(200, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": "5"})
+    assert limiter.blocked_for() == pytest.approx(5, abs=0.5)
+
+# ===========================
+# CANCELLATION AND DEADLINES
+# ===========================
+def test_cancel_runs_callbacks_once():
+    token, calls = CancelToken(), []
+    token.add_callback(lambda: calls.append("a"))
+    removed = lambda: calls.append("removed")  # noqa: E731
+    token.add_callback(removed)
+    token.remove_callback(removed)
+    assert token.cancel("timeout")
+    assert not token.cancel("again")
+    token.add_callback(lambda: calls.append("late"))
+    assert calls == ["a", "late"]
+    assert token.reason == "timeout"
+
+def test_deadline_without_a_budget_never_expires():
+    deadline = Deadline()
+    assert deadline.remaining() is None
+    assert not deadline.expired
+    assert deadline.cap(7) == 7
+
+def test_deadline_caps_timeouts_and_expires():
+    deadline = Deadline(0.05)
+    assert deadline.cap(10) <= 0.05
+    sleep(0.06)
+    assert deadline.expired
+    assert deadline.remaining() == 0.0
+
+def test_cancelled_deadline_has_no_time_left():
+    token = CancelToken()
+    deadline = Deadline(30, token)
+    token.cancel()
+    assert deadline.expired and deadline.remaining() == 0.0
+
+def test_reserved_deadline_ends_early_and_shares_the_token():
+    token = CancelToken()
+    parent = Deadline(10, token)
+    child = parent.reserve(4)
+    assert child.remaining() == pytest.approx(6, abs=0.1)
+    assert child.cancel_token is token
+    assert Deadline().reserve(4).remaining() is None
+
+# ===========================
+# RETRY POLICY
+# ===========================
+@pytest.mark.parametrize("exc, retryable", [
+    (TimeoutError(), True), (asyncio.TimeoutError(), True), (StatusError(429), True), (StatusError(408), True),
+    (StatusError(503), True), (StatusError(400), False), (StatusError(401), False), (ValueError(), False),
+    (DeadlineExceeded(), False)
+])
+def test_is_retryable(exc, retryable):
+    assert is_retryable(exc) == retryable
+
+def test_caller_deadline_is_not_a_provider_fault():
+    assert is_provider_fault(StatusError(503))
+    assert not is_provider_fault(StatusError(400))
+    assert not is_provider_fault(TimeoutError(), Deadline(0))
+    assert is_provider_fault(TimeoutError(), Deadline(30))
+
+def flaky(failures, exc=StatusError(503)):
+    calls = []
+
+    def attempt(timeout):
+        calls.append(timeout)
+        if len(calls) <= failures:
+            raise exc
+        return "ok"
+    return attempt, calls
+
+def test_retries_until_success():
+    attempt, calls = flaky(2)
+    retries = []
+    policy = RetryPolicy(3, base_delay=0.001, max_delay=0.001)
+    assert policy.run(attempt, on_retry=lambda n, delay: retries.append(n)) == "ok"
+    assert len(calls) == 3 and retries == [1, 2]
+
+def test_gives_up_after_max_retries():
+    attempt, calls = flaky(10)
+    with pytest.raises(StatusError):
+        RetryPolicy(2, base_delay=0.001, max_delay=0.001).run(attempt)
+    assert len(calls) == 3
+
+def test_client_errors_are_not_retried():
+    attempt, calls = flaky(1, StatusError(400))
+    errors = []
+    with pytest.raises(StatusError):
+        RetryPolicy(3, base_delay=0.001).run(attempt, on_error=errors.append)
+    assert len(calls) == 1 and len(errors) == 1
+
+def test_open_breaker_stops_retries():
+    attempt, calls = flaky(10)
+    with pytest.raises(StatusError):
+        RetryPolicy(3, base_delay=0.001).run(attempt, breaker=tripped())
+    assert len(calls) == 1
+
+def test_attempt_timeout_is_capped_by_the_deadline():
+    attempt, calls = flaky(0)
+    RetryPolicy(0, attempt_timeout=30).run(attempt, deadline=Deadline(2))
+    assert calls[0] <= 2
+
+def test_no_attempt_after_the_deadline_or_cancellation():
+    attempt, calls = flaky(0)
+    with pytest.raises(DeadlineExceeded):
+        RetryPolicy(0).run(attempt, deadline=Deadline(0))
+    token = CancelToken()
+    token.cancel("client gone")
+    with pytest.raises(RequestCancelled):
+        RetryPolicy(0).run(attempt, deadline=Deadline(30, token))
+    assert calls == []
+
+def test_throttled_provider_is_not_attempted():
+    limiter = RateLimiter("test", rate=0, max_wait=1)
+    limiter.observe(429, {"retry-after": "30"})
+    attempt, calls = flaky(0)
+    with pytest.raises(ProviderThrottled):
+        RetryPolicy(0).run(attempt, rate_limiter=limiter)
+    assert calls == []
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_throttled_probe_is_handed_back_to_the_breaker(use_async):
+    breaker = tripped(recovery_timeout=0.05)
+    sleep(0.06)
+    assert breaker.allow_request()  # the single half-open probe, taken at admission
+    limiter = RateLimiter("test", rate=1, burst=1, max_wait=30)
+    limiter.reserve()  # the next slot is a second away, past the request's budget
+    errors = []
+
+    def on_error(e):
+        # What the router's log_event does with a failure that is not the provider's fault
+        errors.append(e)
+        if is_provider_fault(e):
+            breaker.record_failure()
+        else:
+            breaker.release_probe()
+    attempt, calls = flaky(0)
+
+    async def async_attempt(timeout):
+        return attempt(timeout)
+    options = {"deadline": Deadline(0.2), "breaker": breaker, "on_error": on_error, "rate_limiter": limiter}
+    with pytest.raises(ProviderThrottled):
+        if use_async:
+            asyncio.run(RetryPolicy(2).run_async(async_attempt, **options))
+        else:
+            RetryPolicy(2).run(attempt, **options)
+    assert calls == [] and len(errors) == 1
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()  # the next caller may probe right away, not after recovery_timeout
+
+def test_run_async_retries_like_run():
+    calls = []
+
+    async def attempt(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            raise StatusError(502)
+        return "ok"
+    assert asyncio.run(RetryPolicy(2, base_delay=0.001, max_delay=0.001).run_async(attempt)) == "ok"
+    assert len(calls) == 2
@@ -0,0 +1,415 @@
+"""
+Brain router end to end, driven by mock providers: fallback, breakers, cache, batches
+"""
+
+import asyncio
+import concurrent.futures
+import random
+from time import monotonic, sleep
+
+import pytest
+
+import kai_brain_router as router
+from kai_resilience import CancelToken, CircuitBreaker, Deadline
+
+def breaker_for(plugin):
+    return router.circuit_breakers[plugin.label]
+
+async def call_until_failure(plugin, prompt, times, deadline_seconds=None):
+    for i in range(times):
+        deadline = Deadline(deadline_seconds) if deadline_seconds is not None else None
+        with pytest.raises(Exception):
+            await plugin.call(f"{prompt} {i}", deadline=deadline)
+
+# ===========================
+# FALLBACK
+# ===========================
+def test_slow_first_provider_still_falls_back_within_the_deadline(providers):
+    slow = providers(latency="fixed:3")
+    fast = providers(latency="fixed:0.05")
+    started = monotonic()
+    reply = asyncio.run(router.get_kai_response_async("who answers in time?", deadline=Deadline(1.5), bypass_cache=True))
+    assert reply.startswith(f"[{fast.name}]")
+    assert monotonic() - started < 1.5
+    assert slow.info()["timeouts"] == 1
+
+def test_failing_provider_falls_back_to_the_next(providers):
+    providers(error_rate=1.0, error_status=500)
+    healthy = providers()
+    reply = asyncio.run(router.get_kai_response_async("first one is down", bypass_cache=True))
+    assert reply.startswith(f"[{healthy.name}]")
+
+def test_all_providers_failing_returns_the_error_reply(providers):
+    providers(error_rate=1.0, error_status=400)
+    reply = asyncio.run(router.get_kai_response_async("nobody home", bypass_cache=True))
+    assert reply.startswith(router.ERROR_REPLY_PREFIX)
+
+# ===========================
+# HEDGING
+# ===========================
+@pytest.fixture
+def hedging(monkeypatch):
+    """Hedges fire after 50 ms while providers have no latency history yet"""
+    monkeypatch.setattr(router, "HEDGE_DEFAULT_DELAY", 0.05)
+
+def run_hedged(plugins, prompt, tone):
+    return asyncio.run(router._run_model_chain([plugin.call for plugin in plugins], prompt, tone, True))
+
+def test_hedge_wins_against_a_slow_primary(providers, hedging):
+    slow = providers(latency="fixed:1")
+    fast = providers(latency="fixed:0.01")
+    started = monotonic()
+    output, _ = run_hedged([slow, fast], "slow primary", "hedge-wins")
+    assert output.startswith(f"[{fast.name}]")
+    assert monotonic() - started < 0.5
+    # The loser was cancelled rather than left to finish, and gave its bulkhead slot back
+    assert slow.label not in router.provider_metrics.get_status()["providers"]
+    assert bulkhead_for(slow).in_flight == 0 and bulkhead_for(fast).in_flight == 0
+    assert router.hedge_stats.get_status()["hedge-wins"] == {
+        "requests": 1, "hedged": 1, "hedge_wins": 1, "hedge_rate": 1.0, "win_rate": 1.0
+    }
+
+def test_fast_primary_fires_no_hedge(providers, hedging):
+    fast = providers(latency="fixed:0.01")
+    spare = providers()
+    output, _ = run_hedged([fast, spare], "quick answer", "hedge-none")
+    assert output.startswith(f"[{fast.name}]")
+    assert spare.info()["calls"] == 0
+    assert router.hedge_stats.get_status()["hedge-none"]["hedged"] == 0
+
+def test_primary_failing_after_the_hedge_still_falls_through(providers, hedging):
+    primary = providers(latency="fixed:0.1", error_rate=1.0, error_status=400)
+    hedge = providers(latency="fixed:0.2", error_rate=1.0, error_status=400)
+    last = providers()
+    output, errors = run_hedged([primary, hedge, last], "everyone fails but the last", "hedge-fallthrough")
+    assert output.startswith(f"[{last.name}]")
+    assert len(errors) == 2
+    assert all(plugin.info()["calls"] == 1 for plugin in (primary, hedge, last))
+    assert router.hedge_stats.get_status()["hedge-fallthrough"]["hedge_wins"] == 0
+
+def test_at_most_one_hedge_per_request(providers, hedging):
+    primary = providers(latency="fixed:0.3")
+    hedge = providers(latency="fixed:0.3")
+    never = providers(latency="fixed:0.01")
+    output, _ = run_hedged([primary, hedge, never], "two slow providers", "hedge-once")
+    assert output.startswith(f"[{primary.name}]")
+    assert never.info()["calls"] == 0
+    assert bulkhead_for(hedge).in_flight == 0
+
+def test_hedge_and_win_rates_per_tone(providers, hedging):
+    slow = providers(latency="fixed:1")
+    fast = providers(latency="fixed:0.01")
+    steady = providers(latency="fixed:0.2")
+    tone = "hedge-rates"
+    run_hedged([slow, fast], "hedged and won", tone)
+    run_hedged([steady, slow], "hedged and lost", tone)
+    run_hedged([fast, slow], "not hedged", tone)
+    run_hedged([fast, slow], "not hedged either", tone)
+    assert router.hedge_stats.get_status()[tone] == {
+        "requests": 4, "hedged": 2, "hedge_wins": 1, "hedge_rate": 0.5, "win_rate": 0.5
+    }
+
+# ===========================
+# ADAPTIVE ORDERING
+# ===========================
+def static_chain(*names):
+    functions = []
+    for name in names:
+        async def call(prompt, **kwargs):
+            return name
+        call.__name__ = f"order_{name}"
+        functions.append(call)
+    return functions
+
+def scoreboard(**kwargs):
+    options = {"alpha": 1.0, "exploration_rate": 0.0, "min_samples": 3, "tie_tolerance": 0.1}
+    options.update(kwargs)
+    return router.ProviderScoreboard(**options)
+
+def observe(board, name, seconds, samples=3, success=True, bucket="general"):
+    for _ in range(samples):
+        board.record(bucket, f"order_{name}", success, seconds)
+
+def names(order):
+    return [function.__name__[len("order_"):] for function in order]
+
+def test_faster_provider_moves_up():
+    board = scoreboard()
+    observe(board, "a", 2.0)
+    observe(board, "b", 0.5)
+    assert names(board.order("general", static_chain("a", "b"))) == ["b", "a"]
+    assert board.get_status()["buckets"]["general"]["reordered"] == 1
+
+def test_provider_without_enough_samples_keeps_its_static_slot():
+    board = scoreboard()
+    observe(board, "a", 2.0)
+    observe(board, "b", 0.1, samples=2)  # fastest, but not yet trusted
+    observe(board, "c", 0.5)
+    assert names(board.order("general", static_chain("a", "b", "c"))) == ["c", "b", "a"]
+
+def test_near_ties_keep_the_static_order():
+    board = scoreboard()
+    observe(board, "a", 1.05)
+    observe(board, "b", 1.0)
+    assert names(board.order("general", static_chain("a", "b"))) == ["a", "b"]
+    assert board.get_status()["buckets"]["general"]["reordered"] == 0
+
+def test_failing_provider_sinks_despite_fast_failures():
+    board = scoreboard(alpha=0.5)
+    observe(board, "a", 0.2)
+    observe(board, "a", 0.01, samples=3, success=False)
+    observe(board, "b", 1.0)
+    assert names(board.order("general", static_chain("a", "b"))) == ["b", "a"]
+
+def test_buckets_are_ranked_separately():
+    board = scoreboard()
+    observe(board, "a", 2.0, bucket="creative")
+    observe(board, "b", 0.5, bucket="creative")
+    assert names(board.order("technical", static_chain("a", "b"))) == ["a", "b"]
+
+def test_exploration_is_repeatable_with_a_seeded_rng():
+    orders = []
+    for _ in range(2):
+        board = scoreboard(exploration_rate=0.3, rng=random.Random(42))
+        orders.append([names(board.order("general", static_chain("a", "b", "c"))) for _ in range(200)])
+    assert orders[0] == orders[1]
+    explored = sum(order[0] != "a" for order in orders[0])
+    assert board.get_status()["buckets"]["general"]["explored"] == explored
+    assert 30 <= explored <= 90
+    assert {order[0] for order in orders[0]} == {"a", "b", "c"}
+
+def test_exploration_promotes_the_drawn_provider():
+    draws = random.Random(7)
+    draws.random()
+    promoted = "abcd"[draws.randrange(1, 4)]
+    board = scoreboard(exploration_rate=1.0, rng=random.Random(7))
+    order = names(board.order("general", static_chain("a", "b", "c", "d")))
+    assert order[0] == promoted
+    assert sorted(order) == ["a", "b", "c", "d"]
+
+@pytest.mark.parametrize("adaptive, expected", [(True, [1, 0]), (False, [0, 1])])
+def test_adaptive_ordering_switch(providers, monkeypatch, adaptive, expected):
+    plugins = [providers(), providers()]
+    board = scoreboard()
+    for _ in range(3):
+        board.record("general", plugins[0].label, True, 2.0)
+        board.record("general", plugins[1].label, True, 0.1)
+    monkeypatch.setattr(router, "provider_scoreboard", board)
+    monkeypatch.setattr(router, "ADAPTIVE_ORDERING", adaptive)
+    assert router.get_model_order("neutral") == [plugins[i].call for i in expected]
+    # Cache and single-flight keys follow the static chain either way
+    assert router.get_model_chain("neutral")[:2] == [plugins[0].call.__name__, plugins[1].call.__name__]
+
+# ===========================
+# RESPONSE CACHE
+# ===========================
+def test_repeated_prompt_is_served_from_the_cache(providers):
+    plugin = providers()
+    first = asyncio.run(router.get_kai_response_async("What is a  circuit breaker?"))
+    second = asyncio.run(router.get_kai_response_async("what is a circuit breaker?"))
+    assert second == first
+    assert plugin.info()["calls"] == 1
+
+def test_bypass_cache_calls_the_provider_again(providers):
+    plugin = providers()
+    asyncio.run(router.get_kai_response_async("fresh every time"))
+    asyncio.run(router.get_kai_response_async("fresh every time", bypass_cache=True))
+    assert plugin.info()["calls"] == 2
+
+def test_concurrent_identical_requests_share_one_call(providers):
+    plugin = providers(latency="fixed:0.1")
+
+    async def burst():
+        return await asyncio.gather(*(router.get_kai_response_async("everyone at once") for _ in range(5)))
+    replies = asyncio.run(burst())
+    assert len(set(replies)) == 1
+    assert plugin.info()["calls"] == 1
+
+# ===========================
+# CIRCUIT BREAKERS
+# ===========================
+def test_client_errors_do_not_open_the_breaker(providers):
+    plugin = providers(error_rate=1.0, error_status=400)
+    asyncio.run(call_until_failure(plugin, "malformed", CircuitBreaker(plugin.label).failure_threshold * 2))
+    assert breaker_for(plugin).state == CircuitBreaker.CLOSED
+    assert breaker_for(plugin).get_status()["consecutive_failures"] == 0
+
+def test_provider_faults_open_the_breaker(providers):
+    plugin = providers(error_rate=1.0, error_status=503)
+    asyncio.run(call_until_failure(plugin, "outage", CircuitBreaker(plugin.label).failure_threshold))
+    assert breaker_for(plugin).state == CircuitBreaker.OPEN
+
+def test_caller_deadline_does_not_open_the_breaker(providers):
+    plugin = providers(latency="fixed:0.5")
+    asyncio.run(call_until_failure(plugin, "impatient", CircuitBreaker(plugin.label).failure_threshold * 2,
+                                   deadline_seconds=0.05))
+    assert breaker_for(plugin).state == CircuitBreaker.CLOSED
+
+def test_open_breaker_is_skipped_without_a_call(providers):
+    broken = providers()
+    healthy = providers()
+    breaker = breaker_for(broken)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure("down")
+    reply = asyncio.run(router.get_kai_response_async("skip the broken one", bypass_cache=True))
+    assert reply.startswith(f"[{healthy.name}]")
+    assert breaker.get_status()["rejected_requests"] == 1
+
+# ===========================
+# BULKHEADS
+# ===========================
+def bulkhead_for(plugin):
+    return router.bulkheads[plugin.label]
+
+def test_bulkhead_slot_is_released_after_a_call(providers):
+    plugin = providers()
+    asyncio.run(router.get_kai_response_async("take a slot", bypass_cache=True))
+    assert bulkhead_for(plugin).get_status()["acquired"] == 1
+    assert bulkhead_for(plugin).in_flight == 0
+
+def test_bulkhead_slot_is_released_when_the_task_is_never_started(providers, monkeypatch):
+    plugin = providers()
+
+    def broken(deadline, providers_left):
+        raise RuntimeError("no task for you")
+    monkeypatch.setattr(router, "_provider_deadline", broken)
+    with pytest.raises(RuntimeError):
+        asyncio.run(router._run_model_chain([plugin.call], "never launched", "neutral", False))
+    assert bulkhead_for(plugin).in_flight == 0
+
+def test_bulkhead_slot_is_released_when_the_breaker_rejects(providers):
+    plugin = providers()
+    breaker = breaker_for(plugin)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure("down")
+    assert router._admit(plugin.call) == (None, "circuit open")
+    assert bulkhead_for(plugin).in_flight == 0
+
+def test_saturated_provider_is_skipped(providers):
+    full = providers()
+    spare = providers()
+    bulkhead = bulkhead_for(full)
+    for _ in range(bulkhead.max_concurrent):
+        assert bulkhead.try_acquire()
+    reply = asyncio.run(router.get_kai_response_async("no room at the first", bypass_cache=True))
+    assert reply.startswith(f"[{spare.name}]")
+    assert bulkhead.get_status()["saturation_events"] == 1
+
+def test_bulkhead_slot_is_released_when_a_stream_cannot_be_opened(providers, monkeypatch):
+    plugin = providers()
+    fallback = providers()
+
+    def broken(prompt, system=None, deadline=None):
+        raise RuntimeError("cannot open stream")
+    monkeypatch.setitem(router.PROVIDER_STREAMS, plugin.label, broken)
+    chunks = asyncio.run(collect_stream("open a stream"))
+    assert "".join(chunks).startswith(f"[{fallback.name}]")
+    assert bulkhead_for(plugin).in_flight == 0
+
+# ===========================
+# RATE LIMITS
+# ===========================
+def test_throttled_provider_is_routed_around(providers):
+    throttled = providers()
+    spare = providers()
+    limiter = router.rate_limiters[throttled.label]
+    limiter.observe(429, {"retry-after": str(limiter.max_wait + 30)})
+    reply = asyncio.run(router.get_kai_response_async("someone else, please", bypass_cache=True))
+    assert reply.startswith(f"[{spare.name}]")
+    assert limiter.get_status()["routed_around"] == 1
+    assert throttled.info()["calls"] == 0
+
+# ===========================
+# STREAMING
+# ===========================
+async def collect_stream(prompt, tone="neutral"):
+    return [chunk async for chunk in router.stream_kai_response_async(prompt, tone)]
+
+def test_streamed_reply_is_cached(providers):
+    plugin = providers()
+    chunks = asyncio.run(collect_stream("stream me once"))
+    assert "".join(chunks).startswith(f"[{plugin.name}]")
+    chain = router.get_model_chain("neutral")
+    assert router.response_cache.get("stream me once", "neutral", chain) == "".join(chunks)
+
+def test_duplicate_streamed_reply_is_not_cached(providers, monkeypatch):
+    providers()
+    monkeypatch.setattr(router.memory, "check_duplicate", lambda output, threshold=0.92: True)
+    before = router.stream_stats.get_status()["duplicates_not_cached"]
+    chunks = asyncio.run(collect_stream("stream me again"))
+    assert chunks
+    assert router.response_cache.get("stream me again", "neutral", router.get_model_chain("neutral")) is None
+    assert router.stream_stats.get_status()["duplicates_not_cached"] == before + 1
+
+# ===========================
+# CANCELLATION
+# ===========================
+def test_loop_shutdown_cancellation_without_a_deadline(monkeypatch):
+    def shut_down(coro, timeout=None, cancel_token=None):
+        coro.close()
+        raise concurrent.futures.CancelledError()
+    monkeypatch.setattr(router.router_loop, "run", shut_down)
+    assert router.get_kai_response("mid-shutdown").startswith("⚠️ This request was cancelled")
+    assert router.get_kai_response("mid-shutdown", deadline=Deadline(5)).startswith("⚠️ This request was cancelled")
+
+def wait_for(condition, timeout=2.0):
+    deadline = monotonic() + timeout
+    while not condition() and monotonic() < deadline:
+        sleep(0.01)
+    return condition()
+
+def test_cancel_token_stops_the_router_task_and_its_provider_calls(providers):
+    plugin = providers(latency="fixed:5")
+    token = CancelToken()
+    with concurrent.futures.ThreadPoolExecutor(1) as pool:
+        started = monotonic()
+        reply = pool.submit(router.get_kai_response, "cancel me", deadline=Deadline(30, token), bypass_cache=True)
+        assert wait_for(lambda: bulkhead_for(plugin).in_flight == 1)
+        token.cancel("timeout")
+        assert reply.result(2).startswith("⚠️ This request was cancelled")
+    # The provider task was cancelled with the router task: its slot is back well before the 5s call would end
+    assert wait_for(lambda: bulkhead_for(plugin).in_flight == 0)
+    assert monotonic() - started < 2
+    assert plugin.label not in router.provider_metrics.get_status()["providers"]
+    assert breaker_for(plugin).state == CircuitBreaker.CLOSED
+
+def test_cancelling_the_router_task_cancels_every_hedged_attempt(providers, hedging):
+    slow, slower = providers(latency="fixed:5"), providers(latency="fixed:5")
+
+    async def main():
+        task = asyncio.ensure_future(router._run_model_chain([slow.call, slower.call], "cancel both", "cancel-hedge", True))
+        await asyncio.sleep(0.2)  # past the hedge delay: both providers are in flight
+        assert (bulkhead_for(slow).in_flight, bulkhead_for(slower).in_flight) == (1, 1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(main())
+    assert (bulkhead_for(slow).in_flight, bulkhead_for(slower).in_flight) == (0, 0)
+
+# ===========================
+# BATCHES
+# ===========================
+def test_batch_results_come_back_in_input_order(providers):
+    plugin = providers()
+    items = [(f"question {i}", "neutral") for i in range(6)] + [("   ", "poetic")]
+    results = asyncio.run(router.get_kai_responses_async(items, bypass_cache=True))
+    assert [result["index"] for result in results] == list(range(7))
+    for i, result in enumerate(results[:6]):
+        assert result["ok"] and result["reply"].startswith(f"[{plugin.name}] question {i}")
+    assert not results[6]["ok"] and results[6]["error"].startswith(router.ERROR_REPLY_PREFIX)
+
+def test_batch_yields_in_completion_order(monkeypatch):
+    async def uneven(prompt, tone="neutral", deadline=None, bypass_cache=False):
+        await asyncio.sleep(float(prompt))
+        return f"slept {prompt}"
+    monkeypatch.setattr(router, "get_kai_response_async", uneven)
+
+    async def collect():
+        return [result async for result in router.iter_kai_responses_async([("0.15", "neutral"), ("0.01", "neutral")])]
+    assert [result["index"] for result in asyncio.run(collect())] == [1, 0]
+
+def test_batch_concurrency_is_capped(providers):
+    plugin = providers(latency="fixed:0.05")
+    items = [(f"item {i}", "neutral") for i in range(6)]
+    asyncio.run(router.get_kai_responses_async(items, max_concurrency=2, bypass_cache=True))
+    assert bulkhead_for(plugin).get_status()["peak_in_flight"] == 2
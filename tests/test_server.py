@@ -0,0 +1,111 @@
+"""
+HTTP edge checks on the Flask app
+"""
+
+import threading
+from time import monotonic, sleep
+
+from flask import Flask, g, jsonify
+
+import kai_brain_router as router
+import kai_omniseal
+
+def test_edge_accepts_what_the_router_accepts():
+    message = "word " * 4000  # 20k characters, well inside the router's limits
+    assert kai_omniseal.validate_message_request({"message": message}) == (True, None)
+
+def test_edge_rejects_prompts_over_the_token_budget(monkeypatch):
+    monkeypatch.setattr(router, "MAX_PROMPT_TOKENS", 100)
+    valid, error = kai_omniseal.validate_message_request({"message": "word " * 1000})
+    assert not valid
+    assert "tokens" in error
+
+def test_oversized_message_is_a_bad_request(monkeypatch):
+    monkeypatch.setattr(router, "MAX_PROMPT_LENGTH", 50)
+    response = kai_omniseal.app.test_client().post("/api/message", json={"message": "x" * 51})
+    assert response.status_code == 400
+
+def test_worker_pool_counts_queued_and_running_calls():
+    pool = kai_omniseal.WorkerPool(1)
+    started, release = threading.Event(), threading.Event()
+
+    def busy():
+        started.set()
+        release.wait(5)
+    first = pool.submit(busy)
+    started.wait(5)
+    second = pool.submit(busy)
+    assert (pool.running, pool.queued) == (1, 1)
+    assert second.cancel()
+    assert pool.queued == 0
+    release.set()
+    first.result(5)
+    pool.shutdown()
+    assert (pool.running, pool.queued) == (0, 0)
+
+def test_request_tracker_breaks_down_by_route_and_status():
+    tracker = kai_omniseal.RequestTracker()
+    for success, timeout, status in ((True, False, 200), (False, False, 400), (False, True, None)):
+        tracker.record_request_start()
+        tracker.record_request_end(success, 0.05, timeout, "/api/message", status)
+    stats = tracker.get_stats()
+    assert (stats["total_requests"], stats["successful_requests"], stats["failed_requests"],
+            stats["timeout_requests"], stats["current_active_requests"]) == (3, 1, 1, 1, 0)
+    assert stats["by_route"]["/api/message"]["by_status"] == {"200": 1, "400": 1, "504": 1}
+    assert stats["windows"]["1m"]["errors"] == 1  # the 504; a 400 is the client's error
+
+def test_stream_closed_before_the_first_event_does_not_leak_an_active_request(providers):
+    providers()
+    active = kai_omniseal.request_tracker.current_active_requests
+    response = kai_omniseal.app.test_client().post("/api/stream", json={"message": "never read"}, buffered=False)
+    assert response.status_code == 200
+    response.close()
+    assert kai_omniseal.request_tracker.current_active_requests == active
+
+def test_stream_closed_after_the_first_event_ends_the_request(providers):
+    providers()
+    active = kai_omniseal.request_tracker.current_active_requests
+    response = kai_omniseal.app.test_client().post("/api/stream", json={"message": "read one event"}, buffered=False)
+    assert next(response.response).startswith(b"event: start")
+    response.close()
+    assert kai_omniseal.request_tracker.current_active_requests == active
+
+def test_batch_closed_before_the_first_event_does_not_leak_an_active_request(providers):
+    providers()
+    active = kai_omniseal.request_tracker.current_active_requests
+    response = kai_omniseal.app.test_client().post("/api/batch", json={"messages": ["a", "b"]}, buffered=False)
+    assert response.status_code == 200
+    response.close()
+    assert kai_omniseal.request_tracker.current_active_requests == active
+
+def test_timed_out_route_cancels_its_router_work(providers, monkeypatch):
+    plugin = providers(latency="fixed:5")
+    # A deadline past the route timeout, so the router is stopped by the cancel token rather than its own budget
+    monkeypatch.setattr(kai_omniseal, "DEADLINE_MARGIN", -5)
+    tracker = kai_omniseal.RequestTracker()
+    monkeypatch.setattr(kai_omniseal, "request_tracker", tracker)
+    seen = {}
+    app = Flask(__name__)
+
+    @app.route("/slow")
+    @kai_omniseal.safe_route(timeout_seconds=0.2)
+    def slow():
+        seen["deadline"] = g.deadline
+        seen["reply"] = router.get_kai_response("take your time", deadline=g.deadline, bypass_cache=True)
+        return jsonify(reply=seen["reply"])
+
+    response = app.test_client().get("/slow")
+    assert response.status_code == 504
+    assert seen["deadline"].cancel_token.reason == "timeout"
+    started = monotonic()
+    while tracker.orphaned_in_progress and monotonic() - started < 2:
+        sleep(0.01)
+    stats = tracker.get_stats()
+    assert (stats["orphaned_requests"], stats["orphaned_in_progress"], stats["timeout_requests"]) == (1, 0, 1)
+    assert stats["orphaned_work_seconds"] < 1  # the worker was freed long before the 5s provider call
+    assert seen["reply"].startswith("⚠️ This request was cancelled")
+    # The provider task is cancelled on the router loop, just after the worker thread was let go
+    bulkhead = router.bulkheads[plugin.label]
+    while bulkhead.in_flight and monotonic() - started < 2:
+        sleep(0.01)
+    assert bulkhead.in_flight == 0
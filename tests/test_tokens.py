@@ -0,0 +1,91 @@
+"""
+Offline token estimates, middle trimming and per-provider prompt budgeting
+"""
+
+import kai_tokens
+from kai_tokens import MESSAGE_OVERHEAD_TOKENS, PROFILES, TokenBudgeter, TokenProfile, estimate_tokens, trim_middle
+
+def budgeter(context_window=1000, max_output=200, min_output=100) -> TokenBudgeter:
+    return TokenBudgeter({"tiny": TokenProfile("tiny", context_window, max_output)}, min_output=min_output)
+
+# ===========================
+# TOKEN ESTIMATION
+# ===========================
+def test_empty_text_costs_nothing():
+    assert estimate_tokens("") == 0
+
+def test_common_words_are_about_a_token_each():
+    assert 9 <= estimate_tokens("the quick brown fox jumps over the lazy dog") <= 15
+
+def test_emoji_and_cjk_cost_more_per_character_than_ascii():
+    ascii_text = "a" * 40
+    assert estimate_tokens("🙂" * 40) > estimate_tokens(ascii_text)
+    assert estimate_tokens("漢" * 40) > estimate_tokens(ascii_text)
+
+def test_claude_counts_denser_than_gpt():
+    text = "Budget the prompt against each provider's own tokenizer."
+    assert PROFILES["anthropic"].estimate(text) > PROFILES["openai"].estimate(text)
+
+def test_cached_and_uncached_estimates_agree():
+    text = "cache me " * 50
+    profile = PROFILES["openai"]
+    assert profile.estimate(text) == profile.estimate(text) == profile.estimate(text, cached=False)
+
+# ===========================
+# PROMPT BUDGETING
+# ===========================
+def test_trim_middle_keeps_both_ends():
+    text = "HEAD" + "x" * 1000 + "TAIL"
+    trimmed = trim_middle(text, 100)
+    assert trimmed.startswith("HEAD") and trimmed.endswith("TAIL")
+    assert "908 characters trimmed" in trimmed
+    assert trim_middle("short", 100) == "short"
+
+def test_small_prompt_gets_the_full_output_budget():
+    prompt, max_tokens = budgeter().fit("tiny", "hello there")
+    assert (prompt, max_tokens) == ("hello there", 200)
+
+def test_output_budget_shrinks_before_the_prompt_is_trimmed():
+    tokens = budgeter()
+    profile = tokens.profiles["tiny"]
+    prompt = "word " * 750
+    fitted, max_tokens = tokens.fit("tiny", prompt)
+    assert fitted == prompt
+    assert 100 <= max_tokens < 200
+    assert max_tokens == 1000 - MESSAGE_OVERHEAD_TOKENS - profile.estimate(prompt)
+    assert tokens.get_stats()["max_tokens_reduced"] == 1
+
+def test_overflowing_prompt_is_trimmed_to_leave_the_minimum_output():
+    tokens = budgeter()
+    profile = tokens.profiles["tiny"]
+    system = "You are Kai."
+    prompt = "START " + "filler " * 2000 + "END"
+    fitted, max_tokens = tokens.fit("tiny", prompt, system)
+    assert fitted.startswith("START") and fitted.endswith("END")
+    assert max_tokens >= 100
+    assert profile.estimate(system) + MESSAGE_OVERHEAD_TOKENS + profile.estimate(fitted) + max_tokens <= 1000
+    stats = tokens.get_stats()
+    assert (stats["requests"], stats["prompts_trimmed"]) == (1, 1)
+    assert stats["chars_trimmed"] > 0
+
+def test_large_prompt_is_trimmed_with_a_few_estimate_passes(monkeypatch):
+    passes = []
+    count = kai_tokens._count
+    monkeypatch.setattr(kai_tokens, "_count", lambda text: passes.append(len(text)) or count(text))
+    tokens = TokenBudgeter({"gpt": TokenProfile("gpt", 8192, 2048)}, min_output=512)
+    profile = tokens.profiles["gpt"]
+    prompt = "BEGIN " + "The router trims long prompts, keeping both ends. " * 4000 + "END"
+    fitted, max_tokens = tokens.fit("gpt", prompt)
+    assert len(passes) <= 3  # the full prompt once, then one or two checks of the trimmed text
+    target = 8192 - MESSAGE_OVERHEAD_TOKENS - 512
+    assert 0.95 * target <= profile.estimate(fitted) <= target
+    assert fitted.startswith("BEGIN") and fitted.endswith("END")
+    assert max_tokens >= 512
+
+def test_prompt_denser_at_the_ends_still_fits():
+    tokens = budgeter()
+    profile = tokens.profiles["tiny"]
+    prompt = "漢" * 1500 + " word" * 3000 + "🙂" * 1500
+    fitted, max_tokens = tokens.fit("tiny", prompt)
+    assert MESSAGE_OVERHEAD_TOKENS + profile.estimate(fitted) + max_tokens <= 1000
+    assert max_tokens >= 100